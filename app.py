@@ -10,6 +10,8 @@ import plotly.graph_objects as go
 from utils.document_processor import process_document
 from utils.gemini import initialize_gemini, analyze_risk_with_gemini
 from utils.db import initialize_chroma, store_in_chroma, query_chroma
+from utils.classifier import risk_type_display_classifier
+from utils.fast_analysis import BackgroundEnrichment, generate_proposed_solution
 import time
 import io
 from openpyxl import Workbook
@@ -22,6 +24,9 @@ sqlite_version = sqlite3.sqlite_version_info
 min_sqlite_version = (3, 35, 0)
 is_sqlite_compatible = sqlite_version >= min_sqlite_version
 
+# Seconds between refreshes of the dashboard while the AI analysis runs in fast mode
+ENRICHMENT_POLL_SECONDS = 2
+
 # Load environment variables
 load_dotenv()
 
@@ -118,6 +123,8 @@ def main():
         with col1:
             st.info(f"Uploaded: {uploaded_file.name}")
             analyze_button = st.button("Analyze Document", type="primary")
+            fast_mode = st.toggle("Fast mode", value=True,
+                                  help="Show a rule-based analysis immediately and replace it with the AI analysis as it arrives")
         
         with col2:
             st.info("This tool will analyze your Risk Control Matrix and identify key risks across departments.")
@@ -141,6 +148,7 @@ def main():
                 processed_data = process_document(temp_file_path)
                 
                 # Try to store in ChromaDB, but continue if it fails
+                db = None
                 try:
                     if is_sqlite_compatible:
                         db = initialize_chroma("risk_control_matrix")
@@ -152,11 +160,32 @@ def main():
                     # Log the error but don't display to user unless debugging
                     print(f"ChromaDB storage failed: {str(chroma_error)}")
                 
-                # Analyze with Gemini
-                st.session_state.analyzed_data = analyze_risk_with_gemini(
-                    gemini_model,
-                    processed_data
-                )
+                if fast_mode:
+                    # Render the rule-based analysis now and let the AI analysis replace it in the background
+                    st.session_state.enrichment = BackgroundEnrichment(gemini_model, processed_data, collection=db).start()
+                    st.session_state.analyzed_data = st.session_state.enrichment.fast
+                else:
+                    # Show each department as soon as its analysis arrives
+                    progress_area = st.container()
+                
+                    def show_department(dept, dept_risk):
+                        dept_risk = dept_risk if isinstance(dept_risk, dict) else {}
+                        risk_level = dept_risk.get("overall_risk_level", "Medium")
+                        risk_class = "high-risk" if risk_level == "High" else "medium-risk" if risk_level == "Medium" else "low-risk"
+                        with progress_area:
+                            st.markdown(f"<div class='dept-card {risk_class}'>", unsafe_allow_html=True)
+                            st.markdown(f"**✅ {dept}** - {risk_level} Risk")
+                            if dept_risk.get("summary"):
+                                st.markdown(dept_risk["summary"])
+                            st.markdown("</div>", unsafe_allow_html=True)
+                
+                    # Analyze with Gemini
+                    st.session_state.analyzed_data = analyze_risk_with_gemini(
+                        gemini_model,
+                        processed_data,
+                        collection=db,
+                        on_department=show_department
+                    )
                 
                 # Try to remove temp file, but don't fail if it can't be removed
                 try:
@@ -165,8 +194,9 @@ def main():
                     # Log the error but continue execution
                     print(f"Could not remove temporary file - it will be cleaned up later.")
                 
-                st.success("Analysis complete!")
-                time.sleep(1)
+                if not fast_mode:
+                    st.success("Analysis complete!")
+                    time.sleep(1)
                 st.rerun()
                 
             except Exception as e:
@@ -179,9 +209,26 @@ def main():
                     # Log the error but continue execution
                     pass
     
+    # Pick up the sections the background AI analysis has delivered so far
+    enrichment = st.session_state.get("enrichment")
+    if enrichment is not None:
+        st.session_state.analyzed_data = enrichment.snapshot()
+        if enrichment.done:
+            del st.session_state["enrichment"]
+            if enrichment.error:
+                st.warning(f"AI analysis failed, showing the rule-based analysis: {enrichment.error}")
+        else:
+            analyzed, total = enrichment.progress()
+            st.info(f"🔍 Showing a rule-based analysis while the AI analysis runs ({analyzed} of {total} departments analyzed by AI)")
+    
     # Display analyzed data if available
     if st.session_state.analyzed_data:
         display_simplified_analysis(st.session_state.analyzed_data)
+    
+    # Refresh until the AI analysis has replaced the rule-based one
+    if enrichment is not None and not enrichment.done:
+        time.sleep(ENRICHMENT_POLL_SECONDS)
+        st.rerun()
 
 def create_downloadable_excel(data):
     """
@@ -467,25 +514,6 @@ def create_downloadable_excel(data):
     
     return excel_bytes
 
-def generate_proposed_solution(obj):
-    """Generate a proposed solution for an objective if one doesn't exist"""
-    proposed_solution = obj.get("proposed_control", "")
-    
-    # Generate a fallback proposed solution if none exists
-    if not proposed_solution:
-        # Generate detailed proposed solution based on the risk
-        what_can_go_wrong = obj.get("what_can_go_wrong", "").lower()
-        if "unauthorized access" in what_can_go_wrong:
-            proposed_solution = "Implement a comprehensive Identity and Access Management (IAM) solution with regular certification reviews. Establish segregation of duties matrix and enforce through automated controls. Implement privileged access management with just-in-time access."
-        elif "database" in what_can_go_wrong:
-            proposed_solution = "Implement database activity monitoring tools to track all changes. Establish formal change management procedures for schema and data modifications. Implement data loss prevention controls with automated alerting."
-        elif "accounting" in what_can_go_wrong or "financial" in what_can_go_wrong:
-            proposed_solution = "Implement automated validation rules for accounting entries with threshold-based approval workflows. Establish regular account reconciliation practices with management sign-off. Implement continuous monitoring dashboards for financial data integrity."
-        else:
-            proposed_solution = "Implement comprehensive documentation of control procedures with clear ownership. Establish regular control testing schedule with measurable effectiveness criteria. Enhance monitoring through automated dashboard reporting of control metrics."
-    
-    return proposed_solution
-
 def display_simplified_analysis(data):
     """Display a simplified analysis focusing on departmental risks and gaps"""
     
@@ -608,35 +636,17 @@ def display_simplified_analysis(data):
                             st.markdown("---")
             else:
                 # Analyze content to detect risk types - fallback to keyword analysis
-                risk_findings = {}
-                for risk_type in risk_types:
-                    risk_findings[risk_type] = []
-                    
-                    # Keywords for each risk type
-                    keywords = {
-                        "Operational": ["process", "workflow", "efficiency", "performance", "delivery", "resource", "procedure"],
-                        "Financial": ["financial", "budget", "cost", "expense", "revenue", "payment", "accounting"],
-                        "Fraud": ["fraud", "misappropriation", "theft", "falsification", "bribery", "corruption"],
-                        "Financial Fraud": ["financial fraud", "embezzlement", "accounting fraud", "false reporting", "misstatement"],
-                        "Operational Fraud": ["operational fraud", "process manipulation", "override", "unauthorized"]
-                    }
-                    
-                    # Check each objective for this risk type
-                    for obj in dept_objectives:
-                        objective = obj.get("objective", "").lower()
-                        risk = obj.get("what_can_go_wrong", "").lower()
-                        
-                        # Check if any keywords match
-                        matched = False
-                        for keyword in keywords.get(risk_type, []):
-                            if keyword in objective or keyword in risk:
-                                risk_findings[risk_type].append({
-                                    "objective": obj.get("objective", ""),
-                                    "risk": obj.get("what_can_go_wrong", ""),
-                                    "risk_level": obj.get("risk_level", "Medium")
-                                })
-                                matched = True
-                                break
+                risk_findings = {risk_type: [] for risk_type in risk_types}
+                
+                # Label each objective with all matching risk types in a single scan
+                for obj in dept_objectives:
+                    text = f"{obj.get('objective', '')}\n{obj.get('what_can_go_wrong', '')}"
+                    for risk_type in risk_type_display_classifier.classify(text):
+                        risk_findings[risk_type].append({
+                            "objective": obj.get("objective", ""),
+                            "risk": obj.get("what_can_go_wrong", ""),
+                            "risk_level": obj.get("risk_level", "Medium")
+                        })
                 
                 # Display risk findings
                 cols = st.columns(len(risk_types))
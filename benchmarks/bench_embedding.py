@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Embedding throughput benchmark for ChromaDB storage.
+
+Embeds synthetic control objective texts with embed_documents for several
+batch sizes and reports docs/sec, in this process and on a multi-process
+pool of --workers processes, then writes the float32 embeddings to a
+temporary collection to measure indexing end to end.
+
+Uses the sentence-transformers model of utils.db. Without sentence-transformers
+a hashing embedder of the same dimensions stands in; it only measures the
+batching and indexing overhead, so the worker comparison is skipped and no
+model throughput is reported.
+
+Usage:
+    python benchmarks/bench_embedding.py [--docs 100000] [--batch-sizes 64,256,1024] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import zlib
+import argparse
+import tempfile
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ingestion import make_rcm_frame
+from utils import db
+
+class HashingEmbedding:
+    """Stand-in embedding function: hashed token counts projected to a dense vector"""
+
+    def __init__(self, dimensions: int = 384, buckets: int = 4096, seed: int = 7):
+        self.buckets = buckets
+        self.projection = np.random.default_rng(seed).standard_normal((buckets, dimensions)).astype(np.float32)
+
+    def __call__(self, input):
+        counts = np.zeros((len(input), self.buckets), dtype=np.float32)
+        for row, text in enumerate(input):
+            for token in text.lower().split():
+                counts[row, zlib.crc32(token.encode("utf-8")) % self.buckets] += 1
+        vectors = counts @ self.projection
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+def make_documents(count: int):
+    """Control objective texts shaped like those store_in_chroma writes"""
+    frame = make_rcm_frame(count)
+    return [
+        f"Department: {row['Department']}\nControl Objective: {row['Control Objective']}\n"
+        f"What Can Go Wrong: {row['What Can Go Wrong']}\nRisk Level: {row['Risk Level']}\n"
+        f"Control Activities: {row['Control Activity']}\n"
+        for row in frame.to_dict("records")
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document embedding for ChromaDB")
+    parser.add_argument("--docs", type=int, default=100000, help="Number of documents to embed")
+    parser.add_argument("--batch-sizes", default="64,256,1024", help="Comma-separated batch sizes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for the multi-process runs")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    embedding_function = db.get_embedding_function()
+    worker_counts = sorted({1, args.workers})
+    if embedding_function is None:
+        embedding_function = HashingEmbedding()
+        worker_counts = [1]
+        print("sentence-transformers is not installed: using the hashing stand-in, which measures "
+              "batching and indexing overhead only, not model throughput or a multi-process speedup")
+        model = "hashing stand-in"
+    else:
+        model = f"{db.EMBEDDING_MODEL} ({type(embedding_function._model).__name__})"
+
+    documents = make_documents(args.docs)
+    print(f"{len(documents):,} documents, model: {model}\n")
+
+    embeddings = None
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        for workers in worker_counts:
+            start = time.perf_counter()
+            embeddings = db.embed_documents(documents, embedding_function, batch_size=batch_size, workers=workers)
+            elapsed = time.perf_counter() - start
+            label = f"batch={batch_size} workers={workers}"
+            print(f"{label:<26} {elapsed:8.2f}s {len(documents) / elapsed:>10,.0f} docs/sec")
+
+    print(f"\n{embeddings.shape[1]} dimensions, {embeddings.dtype}, {embeddings.nbytes / 1024 / 1024:.1f} MiB")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collection = db.get_chroma_client(tmp_dir).get_or_create_collection(name="bench_embedding")
+        ids = [str(i) for i in range(len(documents))]
+        start = time.perf_counter()
+        for offset in range(0, len(ids), db.CHROMA_ADD_BATCH_SIZE):
+            end = offset + db.CHROMA_ADD_BATCH_SIZE
+            collection.add(ids=ids[offset:end], documents=documents[offset:end],
+                           embeddings=db._collection_embeddings(embeddings[offset:end]))
+        elapsed = time.perf_counter() - start
+        print(f"{'collection.add':<26} {elapsed:8.2f}s {len(documents) / elapsed:>10,.0f} docs/sec")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
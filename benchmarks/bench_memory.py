@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for a session's processed and analyzed data.
+
+Writes a synthetic RCM as an Excel workbook and as a CSV file, then measures
+the memory retained by what a Streamlit session holds after uploading each:
+the processed_data returned by process_document (including the raw_data rows
+of a workbook) and the analyzed_data of rule_based_analysis. Each session is
+measured twice, once with the slotted ControlObjective and ControlGap records
+process_document returns and once with the same objectives and gaps
+converted to plain dicts.
+
+Usage:
+    python benchmarks/bench_memory.py [--rows 100000]
+"""
+
+import os
+import sys
+import gc
+import argparse
+import tempfile
+import tracemalloc
+import logging
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ingestion import make_rcm_frame
+from utils.document_processor import process_document
+from utils.fast_analysis import rule_based_analysis
+
+def write_rcm(path: str, rows: int):
+    """Write a synthetic RCM to an .xlsx or .csv file"""
+    frame = make_rcm_frame(rows)
+    if path.endswith(".csv"):
+        frame.to_csv(path, index=False)
+        return
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("RCM")
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False):
+        sheet.append([value if isinstance(value, str) else None for value in row])
+    workbook.save(path)
+
+def build_session(path: str, as_dicts: bool) -> dict:
+    """Process and analyze a document, returning what a session keeps of it"""
+    processed_data = process_document(path, use_cache=False)
+    if as_dicts:
+        processed_data["control_objectives"] = [obj.to_dict() for obj in processed_data["control_objectives"]]
+        processed_data["gaps"] = [gap.to_dict() for gap in processed_data["gaps"]]
+    return {"processed_data": processed_data, "analyzed_data": rule_based_analysis(processed_data)}
+
+def measure(build):
+    """Return the memory (bytes) retained by the object build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory held by a session's analysis")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of synthetic RCM rows")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_name in ("rcm.xlsx", "rcm.csv"):
+            path = os.path.join(tmp_dir, file_name)
+            write_rcm(path, args.rows)
+
+            dict_bytes, session = measure(lambda: build_session(path, as_dicts=True))
+            processed_data = session["processed_data"]
+            raw_rows = sum(len(sheet.get("rows", [])) for sheet in processed_data.get("raw_data", []))
+            print(f"{file_name}: {len(processed_data['control_objectives']):,} control objectives, "
+                  f"{len(processed_data['gaps']):,} gaps, {raw_rows:,} raw rows")
+            del session, processed_data
+            record_bytes, _ = measure(lambda: build_session(path, as_dicts=False))
+
+            print(f"{'  plain dicts':<20} {dict_bytes / 1024 / 1024:8.1f} MiB")
+            print(f"{'  slotted records':<20} {record_bytes / 1024 / 1024:8.1f} MiB")
+            print(f"{'  reduction':<20} {100 * (1 - record_bytes / dict_bytes):8.1f} %\n")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Department prompt packing benchmark for the Risk Control Matrix Analyzer.
+
+Analyzes a synthetic RCM with many small departments against the mock LLM
+backend, once with one analysis and one recommendations call per department
+and once with small departments packed into shared prompts. Reports LLM
+calls, prompt tokens and wall time of both.
+
+Usage:
+    python benchmarks/bench_packing.py [--departments 40] [--objectives 3] [--latency 0.5]
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+import tempfile
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ingestion import make_rcm_frame
+from utils.document_processor import process_document
+from utils import gemini, checkpoint, revisions
+from utils.llm_backends import MockBackend
+
+def run(data, latency: float, concurrency: int, pack: int, tmp_dir: str):
+    """Analyze a copy of the data with the given packing limit and print calls, tokens and wall time"""
+    gemini.DEPARTMENT_PACK_MAX_DEPARTMENTS = pack
+    # Start every run without stored department analyses
+    revisions.REVISION_DIR = tempfile.mkdtemp(dir=tmp_dir)
+    backend = MockBackend(latency=latency)
+
+    start = time.perf_counter()
+    analyzed = gemini.analyze_risk_with_gemini(backend, copy.deepcopy(data), concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+
+    prompt_tokens = sum(dept.get("token_usage", {}).get("prompt_tokens", 0) for dept in analyzed["department_risks"].values())
+    label = "one per department" if pack == 1 else f"packed (max {pack})"
+    print(f"{label:<22} {elapsed:8.2f}s {backend.calls:6d} calls {prompt_tokens:>10,} analysis prompt tokens"
+          f"  ({len(analyzed['recommendations'])} recommendations)")
+    return elapsed, backend.calls
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-department prompt packing offline")
+    parser.add_argument("--departments", type=int, default=40, help="Number of departments in the synthetic RCM")
+    parser.add_argument("--objectives", type=int, default=3, help="Control objectives per department")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=gemini.ANALYSIS_CONCURRENCY, help="Concurrent LLM requests")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Measure the requests, not the response cache or checkpoints
+        gemini.response_cache.enabled = False
+        gemini.telemetry.enabled = False
+        checkpoint.CHECKPOINT_DIR = os.path.join(tmp_dir, "checkpoints")
+
+        rows = args.departments * args.objectives
+        frame = make_rcm_frame(rows)
+        frame["Department"] = [f"Business Unit {i // args.objectives:03d}" for i in range(rows)]
+        path = os.path.join(tmp_dir, "synthetic_rcm.csv")
+        frame.to_csv(path, index=False)
+        data = process_document(path, use_cache=False)
+
+        print(f"{len(data['departments'])} departments, {len(data['control_objectives']):,} control objectives, "
+              f"{args.latency:.2f}s mock latency, concurrency {args.concurrency}\n")
+
+        pack = gemini.DEPARTMENT_PACK_MAX_DEPARTMENTS
+        single_time, single_calls = run(data, args.latency, args.concurrency, 1, tmp_dir)
+        packed_time, packed_calls = run(data, args.latency, args.concurrency, pack, tmp_dir)
+        print(f"{'reduction':<22} {single_time / packed_time:8.2f}x {single_calls / packed_calls:6.1f}x fewer calls")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
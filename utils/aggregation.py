@@ -0,0 +1,143 @@
+import pandas as pd
+from typing import Dict, List, Any, Iterable, Optional
+from utils.classifier import risk_category_classifier
+
+# Categories of the department risk matrix
+RISK_CATEGORIES = ["Financial", "Operational", "Compliance", "Strategic", "Technological"]
+
+def normalize_risk_level(level: str) -> Optional[str]:
+    """
+    Normalize a free-text risk level to High/Medium/Low
+
+    Args:
+        level: Risk level as written in the source document
+
+    Returns:
+        "High", "Medium" or "Low", or None if the level is empty
+    """
+    level = (level or "").strip()
+    if not level:
+        return None
+
+    if level.lower() in ['high', 'h', 'critical', 'severe']:
+        return 'High'
+    elif level.lower() in ['medium', 'm', 'mod', 'moderate']:
+        return 'Medium'
+    elif level.lower() in ['low', 'l', 'minor']:
+        return 'Low'
+    return 'Medium'  # Default
+
+def risk_level_value(level: str) -> int:
+    """Map a risk level to its value in the department risk matrix"""
+    risk_text = (level or "").lower()
+    if risk_text in ['high', 'h', 'critical', 'severe']:
+        return 4
+    elif risk_text in ['medium', 'm', 'mod', 'moderate']:
+        return 3
+    return 2
+
+def department_risk_level(risk_categories: Dict[str, int]) -> str:
+    """
+    Overall risk level of a department from its row of the risk matrix
+
+    Args:
+        risk_categories: Category -> risk value
+
+    Returns:
+        "High", "Medium" or "Low" by the average category value
+    """
+    category_values = list(risk_categories.values())
+    avg_risk = sum(category_values) / len(category_values) if category_values else 0
+
+    if avg_risk >= 3.5:
+        return "High"
+    elif avg_risk >= 2.5:
+        return "Medium"
+    return "Low"
+
+class RiskAggregator:
+    """
+    Online accumulator for risk statistics over a stream of control objectives
+
+    Control objectives can be added in batches as they are extracted; the risk
+    distribution, department list and department risk matrix are updated
+    incrementally so the objectives themselves do not need to be kept.
+    """
+
+    def __init__(self, departments: List[str] = None):
+        """
+        Args:
+            departments: Fixed list of departments for the risk matrix. When omitted,
+                departments are collected from the objectives in order of appearance.
+        """
+        self.track_departments = departments is None
+        self.departments = []
+        self.total_controls = 0
+        self.risk_distribution = {"High": 0, "Medium": 0, "Low": 0}
+        self._department_risks = {}
+
+        for dept in departments or []:
+            self.add_department(dept)
+
+    def add_department(self, dept: str):
+        """Register a department in the risk matrix"""
+        if dept and dept not in self._department_risks:
+            self.departments.append(dept)
+            self._department_risks[dept] = {cat: 0 for cat in RISK_CATEGORIES}
+
+    def add(self, objectives: Iterable[Dict[str, Any]], track_departments: bool = None):
+        """
+        Fold a batch of control objectives into the running statistics
+
+        Args:
+            objectives: Control objectives to add
+            track_departments: Override whether unseen departments are registered
+        """
+        objectives = list(objectives)
+        if not objectives:
+            return
+
+        if track_departments is None:
+            track_departments = self.track_departments
+
+        self.total_controls += len(objectives)
+
+        # Generate risk distribution
+        for obj in objectives:
+            std_level = normalize_risk_level(obj.get("risk_level", ""))
+            if std_level:
+                self.risk_distribution[std_level] += 1
+
+        if track_departments:
+            for obj in objectives:
+                self.add_department(obj.get("department", ""))
+
+        # Populate the risk matrix for the whole batch at once
+        batch = pd.DataFrame({
+            "department": [obj.get("department", "") for obj in objectives],
+            "value": [risk_level_value(obj.get("risk_level", "")) for obj in objectives]
+        })
+        batch = batch[batch["department"].isin(list(self._department_risks))]
+        if batch.empty:
+            return
+
+        texts = [f"{objectives[i].get('objective', '')} {objectives[i].get('what_can_go_wrong', '')}" for i in batch.index]
+        flags = risk_category_classifier.classify_series(pd.Series(texts, index=batch.index, dtype=object))
+
+        for cat in RISK_CATEGORIES:
+            values = batch["value"].where(flags[cat], 0)
+            for dept, value in values.groupby(batch["department"]).max().items():
+                self._department_risks[dept][cat] = max(self._department_risks[dept][cat], int(value))
+
+    def department_risks(self) -> Dict[str, Dict[str, int]]:
+        """
+        Current department risk matrix
+
+        Returns:
+            Department -> category -> risk value, with a minimum value of 1
+        """
+        # Ensure all departments have at least some risk level for each category
+        return {
+            dept: {cat: value or 1 for cat, value in categories.items()}
+            for dept, categories in self._department_risks.items()
+        }
@@ -0,0 +1,181 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location of analysis checkpoints
+CHECKPOINT_DIR = os.path.join(os.getcwd(), "analysis_checkpoints")
+
+# Kinds of checkpoint log records
+RECORD_RESULT = "result"
+RECORD_FAILED = "failed"
+
+class AnalysisCheckpoint:
+    """
+    Completed units of one analysis run, persisted as they finish
+
+    A run is identified by the analyzed document's content hash and the model,
+    so re-analyzing the same file after a failure reuses every unit (department
+    analysis, recommendations, prompt partition) that already succeeded and
+    only re-runs the failed ones. Units that fell back to placeholder results
+    are recorded with mark_failed() and never saved; the next run sees them
+    through failed_before() and requests them without the response cache.
+
+    Each unit is appended to the checkpoint file as its own pickled record
+    when it finishes, so saving costs the same however many units precede
+    it. Loading replays the records, the latest record of a unit winning,
+    and rewrites the file with one record per unit when it holds repeats.
+    """
+
+    def __init__(self, run_key: str, directory: str = None):
+        """
+        Args:
+            run_key: Identifier of the analysis run
+            directory: Directory holding the checkpoint files (defaults to CHECKPOINT_DIR)
+        """
+        self.run_key = run_key
+        self.path = os.path.join(directory or CHECKPOINT_DIR, f"{run_key}.log")
+        self.failed_units = []
+        self.failed_departments = set()
+        self._lock = threading.Lock()
+        self._results, self._failed_before = self._load()
+
+    @classmethod
+    def for_data(cls, data: Dict[str, Any], model, directory: str = None) -> Optional["AnalysisCheckpoint"]:
+        """
+        Open the checkpoint of a document's analysis
+
+        Args:
+            data: Structured data from process_document
+            model: Model used for the analysis
+            directory: Directory holding the checkpoint files (defaults to CHECKPOINT_DIR)
+
+        Returns:
+            The checkpoint, or None if the data carries no file hash to identify it
+        """
+        file_hash = data.get("metadata", {}).get("file_hash")
+        if not file_hash:
+            return None
+        model_name = getattr(model, "model_name", type(model).__name__)
+        run_key = hashlib.sha256(f"{model_name}:{file_hash}".encode("utf-8")).hexdigest()
+        return cls(run_key, directory)
+
+    @staticmethod
+    def unit_key(kind: str, content: str) -> str:
+        """Build the key of a unit of work from its kind and identifying content"""
+        return f"{kind}:{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+    def _load(self) -> tuple:
+        """Replay the checkpoint log, compacting it if units were recorded more than once or it ends in a partial record"""
+        results, failed = {}, set()
+        records = 0
+        truncated = False
+        try:
+            with open(self.path, "rb") as f:
+                while True:
+                    try:
+                        kind, unit, result = pickle.load(f)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # A record cut short by a crash while it was appended
+                        logger.warning("Ignoring truncated record at the end of the analysis checkpoint")
+                        truncated = True
+                        break
+                    records += 1
+                    if kind == RECORD_RESULT:
+                        results[unit] = result
+                        failed.discard(unit)
+                    else:
+                        failed.add(unit)
+        except FileNotFoundError:
+            return results, failed
+        except Exception as e:
+            logger.warning(f"Discarding unreadable analysis checkpoint: {str(e)}")
+            return {}, set()
+
+        if truncated or records > len(results) + len(failed):
+            self._compact(results, failed)
+        logger.info(f"Resuming analysis with {len(results)} checkpointed units and {len(failed)} failed units to retry")
+        return results, failed
+
+    def _compact(self, results: Dict[str, Any], failed: set):
+        """Rewrite the log with one record per unit"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                for unit, result in results.items():
+                    pickle.dump((RECORD_RESULT, unit, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+                for unit in failed:
+                    pickle.dump((RECORD_FAILED, unit, None), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not compact analysis checkpoint: {str(e)}")
+
+    def _append(self, kind: str, unit: str, result: Any = None):
+        """Append one record to the log; the caller holds the lock"""
+        record = pickle.dumps((kind, unit, result), protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(record)
+        except Exception as e:
+            logger.warning(f"Could not write analysis checkpoint: {str(e)}")
+
+    def get(self, unit: str) -> Optional[Any]:
+        """Return the saved result of a unit, or None if it has not completed"""
+        with self._lock:
+            return self._results.get(unit)
+
+    def save(self, unit: str, result: Any):
+        """
+        Record a completed unit and persist the checkpoint
+
+        Args:
+            unit: Unit key
+            result: Result of the unit
+        """
+        with self._lock:
+            self._results[unit] = result
+            self._append(RECORD_RESULT, unit, result)
+
+    def mark_failed(self, unit: str = None, department: str = None):
+        """
+        Record a unit that failed and used a fallback result
+
+        Args:
+            unit: Unit key (optional)
+            department: Department whose analysis is affected (optional)
+        """
+        with self._lock:
+            if unit is not None:
+                self.failed_units.append(unit)
+                self._append(RECORD_FAILED, unit)
+            if department is not None:
+                self.failed_departments.add(department)
+
+    def failed_before(self, unit: str) -> bool:
+        """
+        Whether a unit failed in an earlier run of this analysis
+
+        Such units are sent again without the response cache, so a bad
+        response is not reused.
+        """
+        with self._lock:
+            return unit in self._failed_before
+
+    def clear(self):
+        """Delete the checkpoint once the run has completed"""
+        with self._lock:
+            self._results = {}
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
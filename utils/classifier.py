@@ -0,0 +1,169 @@
+import re
+import pandas as pd
+from typing import Dict, List, Any, Iterable
+
+# Keywords in a risk description that indicate a control gap
+GAP_KEYWORDS = ['inadequate', 'missing', 'lack', 'absence', 'not adequate', 'incorrect',
+                'error', 'without', 'unauthorized', 'risk', 'fail', 'fraud', 'inappropriate']
+
+# Keywords in a risk description used to infer the risk level
+HIGH_RISK_KEYWORDS = ['critical', 'high', 'severe', 'significant', 'major', 'fraud', 'unauthorized', 'incorrect']
+LOW_RISK_KEYWORDS = ['minor', 'low', 'minimal', 'small', 'unlikely']
+
+# Keywords for each risk type
+RISK_TYPE_KEYWORDS = {
+    "Operational": ["process", "workflow", "efficiency", "performance", "delivery", "resource", "procedure", "operational", "operation"],
+    "Financial": ["financial", "budget", "cost", "expense", "revenue", "payment", "accounting", "payroll", "salary"],
+    "Fraud": ["fraud", "misappropriation", "theft", "falsification", "bribery", "corruption", "unauthorized"],
+    "Financial Fraud": ["financial fraud", "embezzlement", "accounting fraud", "false reporting", "misstatement", "incorrect amount"],
+    "Operational Fraud": ["operational fraud", "process manipulation", "override", "unauthorized", "fictitious", "absence of control"]
+}
+
+# Keywords used by the dashboard when no LLM risk type analysis is available
+RISK_TYPE_DISPLAY_KEYWORDS = {
+    "Operational": ["process", "workflow", "efficiency", "performance", "delivery", "resource", "procedure"],
+    "Financial": ["financial", "budget", "cost", "expense", "revenue", "payment", "accounting"],
+    "Fraud": ["fraud", "misappropriation", "theft", "falsification", "bribery", "corruption"],
+    "Financial Fraud": ["financial fraud", "embezzlement", "accounting fraud", "false reporting", "misstatement"],
+    "Operational Fraud": ["operational fraud", "process manipulation", "override", "unauthorized"]
+}
+
+# Keywords (stems) for each category of the department risk matrix
+RISK_CATEGORY_KEYWORDS = {
+    "Financial": ['financ', 'account', 'budget', 'cost', 'expense', 'revenue', 'payment', 'tax', 'audit'],
+    "Operational": ['operat', 'process', 'procedur', 'workflow', 'efficien', 'product', 'service', 'delivery'],
+    "Compliance": ['comply', 'compliance', 'regulat', 'legal', 'law', 'policy', 'requirement', 'standard'],
+    "Strategic": ['strateg', 'goal', 'objective', 'mission', 'vision', 'plan', 'market', 'competi'],
+    "Technological": ['tech', 'system', 'data', 'secur', 'access', 'software', 'hardware', 'it ', 'cyber']
+}
+
+class KeywordClassifier:
+    """
+    Multi-label keyword matcher compiled once into a single regular expression
+
+    A text gets a label when any of that label's keywords occurs in it as a
+    substring (case-insensitive), exactly like `any(keyword in text ...)`, but
+    every label is decided in one scan of the text.
+    """
+
+    def __init__(self, keyword_sets: Dict[str, List[str]]):
+        """
+        Compile the keyword sets
+
+        Args:
+            keyword_sets: Mapping of label to the keywords that indicate it
+        """
+        self.labels = list(keyword_sets)
+
+        keyword_to_labels = {}
+        for label, keywords in keyword_sets.items():
+            for keyword in keywords:
+                keyword_to_labels.setdefault(keyword.lower(), set()).add(label)
+
+        # The pattern reports the longest keyword starting at each position, so a
+        # match also implies every keyword contained in it
+        self._keyword_labels = {
+            keyword: frozenset(label for other, labels in keyword_to_labels.items() if other in keyword for label in labels)
+            for keyword in keyword_to_labels
+        }
+        self._pattern = re.compile(f"(?=({_trie_pattern(keyword_to_labels)}))")
+
+        # Keyword x label lookup table for the vectorized mode
+        self._keyword_matrix = pd.DataFrame(
+            [[label in labels for label in self.labels] for labels in self._keyword_labels.values()],
+            index=list(self._keyword_labels),
+            columns=self.labels,
+            dtype=bool
+        )
+
+    def classify(self, text: Any) -> List[str]:
+        """
+        Label a single text
+
+        Args:
+            text: Text to classify
+
+        Returns:
+            Matching labels, in the order the keyword sets were declared
+        """
+        if not text:
+            return []
+
+        found = set()
+        for match in self._pattern.finditer(str(text).lower()):
+            found |= self._keyword_labels[match.group(1)]
+            if len(found) == len(self.labels):
+                break
+
+        return [label for label in self.labels if label in found]
+
+    def matches(self, text: Any, label: str) -> bool:
+        """Check whether a text carries the given label"""
+        return label in self.classify(text)
+
+    def classify_series(self, texts: Iterable[Any]) -> pd.DataFrame:
+        """
+        Label a whole column of texts at once
+
+        Args:
+            texts: pandas Series (or any iterable) of texts
+
+        Returns:
+            DataFrame with one boolean column per label, aligned with the input
+        """
+        series = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+        keyword_hits = series.fillna("").astype(str).str.lower().str.findall(self._pattern).explode().dropna()
+
+        # Look up the labels of every matched keyword, then fold them back per text
+        label_hits = self._keyword_matrix.reindex(keyword_hits.values).set_axis(keyword_hits.index)
+        return label_hits.groupby(level=0).any().reindex(series.index, fill_value=False)
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """Build a regex alternation of keywords that shares common prefixes"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Optional (greedy) continuation keeps the longest keyword at each position
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+# Shared classifiers, compiled once per process
+risk_text_classifier = KeywordClassifier({
+    "gap": GAP_KEYWORDS,
+    "High": HIGH_RISK_KEYWORDS,
+    "Low": LOW_RISK_KEYWORDS
+})
+risk_type_classifier = KeywordClassifier(RISK_TYPE_KEYWORDS)
+risk_type_display_classifier = KeywordClassifier(RISK_TYPE_DISPLAY_KEYWORDS)
+risk_category_classifier = KeywordClassifier(RISK_CATEGORY_KEYWORDS)
+
+def assess_risk_text(risk_text: str) -> tuple:
+    """
+    Detect a control gap and infer the risk level from a risk description
+
+    Args:
+        risk_text: Risk / "what can go wrong" description
+
+    Returns:
+        Tuple of (is_gap, risk_level)
+    """
+    labels = risk_text_classifier.classify(risk_text)
+
+    if "High" in labels:
+        risk_level = "High"
+    elif "Low" in labels:
+        risk_level = "Low"
+    else:
+        risk_level = "Medium"  # Default
+
+    return "gap" in labels, risk_level
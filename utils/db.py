@@ -1,7 +1,11 @@
 import chromadb
 import os
-import uuid
 import json
+import hashlib
+import time
+import threading
+import atexit
+import numpy as np
 from typing import Dict, List, Any, Union
 import logging
 import sys
@@ -9,46 +13,130 @@ import sys
 import sqlite3
 import importlib.util
 import platform
+from utils.document_processor import page_at_offset
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def initialize_chroma(collection_name: str):
+# Default location of the persistent ChromaDB storage
+CHROMA_DIR = os.path.join(os.getcwd(), "chroma_db")
+
+# Sentence-transformers model used to embed stored documents
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Minimum SQLite version for persistent ChromaDB storage
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+# Texts embedded per call to the embedding model
+EMBEDDING_BATCH_SIZE = 256
+
+# Processes embedding in parallel. One process already uses every core through
+# torch's threads; more workers start a sentence-transformers multi-process
+# pool, each process holding its own copy of the model
+EMBEDDING_WORKERS = 1
+
+# Documents written per collection call, below Chroma's maximum batch size
+CHROMA_ADD_BATCH_SIZE = 5000
+
+# Process-wide clients and embedding functions, shared by every analysis and Streamlit session
+_clients = {}
+_embedding_functions = {}
+_embedding_pools = {}
+_registry_lock = threading.Lock()
+
+# Seconds taken to create each registered client and embedding function
+init_timings = {}
+
+def get_chroma_client(persist_directory: str = None):
     """
-    Initialize a ChromaDB collection
+    Return the process-wide ChromaDB client, creating it on first use
     
     Args:
-        collection_name: Name of the collection to create/load
+        persist_directory: Directory of the persistent storage (defaults to CHROMA_DIR)
         
     Returns:
-        ChromaDB collection instance
+        ChromaDB client; in-memory if SQLite is too old for persistent storage
     """
-    try:
-        # Create a persistent client
-        persist_directory = os.path.join(os.getcwd(), "chroma_db")
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        # Check SQLite version and use in-memory if needed
-        sqlite_version = sqlite3.sqlite_version_info
-        min_version_required = (3, 35, 0)
+    persist_directory = persist_directory or CHROMA_DIR
+    sqlite_version = sqlite3.sqlite_version_info
+    key = persist_directory if sqlite_version >= MIN_SQLITE_VERSION else ":memory:"
+    
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
         
-        if sqlite_version < min_version_required:
-            logger.warning(f"SQLite version {sqlite_version} is below required version {min_version_required}. Using in-memory database instead.")
+        start = time.perf_counter()
+        if key == ":memory:":
+            logger.warning(f"SQLite version {sqlite_version} is below required version {MIN_SQLITE_VERSION}. Using in-memory database instead.")
             # Use in-memory database as fallback
             client = chromadb.Client()
             logger.info("Using in-memory ChromaDB client due to SQLite version constraints")
         else:
             # Use persistent storage if SQLite version is sufficient
+            os.makedirs(persist_directory, exist_ok=True)
             client = chromadb.PersistentClient(path=persist_directory)
             logger.info(f"Using persistent ChromaDB client at {persist_directory}")
         
+        init_timings[f"client:{key}"] = time.perf_counter() - start
+        logger.info(f"Initialized ChromaDB client in {init_timings[f'client:{key}']:.2f}s")
+        _clients[key] = client
+        return client
+
+def get_embedding_function(model_name: str = None):
+    """
+    Return the process-wide sentence-transformers embedding function, loading the model on first use
+    
+    Args:
+        model_name: Sentence-transformers model (defaults to EMBEDDING_MODEL)
+        
+    Returns:
+        Embedding function, or None if sentence-transformers is not installed or the model fails to load
+    """
+    model_name = model_name or EMBEDDING_MODEL
+    
+    with _registry_lock:
+        if model_name in _embedding_functions:
+            return _embedding_functions[model_name]
+        
+        embedding_function = None
+        start = time.perf_counter()
+        if importlib.util.find_spec("sentence_transformers"):
+            try:
+                from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+                embedding_function = SentenceTransformerEmbeddingFunction(model_name=model_name)
+                init_timings[f"embedding:{model_name}"] = time.perf_counter() - start
+                logger.info(f"Loaded embedding model {model_name} in {init_timings[f'embedding:{model_name}']:.2f}s")
+            except Exception as e:
+                logger.warning(f"Failed to load embedding model {model_name}: {str(e)}")
+        
+        # Remember a missing model too, so it is not retried on every upload
+        _embedding_functions[model_name] = embedding_function
+        return embedding_function
+
+def initialize_chroma(collection_name: str):
+    """
+    Initialize a ChromaDB collection
+    
+    The client and embedding model are created once per process (see
+    get_chroma_client and get_embedding_function), so only the first call
+    pays for opening the database and loading the model weights.
+    
+    Args:
+        collection_name: Name of the collection to create/load
+        
+    Returns:
+        ChromaDB collection instance
+    """
+    try:
+        client = get_chroma_client()
+        
         # Get or create collection
         try:
             # Try with sentence-transformers embedding function
-            if importlib.util.find_spec("sentence_transformers"):
-                from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-                embedding_function = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+            embedding_function = get_embedding_function()
+            if embedding_function is not None:
                 collection = client.get_or_create_collection(name=collection_name, embedding_function=embedding_function)
                 logger.info(f"Created/loaded collection {collection_name} with sentence-transformers")
             else:
@@ -66,6 +154,159 @@ def initialize_chroma(collection_name: str):
         logger.error(f"Failed to initialize ChromaDB: {str(e)}")
         raise e
 
+def get_embedding_pool(embedding_function, workers: int):
+    """
+    Return the process-wide sentence-transformers multi-process pool of an embedding function
+    
+    Args:
+        embedding_function: Embedding function from get_embedding_function
+        workers: Number of worker processes
+        
+    Returns:
+        Tuple of (SentenceTransformer model, pool), or None if the embedding
+        function is not backed by a sentence-transformers model
+    """
+    model = getattr(embedding_function, "_model", None)
+    if model is None or not hasattr(model, "start_multi_process_pool"):
+        return None
+    
+    key = (getattr(embedding_function, "model_name", type(model).__name__), workers)
+    with _registry_lock:
+        if key not in _embedding_pools:
+            start = time.perf_counter()
+            _embedding_pools[key] = (model, model.start_multi_process_pool(target_devices=["cpu"] * workers))
+            init_timings[f"embedding_pool:{key[0]}:{workers}"] = time.perf_counter() - start
+            logger.info(f"Started {workers} embedding processes in {time.perf_counter() - start:.2f}s")
+        return _embedding_pools[key]
+
+def _stop_embedding_pools():
+    with _registry_lock:
+        for model, pool in _embedding_pools.values():
+            model.stop_multi_process_pool(pool)
+        _embedding_pools.clear()
+
+atexit.register(_stop_embedding_pools)
+
+def embed_documents(documents: List[str], embedding_function=None, batch_size: int = None,
+                    workers: int = None) -> np.ndarray:
+    """
+    Embed texts in batches
+    
+    With one worker the texts are embedded in this process, batch by batch;
+    the model's own threads already use every core. With more workers they
+    are spread over a sentence-transformers multi-process pool (see
+    get_embedding_pool), which only pays off for large document sets.
+    
+    Args:
+        documents: Texts to embed
+        embedding_function: Chroma embedding function (defaults to get_embedding_function())
+        batch_size: Texts per call to the model (defaults to EMBEDDING_BATCH_SIZE)
+        workers: Embedding processes (defaults to EMBEDDING_WORKERS)
+        
+    Returns:
+        float32 array of shape (len(documents), dimensions), in document order
+    """
+    embedding_function = embedding_function or get_embedding_function()
+    if embedding_function is None:
+        raise ValueError("No embedding model available")
+    if not documents:
+        return np.zeros((0, 0), dtype=np.float32)
+    
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    workers = workers or EMBEDDING_WORKERS
+    
+    pool = get_embedding_pool(embedding_function, workers) if workers > 1 else None
+    if workers > 1 and pool is None:
+        logger.warning("Embedding function does not support multi-process encoding; embedding in this process")
+    
+    start = time.perf_counter()
+    if pool is not None:
+        model, pool = pool
+        embeddings = np.asarray(model.encode_multi_process(documents, pool, batch_size=batch_size), dtype=np.float32)
+        if getattr(embedding_function, "normalize_embeddings", False):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    else:
+        embeddings = np.concatenate([
+            np.asarray(embedding_function(documents[offset:offset + batch_size]), dtype=np.float32)
+            for offset in range(0, len(documents), batch_size)
+        ])
+    elapsed = time.perf_counter() - start
+    
+    logger.info(f"Embedded {len(documents)} documents in {elapsed:.2f}s ({len(documents) / max(elapsed, 1e-9):,.0f} docs/sec, "
+                f"batch size {batch_size}, {workers if pool is not None else 1} processes)")
+    return embeddings
+
+def _collection_embeddings(embeddings: np.ndarray):
+    """Embeddings in a form the installed Chroma accepts; releases before 0.5 only validate lists of Python floats"""
+    if tuple(int(part) for part in chromadb.__version__.split(".")[:2] if part.isdigit()) < (0, 5):
+        return embeddings.tolist()
+    return embeddings
+
+def document_id(file_hash: str, document_type: str, content: str) -> str:
+    """
+    Deterministic ID of a stored document
+    
+    Args:
+        file_hash: Content hash of the source file
+        document_type: Kind of document, e.g. "text_chunk", "control_objective" or "gap"
+        content: Document text
+        
+    Returns:
+        Hex SHA-256 digest of the three, so the same content of the same file always gets the same ID
+    """
+    return hashlib.sha256(f"{file_hash}\0{document_type}\0{content}".encode("utf-8")).hexdigest()
+
+def upsert_documents(collection, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+    """
+    Embed and upsert the documents a collection does not hold yet
+    
+    Documents whose ID is already in the collection, or repeated within the
+    call, are skipped before embedding, so re-ingesting unchanged content only
+    costs an ID lookup. The rest are embedded with embed_documents and
+    upserted in slices of CHROMA_ADD_BATCH_SIZE. Without a sentence-transformers
+    model, Chroma embeds them with the collection's own embedding function.
+    
+    Args:
+        collection: ChromaDB collection
+        ids: Document IDs (see document_id)
+        documents: Document texts
+        metadatas: Document metadata
+        
+    Returns:
+        Number of documents written
+    """
+    unique = {}
+    for index, doc_id in enumerate(ids):
+        unique.setdefault(doc_id, index)
+    
+    existing = set()
+    unique_ids = list(unique)
+    for start in range(0, len(unique_ids), CHROMA_ADD_BATCH_SIZE):
+        existing.update(collection.get(ids=unique_ids[start:start + CHROMA_ADD_BATCH_SIZE], include=[])["ids"])
+    
+    new = [index for doc_id, index in unique.items() if doc_id not in existing]
+    if len(new) < len(ids):
+        logger.info(f"Skipping {len(ids) - len(new)} documents already stored in ChromaDB or repeated")
+    if not new:
+        return 0
+    
+    ids = [ids[index] for index in new]
+    documents = [documents[index] for index in new]
+    metadatas = [metadatas[index] for index in new]
+    
+    embeddings = None
+    embedding_function = get_embedding_function()
+    if embedding_function is not None:
+        embeddings = embed_documents(documents, embedding_function)
+    
+    for start in range(0, len(ids), CHROMA_ADD_BATCH_SIZE):
+        end = start + CHROMA_ADD_BATCH_SIZE
+        batch = {"ids": ids[start:end], "documents": documents[start:end], "metadatas": metadatas[start:end]}
+        if embeddings is not None:
+            batch["embeddings"] = _collection_embeddings(embeddings[start:end])
+        collection.upsert(**batch)
+    return len(ids)
+
 def store_in_chroma(collection, data: Dict[str, Any]):
     """
     Store data in ChromaDB collection
@@ -75,38 +316,45 @@ def store_in_chroma(collection, data: Dict[str, Any]):
         data: Data to store
     """
     try:
+        # IDs derive from the source file's content, so storing the same file again adds nothing
+        file_hash = data["metadata"].get("file_hash") or data["metadata"].get("file_name", "")
+        
         # Process different types of data for storage
         if "raw_text" in data and data["raw_text"]:
             # For PDF or DOCX, store the extracted text in chunks
             if "extracted_text" in data:
                 text = data["extracted_text"]
                 # Split text into chunks of approximately 500 tokens
-                chunks = split_text_into_chunks(text, chunk_size=1000)
+                chunks = list(iter_text_chunks(text, chunk_size=1000))
+                page_offsets = data.get("page_offsets", [])
                 
                 # Store each chunk
                 ids = []
                 documents = []
                 metadatas = []
                 
-                for i, chunk in enumerate(chunks):
-                    chunk_id = str(uuid.uuid4())
+                for i, (start, chunk) in enumerate(chunks):
+                    chunk_id = document_id(file_hash, "text_chunk", chunk)
                     ids.append(chunk_id)
                     documents.append(chunk)
-                    metadatas.append({
+                    metadata = {
                         "chunk_index": i,
                         "source": data["metadata"]["file_name"],
                         "file_type": data["metadata"]["file_type"],
                         "total_chunks": len(chunks)
-                    })
+                    }
+                    # Lets retrieval restrict queries to this document
+                    if data["metadata"].get("file_hash"):
+                        metadata["file_hash"] = data["metadata"]["file_hash"]
+                    # Record the source page when the text came from a PDF
+                    if page_offsets:
+                        metadata["page"] = page_at_offset(page_offsets, start)
+                    metadatas.append(metadata)
                 
                 # Add documents to collection
                 try:
-                    collection.add(
-                        ids=ids,
-                        documents=documents,
-                        metadatas=metadatas
-                    )
-                    logger.info(f"Stored {len(chunks)} text chunks in ChromaDB")
+                    stored = upsert_documents(collection, ids, documents, metadatas)
+                    logger.info(f"Stored {stored} of {len(chunks)} text chunks in ChromaDB")
                 except Exception as add_error:
                     logger.warning(f"Error adding documents to ChromaDB: {str(add_error)}.")
                     logger.info("Proceeding with analysis without storing in ChromaDB")
@@ -119,9 +367,6 @@ def store_in_chroma(collection, data: Dict[str, Any]):
             
             # Store control objectives
             for i, objective in enumerate(data.get("control_objectives", [])):
-                obj_id = str(uuid.uuid4())
-                ids.append(obj_id)
-                
                 # Create a text representation of the objective
                 doc_text = f"Department: {objective.get('department', '')}\n"
                 doc_text += f"Control Objective: {objective.get('objective', '')}\n"
@@ -133,6 +378,7 @@ def store_in_chroma(collection, data: Dict[str, Any]):
                     doc_text += f"Gap Details: {objective.get('gap_details', '')}\n"
                     doc_text += f"Proposed Control: {objective.get('proposed_control', '')}\n"
                 
+                ids.append(document_id(file_hash, "control_objective", doc_text))
                 documents.append(doc_text)
                 
                 # Create metadata
@@ -147,9 +393,6 @@ def store_in_chroma(collection, data: Dict[str, Any]):
             
             # Store gaps
             for i, gap in enumerate(data.get("gaps", [])):
-                gap_id = str(uuid.uuid4())
-                ids.append(gap_id)
-                
                 # Create a text representation of the gap
                 doc_text = f"Department: {gap.get('department', '')}\n"
                 doc_text += f"Control Objective: {gap.get('control_objective', '')}\n"
@@ -158,6 +401,7 @@ def store_in_chroma(collection, data: Dict[str, Any]):
                 doc_text += f"Risk Impact: {gap.get('risk_impact', '')}\n"
                 doc_text += f"Proposed Solution: {gap.get('proposed_solution', '')}\n"
                 
+                ids.append(document_id(file_hash, "gap", doc_text))
                 documents.append(doc_text)
                 
                 # Create metadata
@@ -171,12 +415,8 @@ def store_in_chroma(collection, data: Dict[str, Any]):
             # Add documents to collection if any
             if ids:
                 try:
-                    collection.add(
-                        ids=ids,
-                        documents=documents,
-                        metadatas=metadatas
-                    )
-                    logger.info(f"Stored {len(ids)} documents in ChromaDB")
+                    stored = upsert_documents(collection, ids, documents, metadatas)
+                    logger.info(f"Stored {stored} of {len(ids)} documents in ChromaDB")
                 except Exception as add_error:
                     logger.warning(f"Error adding documents to ChromaDB: {str(add_error)}.")
                     logger.info("Proceeding with analysis without storing in ChromaDB") 
@@ -212,6 +452,36 @@ def query_chroma(collection, query: str, n_results: int = 5, filter_dict: Dict =
         logger.error(f"Error querying ChromaDB: {str(e)}")
         raise
 
+def retrieve_chunks(collection, queries: List[str], n_results: int = 5, filter_dict: Dict = None) -> List[str]:
+    """
+    Retrieve the stored text chunks most relevant to any of several queries
+    
+    Args:
+        collection: ChromaDB collection
+        queries: Query strings, e.g. control themes or department names
+        n_results: Number of chunks to retrieve per query
+        filter_dict: Filter for query, e.g. {"file_hash": ...} to stay within one document
+        
+    Returns:
+        Distinct chunks in their original document order
+    """
+    if not queries:
+        return []
+    
+    results = collection.query(
+        query_texts=queries,
+        n_results=n_results,
+        where=filter_dict
+    )
+    
+    chunks = {}
+    for ids, documents, metadatas in zip(results["ids"], results["documents"], results["metadatas"]):
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            if chunk_id not in chunks:
+                chunks[chunk_id] = ((metadata or {}).get("chunk_index", len(chunks)), document)
+    
+    return [document for _, document in sorted(chunks.values(), key=lambda chunk: chunk[0])]
+
 def split_text_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
     """
     Split text into overlapping chunks
@@ -224,10 +494,23 @@ def split_text_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 100
     Returns:
         List of text chunks
     """
+    return [chunk for start, chunk in iter_text_chunks(text, chunk_size, overlap)]
+
+def iter_text_chunks(text: str, chunk_size: int = 1000, overlap: int = 100):
+    """
+    Split text into overlapping chunks, keeping each chunk's position
+    
+    Args:
+        text: Text to split
+        chunk_size: Approximate size of each chunk
+        overlap: Number of characters to overlap between chunks
+        
+    Yields:
+        Tuples of (start offset in text, chunk)
+    """
     if not text:
-        return []
+        return
     
-    chunks = []
     start = 0
     text_length = len(text)
     
@@ -248,10 +531,7 @@ def split_text_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 100
                 end = last_period + 1  # Include the period
         
         # Extract the chunk
-        chunk = text[start:end]
-        chunks.append(chunk)
+        yield start, text[start:end]
         
         # Move to the next chunk with overlap
         start = end - overlap if end < text_length else text_length
-    
-    return chunks 
\ No newline at end of file
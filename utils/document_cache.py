@@ -0,0 +1,175 @@
+import os
+import zlib
+import pickle
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location and size limit of the parsed document cache
+CACHE_DIR = os.path.join(os.getcwd(), "parse_cache")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hash a file's content
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex SHA-256 digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DocumentCache:
+    """
+    Content-addressed on-disk cache of parsed documents
+
+    Entries are pickled, zlib-compressed and stored one file per key. When the
+    cache grows beyond max_bytes the least recently used entries are removed;
+    a hit refreshes the entry's modification time.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_bytes: Total size the cache is trimmed to after each write
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_hash: str, file_type: str, parser_version: str) -> str:
+        """Build the cache key for a file content hash, file type and parser version"""
+        return hashlib.sha256(f"{parser_version}:{file_type}:{file_hash}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl.z")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a parsed document
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached structured data, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            data = None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {str(e)}")
+            self._remove(path)
+            data = None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]):
+        """
+        Store a parsed document and evict old entries if the cache is too large
+
+        Args:
+            key: Cache key
+            data: Structured data to store
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            payload = zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+            # Write atomically so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Could not write parse cache entry: {str(e)}")
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every cache entry and reset the counters"""
+        for path, _, _ in self._entries():
+            self._remove(path)
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache statistics
+
+        Returns:
+            Hit and miss counts, hit rate, number of entries and total size in bytes
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries)
+        }
+
+    def _entries(self):
+        """List (path, size, mtime) of every cache entry"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl.z"):
+                try:
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Process-wide cache used by process_document
+document_cache = DocumentCache()
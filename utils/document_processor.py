@@ -1,22 +1,72 @@
 import pandas as pd
 import os
 import json
+import openpyxl
+import itertools
+import bisect
+import zipfile
+import threading
+import multiprocessing
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PyPDF2 import PdfReader
 import pdfplumber
 import docx
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Union, Iterator
 import logging
+from utils.classifier import assess_risk_text, risk_type_classifier
+from utils.aggregation import RiskAggregator
+from utils.records import ControlObjective, ControlGap
+from utils.document_cache import DocumentCache, document_cache, file_sha256
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_document(file_path: str) -> Dict[str, Any]:
+# Version of the parsers' output format; bump it when parsing changes so
+# previously cached results are not reused
+PARSER_VERSION = "3"
+
+# Number of CSV rows held in memory at a time
+CSV_CHUNK_SIZE = 50000
+
+# Times a batch's process pool is restarted after a worker dies before the
+# remaining files are processed one per worker process
+BATCH_POOL_RESTARTS = 2
+
+# Worker processes for PDF text extraction (None means one per CPU)
+PDF_EXTRACT_WORKERS = None
+
+# Pages extracted per PDF worker task
+PDF_PAGES_PER_TASK = 20
+
+# PDFs with fewer pages are extracted in the calling process, where starting
+# workers would cost more than it saves
+PDF_PARALLEL_MIN_PAGES = 60
+
+# Process-wide PDF extraction pools by worker count, started on first use.
+# Workers are spawned rather than forked, so the pool does not copy the
+# threads and locks of a running Streamlit server.
+_pdf_pools = {}
+_pdf_pool_lock = threading.Lock()
+
+# WordprocessingML tags read by the streaming DOCX reader
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_R, W_T, W_TAB, W_BR, W_CR = (W_NS + tag for tag in ("p", "r", "t", "tab", "br", "cr"))
+W_TBL, W_TR, W_TC, W_GRID_SPAN, W_V_MERGE = (W_NS + tag for tag in ("tbl", "tr", "tc", "gridSpan", "vMerge"))
+W_VAL = W_NS + "val"
+
+def process_document(file_path: str, use_cache: bool = True) -> Dict[str, Any]:
     """
     Process different document types and extract structured data
     
+    Parsed results are cached by file content and parser version, so uploading
+    an unchanged file again skips parsing entirely.
+    
     Args:
         file_path: Path to the document file
+        use_cache: Whether to read from and write to the parse cache
         
     Returns:
         Structured data extracted from the document
@@ -24,27 +74,141 @@ def process_document(file_path: str) -> Dict[str, Any]:
     file_ext = os.path.splitext(file_path)[1].lower()
     
     try:
+        file_hash = file_sha256(file_path)
+        cache_key = DocumentCache.key(file_hash, file_ext, PARSER_VERSION)
+        
+        if use_cache:
+            cached = document_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Using cached parse of {os.path.basename(file_path)}")
+                cached["metadata"]["file_name"] = os.path.basename(file_path)
+                return cached
+        
         if file_ext == '.xlsx':
-            return process_excel(file_path)
+            structured_data = process_excel(file_path)
         elif file_ext == '.csv':
-            return process_csv(file_path)
+            structured_data = process_csv(file_path)
         elif file_ext == '.pdf':
-            return process_pdf(file_path)
+            structured_data = process_pdf(file_path)
         elif file_ext == '.docx':
-            return process_docx(file_path)
+            structured_data = process_docx(file_path)
         else:
             raise ValueError(f"Unsupported file format: {file_ext}")
+        
+        structured_data["metadata"]["file_hash"] = file_hash
+        
+        if use_cache:
+            document_cache.put(cache_key, structured_data)
+        
+        return structured_data
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}")
         raise
 
+def process_documents(file_paths: List[str], workers: int = None, use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Process many documents in parallel across a process pool
+    
+    Results are yielded in input order, each one as soon as it and every file
+    before it have finished. A file that fails to parse does not affect the others;
+    its result carries the error instead of data.
+    
+    A worker that dies (e.g. out of memory, or a native crash in a parser)
+    breaks the whole pool and fails every unfinished file with it. The
+    unfinished files are then resubmitted to a new pool, up to
+    BATCH_POOL_RESTARTS times; after that each remaining file gets a worker
+    process of its own, so only the file that kills its worker is reported
+    as failed.
+    
+    Args:
+        file_paths: Paths of the documents to process
+        workers: Number of worker processes (defaults to one per CPU)
+        use_cache: Whether to read from and write to the parse cache
+        
+    Yields:
+        {"file_path": path, "data": structured data or None, "error": error message or None}
+    """
+    file_paths = list(file_paths)
+    workers = min(workers or os.cpu_count() or 1, max(len(file_paths), 1))
+    
+    if workers == 1:
+        for file_path in file_paths:
+            yield _process_document_safely(file_path, use_cache)
+        return
+    
+    results = {}
+    next_index = 0
+    unfinished = list(range(len(file_paths)))
+    restarts = 0
+    
+    while unfinished:
+        isolated = restarts > BATCH_POOL_RESTARTS
+        for group in ([[index] for index in unfinished] if isolated else [unfinished]):
+            pool_workers = 1 if isolated else min(workers, len(group))
+            with ProcessPoolExecutor(max_workers=pool_workers, initializer=_init_batch_worker) as executor:
+                futures = {index: executor.submit(_process_document_safely, file_paths[index], use_cache) for index in group}
+                
+                for index in group:
+                    try:
+                        results[index] = futures[index].result()
+                    except BrokenProcessPool as e:
+                        if isolated:
+                            # This file's own worker died
+                            logger.error(f"Worker died while processing {file_paths[index]}: {str(e)}")
+                            results[index] = _batch_error(file_paths[index], e)
+                        break
+                    except Exception as e:
+                        logger.error(f"Worker failed while processing {file_paths[index]}: {str(e)}")
+                        results[index] = _batch_error(file_paths[index], e)
+                    
+                    while next_index in results:
+                        yield results.pop(next_index)
+                        next_index += 1
+                
+                # Keep the files that finished before the pool broke
+                for index, future in futures.items():
+                    if index in results or index < next_index or not future.done() or future.cancelled():
+                        continue
+                    error = future.exception()
+                    if error is None:
+                        results[index] = future.result()
+                    elif not isinstance(error, BrokenProcessPool):
+                        results[index] = _batch_error(file_paths[index], error)
+            
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+        
+        remaining = [index for index in unfinished if index >= next_index and index not in results]
+        if remaining and not isolated:
+            restarts += 1
+            logger.warning(f"A worker process died; resubmitting {len(remaining)} unfinished files "
+                           f"({'one per worker process' if restarts > BATCH_POOL_RESTARTS else f'new pool, restart {restarts}'})")
+        unfinished = remaining
+
+def _process_document_safely(file_path: str, use_cache: bool = True) -> Dict[str, Any]:
+    """Process one document, capturing any error in the result"""
+    try:
+        return {"file_path": file_path, "data": process_document(file_path, use_cache=use_cache), "error": None}
+    except Exception as e:
+        return _batch_error(file_path, e)
+
+def _batch_error(file_path: str, error: BaseException) -> Dict[str, Any]:
+    """Result of a file that could not be processed"""
+    return {"file_path": file_path, "data": None, "error": str(error) or type(error).__name__}
+
+def _init_batch_worker():
+    """Keep batch workers single-process so the pool is not oversubscribed"""
+    global PDF_EXTRACT_WORKERS
+    PDF_EXTRACT_WORKERS = 1
+
 def process_excel(file_path: str) -> Dict[str, Any]:
     """Process Excel files and extract RCM data"""
     logger.info(f"Processing Excel file: {file_path}")
     
-    # Read all sheets
-    excel_file = pd.ExcelFile(file_path)
-    sheet_names = excel_file.sheet_names
+    # Open the workbook once in read-only mode; sheets are streamed row by row
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    sheet_names = workbook.sheetnames
     
     # Initialize the structured data
     structured_data = {
@@ -72,40 +236,28 @@ def process_excel(file_path: str) -> Dict[str, Any]:
     }
     
     # Process each sheet for raw data first
-    for sheet_name in sheet_names:
-        logger.info(f"Processing sheet: {sheet_name}")
-        
-        try:
-            # Try to read the sheet first
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            
-            # Clean up column names and drop empty rows/columns
-            df.columns = [str(col).strip() for col in df.columns]
-            df = df.dropna(how='all').reset_index(drop=True)
-            
-            # Log the column names for debugging
-            logger.info(f"Columns in sheet {sheet_name}: {list(df.columns)}")
-            
-            # Store the raw data regardless of format
-            sheet_data = {
-                "sheet_name": sheet_name,
-                "rows": []
-            }
+    try:
+        for sheet_name, columns, rows in iter_excel_sheets(workbook):
+            logger.info(f"Processing sheet: {sheet_name}")
             
-            for idx, row in df.iterrows():
-                # Skip completely empty rows
-                if sum(pd.notna(row)) < 1:
-                    continue
+            try:
+                # Log the column names for debugging
+                logger.info(f"Columns in sheet {sheet_name}: {columns}")
                 
-                # Add all row data
-                row_data = {col: str(row[col]) if pd.notna(row[col]) else "" for col in df.columns}
-                sheet_data["rows"].append(row_data)
+                # Store the raw data regardless of format
+                sheet_frame = pd.DataFrame(rows, columns=columns, dtype=object)
+                sheet_data = {
+                    "sheet_name": sheet_name,
+                    "rows": frame_to_rows(sheet_frame)
+                }
+                
+                structured_data["raw_data"].append(sheet_data)
+                logger.info(f"Stored {len(sheet_data['rows'])} raw rows from sheet {sheet_name}")
             
-            structured_data["raw_data"].append(sheet_data)
-            logger.info(f"Stored {len(sheet_data['rows'])} raw rows from sheet {sheet_name}")
-        
-        except Exception as e:
-            logger.error(f"Error processing sheet {sheet_name} for raw data: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error processing sheet {sheet_name} for raw data: {str(e)}")
+    finally:
+        workbook.close()
     
     # Now process the raw data to extract structured information
     departments_found = set()  # To keep track of unique departments
@@ -173,27 +325,11 @@ def process_excel(file_path: str) -> Dict[str, Any]:
                 
                 # Create control objective entry
                 if control_obj or risk:
-                    # Detect if this is a gap based on risk description
-                    is_gap = False
-                    risk_text = str(risk).lower()
-                    gap_keywords = ['inadequate', 'missing', 'lack', 'absence', 'not adequate', 'incorrect', 
-                                   'error', 'without', 'unauthorized', 'risk', 'fail', 'fraud', 'inappropriate']
-                    
-                    if any(keyword in risk_text for keyword in gap_keywords):
-                        is_gap = True
-                    
-                    # Infer risk level
-                    risk_level = "Medium"  # Default
-                    high_risk_keywords = ['critical', 'high', 'severe', 'significant', 'major', 'fraud', 'unauthorized', 'incorrect']
-                    low_risk_keywords = ['minor', 'low', 'minimal', 'small', 'unlikely']
-                    
-                    if any(keyword in risk_text for keyword in high_risk_keywords):
-                        risk_level = "High"
-                    elif any(keyword in risk_text for keyword in low_risk_keywords):
-                        risk_level = "Low"
+                    # Detect if this is a gap and infer the risk level from the risk description
+                    is_gap, risk_level = assess_risk_text(risk)
                     
                     # Add control objective
-                    objective = {
+                    objective = ControlObjective({
                         "department": area.strip() if area else "Unknown",
                         "objective": control_obj,
                         "what_can_go_wrong": risk,
@@ -203,13 +339,13 @@ def process_excel(file_path: str) -> Dict[str, Any]:
                         "gap_details": risk if is_gap else "",
                         "proposed_control": "",
                         "area_subprocess": subprocess
-                    }
+                    })
                     
                     structured_data["control_objectives"].append(objective)
                     
                     # Add gap if applicable
                     if is_gap:
-                        gap = {
+                        gap = ControlGap({
                             "department": area.strip() if area else "Unknown",
                             "control_objective": control_obj,
                             "gap_title": risk[:50] + "..." if len(risk) > 50 else risk,
@@ -217,7 +353,7 @@ def process_excel(file_path: str) -> Dict[str, Any]:
                             "risk_impact": risk,
                             "proposed_solution": "",
                             "area_subprocess": subprocess
-                        }
+                        })
                         structured_data["gaps"].append(gap)
         else:
             # If no header candidates, try a more generic approach
@@ -292,7 +428,7 @@ def process_excel(file_path: str) -> Dict[str, Any]:
                         structured_data["departments"].append(area_val)
                     
                     # Create control objective
-                    objective = {
+                    objective = ControlObjective({
                         "department": area_val,
                         "objective": obj_val or "Unknown",
                         "what_can_go_wrong": risk_val or "",
@@ -301,7 +437,7 @@ def process_excel(file_path: str) -> Dict[str, Any]:
                         "is_gap": bool(risk_val),
                         "gap_details": risk_val or "",
                         "proposed_control": ""
-                    }
+                    })
                     
                     structured_data["control_objectives"].append(objective)
     
@@ -322,60 +458,22 @@ def process_excel(file_path: str) -> Dict[str, Any]:
     structured_data["control_gaps"] = len(structured_data["gaps"])
     
     # Generate risk distribution
-    risk_levels = [obj.get("risk_level", "").strip() for obj in structured_data["control_objectives"] if obj.get("risk_level", "").strip()]
-    risk_distribution = {}
-    for level in risk_levels:
-        if level:
-            # Normalize risk levels (High/Medium/Low)
-            if level.lower() in ['high', 'h', 'critical', 'severe']:
-                std_level = 'High'
-            elif level.lower() in ['medium', 'm', 'mod', 'moderate']:
-                std_level = 'Medium'
-            elif level.lower() in ['low', 'l', 'minor']:
-                std_level = 'Low'
-            else:
-                std_level = 'Medium'  # Default
-                
-            if std_level in risk_distribution:
-                risk_distribution[std_level] += 1
-            else:
-                risk_distribution[std_level] = 1
-    
-    # Ensure all three risk levels exist in the distribution
-    for level in ['High', 'Medium', 'Low']:
-        if level not in risk_distribution:
-            risk_distribution[level] = 0
-    
-    structured_data["risk_distribution"] = risk_distribution
+    aggregator = RiskAggregator(departments=[])
+    aggregator.add(structured_data["control_objectives"])
+    structured_data["risk_distribution"] = aggregator.risk_distribution
     
     # Specific Risk Types Analysis - based on the user's request
-    risk_types = ["Operational", "Financial", "Fraud", "Financial Fraud", "Operational Fraud"]
-    risk_type_mapping = {}
-    
-    # Keywords for each risk type
-    risk_type_keywords = {
-        "Operational": ["process", "workflow", "efficiency", "performance", "delivery", "resource", "procedure", "operational", "operation"],
-        "Financial": ["financial", "budget", "cost", "expense", "revenue", "payment", "accounting", "payroll", "salary"],
-        "Fraud": ["fraud", "misappropriation", "theft", "falsification", "bribery", "corruption", "unauthorized"],
-        "Financial Fraud": ["financial fraud", "embezzlement", "accounting fraud", "false reporting", "misstatement", "incorrect amount"],
-        "Operational Fraud": ["operational fraud", "process manipulation", "override", "unauthorized", "fictitious", "absence of control"]
-    }
+    # Label every control objective with its risk types in one vectorized pass
+    objectives = structured_data["control_objectives"]
+    risk_type_flags = risk_type_classifier.classify_series(
+        pd.Series([f"{obj.get('objective', '')} {obj.get('what_can_go_wrong', '')}" for obj in objectives], dtype=object)
+    )
     
-    # Identify risk types for each control objective
-    for obj in structured_data["control_objectives"]:
-        obj_text = f"{obj.get('objective', '')} {obj.get('what_can_go_wrong', '')}"
-        obj_text = obj_text.lower()
-        
-        # Identify applicable risk types
-        obj["risk_types"] = []
-        for risk_type, keywords in risk_type_keywords.items():
-            if any(keyword in obj_text for keyword in keywords):
-                obj["risk_types"].append(risk_type)
-                
-                # Count risk types
-                if risk_type not in risk_type_mapping:
-                    risk_type_mapping[risk_type] = 0
-                risk_type_mapping[risk_type] += 1
+    for obj, flags in zip(objectives, risk_type_flags.itertuples(index=False)):
+        obj["risk_types"] = [risk_type for risk_type, flagged in zip(risk_type_flags.columns, flags) if flagged]
+    
+    # Count risk types
+    risk_type_mapping = {risk_type: int(count) for risk_type, count in risk_type_flags.sum().items() if count}
     
     # Add risk type mapping to structured data
     structured_data["risk_type_mapping"] = risk_type_mapping
@@ -386,12 +484,83 @@ def process_excel(file_path: str) -> Dict[str, Any]:
     
     return structured_data
 
-def process_csv(file_path: str) -> Dict[str, Any]:
-    """Process CSV files and extract RCM data"""
-    logger.info(f"Processing CSV file: {file_path}")
+def iter_excel_sheets(workbook):
+    """
+    Stream the sheets of a read-only openpyxl workbook
+    
+    The workbook is parsed once; each sheet is read with a row iterator and only
+    that sheet's rows are held in memory while it is being consumed. Column naming
+    and empty-row handling match what pd.read_excel produces.
+    
+    Args:
+        workbook: Workbook opened with openpyxl.load_workbook(read_only=True)
+        
+    Yields:
+        Tuples of (sheet_name, column names, list of row value tuples)
+    """
+    for sheet_name in workbook.sheetnames:
+        try:
+            worksheet = workbook[sheet_name]
+            # Some writers store stale dimensions; scan the actual cells instead
+            worksheet.reset_dimensions()
+            
+            row_iter = worksheet.iter_rows(values_only=True)
+            header = _trim_row(next(row_iter, ()))
+            
+            rows = []
+            width = len(header)
+            for values in row_iter:
+                values = _trim_row(values)
+                # Skip completely empty rows
+                if not values:
+                    continue
+                rows.append(values)
+                width = max(width, len(values))
+            
+            columns = _table_column_names(header, width)
+            padding = (None,) * width
+            rows = [values + padding[len(values):] for values in rows]
+            
+            yield sheet_name, columns, rows
+        
+        except Exception as e:
+            logger.error(f"Error reading sheet {sheet_name}: {str(e)}")
+
+def _trim_row(values) -> tuple:
+    """Drop trailing empty cells from a row of worksheet values"""
+    values = tuple(None if v == "" else v for v in values)
+    end = len(values)
+    while end and values[end - 1] is None:
+        end -= 1
+    return values[:end]
+
+def _table_column_names(header: tuple, width: int) -> List[str]:
+    """Build stripped, de-duplicated column names the way pandas names them"""
+    columns = []
+    seen = {}
+    for i in range(width):
+        value = header[i] if i < len(header) else None
+        name = str(value).strip() if value is not None else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def process_csv(file_path: str, chunksize: int = CSV_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Process CSV files and extract RCM data
     
-    # Read CSV
-    df = pd.read_csv(file_path)
+    Args:
+        file_path: Path to the CSV file
+        chunksize: Number of rows read per chunk
+        
+    Returns:
+        Structured data extracted from the document
+    """
+    logger.info(f"Processing CSV file: {file_path}")
     
     # Initialize the structured data
     structured_data = {
@@ -406,13 +575,119 @@ def process_csv(file_path: str) -> Dict[str, Any]:
         "departments": []
     }
     
-    # Clean up column names and drop empty rows
-    df.columns = [str(col).strip() for col in df.columns]
-    df = df.dropna(how='all').reset_index(drop=True)
+    # Collect the streamed objectives; statistics are aggregated as chunks arrive
+    aggregator = RiskAggregator()
+    for objectives, gaps in stream_csv(file_path, aggregator, chunksize=chunksize):
+        structured_data["control_objectives"].extend(objectives)
+        structured_data["gaps"].extend(gaps)
+    
+    structured_data["departments"] = aggregator.departments
+    
+    # Generate summary stats
+    structured_data["total_controls"] = aggregator.total_controls
+    structured_data["control_gaps"] = len(structured_data["gaps"])
+    structured_data["risk_distribution"] = aggregator.risk_distribution
+    
+    # Generate department risk matrix
+    if len(structured_data["departments"]) > 0:
+        structured_data["department_risks"] = aggregator.department_risks()
+    
+    logger.info(f"Extracted {structured_data['total_controls']} control objectives and {len(structured_data['departments'])} departments from CSV")
+    
+    return structured_data
+
+def stream_csv(file_path: str, aggregator: RiskAggregator = None, chunksize: int = CSV_CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Stream control objectives out of a CSV file chunk by chunk
+    
+    Only one chunk of the file is in memory at a time. When an aggregator is given,
+    its risk distribution, departments and department risk matrix are updated
+    with every chunk before it is yielded.
+    
+    Args:
+        file_path: Path to the CSV file
+        aggregator: Optional RiskAggregator to update incrementally
+        chunksize: Number of rows read per chunk
+        
+    Yields:
+        Tuples of (control objectives, gaps) for each chunk
+    """
+    if aggregator is None:
+        aggregator = RiskAggregator()
+    
+    chunks = iter_csv_chunks(file_path, chunksize)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return
     
     # Print column names for debugging
-    logger.info(f"Columns in CSV file: {list(df.columns)}")
+    logger.info(f"Columns in CSV file: {list(first_chunk.columns)}")
+    
+    column_mapping = map_rcm_columns(first_chunk.columns)
+    logger.info(f"Column mapping for CSV: {column_mapping}")
+    
+    found_objectives = False
     
+    # Check if we've identified enough columns to be an RCM
+    if len(column_mapping) >= 3:  # At least 3 relevant columns found
+        logger.info(f"CSV appears to be an RCM with {len(column_mapping)} relevant columns")
+        
+        for chunk in itertools.chain([first_chunk], chunks):
+            objectives, gaps = objectives_from_frame(chunk, column_mapping)
+            if objectives:
+                found_objectives = True
+                aggregator.add(objectives)
+                yield objectives, gaps
+    
+    # Handle case where no standardized columns were found but there might still be RCM data
+    if not found_objectives:
+        logger.warning("No RCM structure found with standard column names. Attempting alternative extraction...")
+        
+        chunks = iter_csv_chunks(file_path, chunksize)
+        first_chunk = next(chunks, None)
+        
+        # If this looks like a header row followed by data rows
+        if first_chunk is None or len(first_chunk) < 1:
+            return
+        
+        # Use the first row as headers if they weren't already
+        potential_headers = first_chunk.iloc[0].values
+        if not any(isinstance(h, str) and len(h) > 3 for h in potential_headers if h is not None):
+            return
+        
+        # Extract all rows as potential control objectives
+        for chunk in itertools.chain([first_chunk.iloc[1:]], chunks):
+            objectives = positional_objectives_from_frame(chunk)
+            if objectives:
+                # If we don't have any departments yet, add a default one
+                if not aggregator.departments:
+                    aggregator.add_department("General")
+                aggregator.add(objectives, track_departments=False)
+                yield objectives, []
+
+def iter_csv_chunks(file_path: str, chunksize: int = CSV_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV file in chunks with cleaned column names and empty rows dropped
+    
+    Every column is read as text, so values parse the same way whatever the
+    chunk size (type inference per chunk would turn "100" into "100.0" in
+    chunks with a blank cell). Missing cells stay NaN.
+    """
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, dtype=str):
+        # Clean up column names and drop empty rows
+        chunk.columns = [str(col).strip() for col in chunk.columns]
+        yield chunk.dropna(how='all')
+
+def map_rcm_columns(columns) -> Dict[str, str]:
+    """
+    Map actual column names to standardized RCM field names
+    
+    Args:
+        columns: Column names of the table
+        
+    Returns:
+        Mapping of actual column name to standardized name
+    """
     # Try to identify column names regardless of exact naming
     relevant_column_patterns = {
         'department': ['department', 'dept', 'function', 'area', 'business unit'],
@@ -427,212 +702,150 @@ def process_csv(file_path: str) -> Dict[str, Any]:
     # Map actual column names to standardized names
     column_mapping = {}
     for std_name, patterns in relevant_column_patterns.items():
-        for col in df.columns:
-            if any(pattern.lower() in col.lower() for pattern in patterns):
+        for col in columns:
+            if any(pattern.lower() in str(col).lower() for pattern in patterns):
                 column_mapping[col] = std_name
                 break
     
-    logger.info(f"Column mapping for CSV: {column_mapping}")
+    return column_mapping
+
+def frame_to_rows(df: pd.DataFrame) -> List[Dict[str, str]]:
+    """
+    Convert a DataFrame into row dictionaries of strings
     
-    # Check if we've identified enough columns to be an RCM
-    if len(column_mapping) >= 3:  # At least 3 relevant columns found
-        logger.info(f"CSV appears to be an RCM with {len(column_mapping)} relevant columns")
+    Empty rows are dropped, missing values become "" and every other value is
+    cast with str(), all as bulk column operations rather than per-cell calls.
+    
+    Args:
+        df: DataFrame to convert
         
-        # Process each row
-        for idx, row in df.iterrows():
-            # Skip rows that are likely headers or section titles (usually shorter)
-            if sum(pd.notna(row)) < 3:
-                continue
-            
-            # Extract data using the column mapping
-            obj_data = {}
-            for col, std_name in column_mapping.items():
-                if pd.notna(row.get(col, None)):
-                    obj_data[std_name] = str(row[col])
-            
-            # If we have enough data to create a control objective
-            if 'control_objective' in obj_data or 'what_can_go_wrong' in obj_data:
-                # Defaults for required fields
-                objective = {
-                    "department": obj_data.get('department', 'Unknown'),
-                    "objective": obj_data.get('control_objective', 'Unknown'),
-                    "what_can_go_wrong": obj_data.get('what_can_go_wrong', ''),
-                    "risk_level": obj_data.get('risk_level', 'Medium'),
-                    "control_activities": obj_data.get('control_activity', ''),
-                    "is_gap": 'control_gap' in obj_data and pd.notna(obj_data.get('control_gap', '')),
-                    "gap_details": obj_data.get('control_gap', ''),
-                    "proposed_control": obj_data.get('proposed_control', '')
-                }
-                
-                structured_data["control_objectives"].append(objective)
-                
-                # Add to departments list if not already there
-                dept = objective["department"]
-                if dept and dept not in structured_data["departments"]:
-                    structured_data["departments"].append(dept)
-                
-                # If there's a gap, add to gaps list
-                if objective["is_gap"]:
-                    gap = {
-                        "department": objective["department"],
-                        "control_objective": objective["objective"],
-                        "gap_title": objective["gap_details"][:50] + "..." if len(objective["gap_details"]) > 50 else objective["gap_details"],
-                        "description": objective["gap_details"],
-                        "risk_impact": objective["what_can_go_wrong"],
-                        "proposed_solution": objective["proposed_control"]
-                    }
-                    structured_data["gaps"].append(gap)
+    Returns:
+        List of {column: value} dictionaries
+    """
+    df = df.dropna(how='all')
+    if df.empty:
+        return []
     
-    # Handle case where no standardized columns were found but there might still be RCM data
-    if not structured_data["control_objectives"]:
-        logger.warning("No RCM structure found with standard column names. Attempting alternative extraction...")
+    return df.astype(str).where(df.notna(), "").to_dict('records')
+
+def objectives_from_frame(df: pd.DataFrame, column_mapping: Dict[str, str]) -> tuple:
+    """
+    Build control objectives and gaps from an RCM table in one columnar pass
+    
+    Args:
+        df: DataFrame holding the RCM rows
+        column_mapping: Mapping of actual column names to standardized names
         
-        # If this looks like a header row followed by data rows
-        if len(df) >= 2:
-            # Use the first row as headers if they weren't already
-            potential_headers = df.iloc[0].values
-            if any(isinstance(h, str) and len(h) > 3 for h in potential_headers if h is not None):
-                # Extract all rows as potential control objectives
-                for idx in range(1, len(df)):
-                    row = df.iloc[idx]
-                    
-                    # Skip empty rows
-                    if sum(pd.notna(row)) < 3:
-                        continue
-                    
-                    # Create a control objective from whatever data is available
-                    objective = {
-                        "department": "Unknown",
-                        "objective": str(row.iloc[0]) if pd.notna(row.iloc[0]) else "Unknown",
-                        "what_can_go_wrong": str(row.iloc[1]) if len(row) > 1 and pd.notna(row.iloc[1]) else "",
-                        "risk_level": "Medium",  # Default value
-                        "control_activities": str(row.iloc[2]) if len(row) > 2 and pd.notna(row.iloc[2]) else "",
-                        "is_gap": len(row) > 3 and pd.notna(row.iloc[3]),
-                        "gap_details": str(row.iloc[3]) if len(row) > 3 and pd.notna(row.iloc[3]) else "",
-                        "proposed_control": str(row.iloc[4]) if len(row) > 4 and pd.notna(row.iloc[4]) else ""
-                    }
-                    
-                    structured_data["control_objectives"].append(objective)
-                    
-                    # If we don't have any departments yet, add a default one
-                    if not structured_data["departments"]:
-                        structured_data["departments"].append("General")
+    Returns:
+        Tuple of (control objectives, gaps)
+    """
+    # Skip rows that are likely headers or section titles (usually shorter)
+    df = df[df.notna().sum(axis=1) >= 3]
     
-    # Generate summary stats
-    structured_data["total_controls"] = len(structured_data["control_objectives"])
-    structured_data["control_gaps"] = len(structured_data["gaps"])
+    mapped = df[list(column_mapping)].rename(columns=column_mapping)
+    present = mapped.notna()
+    text = mapped.astype(str)
     
-    # Generate risk distribution
-    risk_levels = [obj.get("risk_level", "").strip() for obj in structured_data["control_objectives"] if obj.get("risk_level", "").strip()]
-    risk_distribution = {}
-    for level in risk_levels:
-        if level:
-            # Normalize risk levels (High/Medium/Low)
-            if level.lower() in ['high', 'h', 'critical', 'severe']:
-                std_level = 'High'
-            elif level.lower() in ['medium', 'm', 'mod', 'moderate']:
-                std_level = 'Medium'
-            elif level.lower() in ['low', 'l', 'minor']:
-                std_level = 'Low'
-            else:
-                std_level = 'Medium'  # Default
-                
-            if std_level in risk_distribution:
-                risk_distribution[std_level] += 1
-            else:
-                risk_distribution[std_level] = 1
+    def field(std_name, default):
+        if std_name not in mapped:
+            return default
+        return text[std_name].where(present[std_name], default)
     
-    # Ensure all three risk levels exist in the distribution
-    for level in ['High', 'Medium', 'Low']:
-        if level not in risk_distribution:
-            risk_distribution[level] = 0
+    # Only rows with an objective or a risk description become control objectives
+    keep = pd.Series(False, index=mapped.index)
+    for std_name in ('control_objective', 'what_can_go_wrong'):
+        if std_name in present:
+            keep |= present[std_name]
     
-    structured_data["risk_distribution"] = risk_distribution
+    frame = pd.DataFrame({
+        "department": field('department', 'Unknown'),
+        "objective": field('control_objective', 'Unknown'),
+        "what_can_go_wrong": field('what_can_go_wrong', ''),
+        "risk_level": field('risk_level', 'Medium'),
+        "control_activities": field('control_activity', ''),
+        "is_gap": present['control_gap'] if 'control_gap' in present else False,
+        "gap_details": field('control_gap', ''),
+        "proposed_control": field('proposed_control', '')
+    }, index=mapped.index)[keep]
     
-    # Generate department risk matrix
-    if len(structured_data["departments"]) > 0:
-        risk_categories = ["Financial", "Operational", "Compliance", "Strategic", "Technological"]
-        department_risks = {dept: {cat: 0 for cat in risk_categories} for dept in structured_data["departments"]}
-        
-        # Populate risk values based on control objectives
-        for obj in structured_data["control_objectives"]:
-            dept = obj.get("department", "")
-            if not dept or dept not in structured_data["departments"]:
-                continue
-                
-            # Set risk level value
-            risk_text = obj.get("risk_level", "").lower()
-            if risk_text in ['high', 'h', 'critical', 'severe']:
-                risk_level_value = 4
-            elif risk_text in ['medium', 'm', 'mod', 'moderate']:
-                risk_level_value = 3
-            else:
-                risk_level_value = 2
-                
-            # Assign to categories based on keywords
-            objective_text = obj.get("objective", "").lower()
-            what_can_go_wrong = obj.get("what_can_go_wrong", "").lower()
-            combined_text = f"{objective_text} {what_can_go_wrong}"
-            
-            # Financial risks
-            if any(term in combined_text for term in ['financ', 'account', 'budget', 'cost', 'expense', 'revenue', 'payment', 'tax', 'audit']):
-                department_risks[dept]["Financial"] = max(department_risks[dept]["Financial"], risk_level_value)
-                
-            # Operational risks
-            if any(term in combined_text for term in ['operat', 'process', 'procedur', 'workflow', 'efficien', 'product', 'service', 'delivery']):
-                department_risks[dept]["Operational"] = max(department_risks[dept]["Operational"], risk_level_value)
-                
-            # Compliance risks
-            if any(term in combined_text for term in ['comply', 'compliance', 'regulat', 'legal', 'law', 'policy', 'requirement', 'standard']):
-                department_risks[dept]["Compliance"] = max(department_risks[dept]["Compliance"], risk_level_value)
-                
-            # Strategic risks
-            if any(term in combined_text for term in ['strateg', 'goal', 'objective', 'mission', 'vision', 'plan', 'market', 'competi']):
-                department_risks[dept]["Strategic"] = max(department_risks[dept]["Strategic"], risk_level_value)
-                
-            # Technological risks
-            if any(term in combined_text for term in ['tech', 'system', 'data', 'secur', 'access', 'software', 'hardware', 'it ', 'cyber']):
-                department_risks[dept]["Technological"] = max(department_risks[dept]["Technological"], risk_level_value)
-        
-        # Ensure all departments have at least some risk level for each category
-        for dept in structured_data["departments"]:
-            for cat in risk_categories:
-                if department_risks[dept][cat] == 0:
-                    department_risks[dept][cat] = 1  # Set minimum risk level
+    objectives = [ControlObjective(record) for record in frame.to_dict('records')]
+    
+    # If there's a gap, add to gaps list
+    gap_frame = frame[frame["is_gap"]]
+    gap_details = gap_frame["gap_details"]
+    gaps = pd.DataFrame({
+        "department": gap_frame["department"],
+        "control_objective": gap_frame["objective"],
+        "gap_title": gap_details.where(gap_details.str.len() <= 50, gap_details.str.slice(0, 50) + "..."),
+        "description": gap_details,
+        "risk_impact": gap_frame["what_can_go_wrong"],
+        "proposed_solution": gap_frame["proposed_control"]
+    }).to_dict('records')
+    gaps = [ControlGap(record) for record in gaps]
+    
+    return objectives, gaps
+
+def positional_objectives_from_frame(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Build control objectives from the first five columns of an unlabeled table
+    
+    Args:
+        df: DataFrame holding the data rows (without the header row)
         
-        structured_data["department_risks"] = department_risks
+    Returns:
+        List of control objectives
+    """
+    # Skip empty rows
+    df = df[df.notna().sum(axis=1) >= 3]
     
-    logger.info(f"Extracted {structured_data['total_controls']} control objectives and {len(structured_data['departments'])} departments from CSV")
+    def column(position, default):
+        if position >= df.shape[1]:
+            return default
+        values = df.iloc[:, position]
+        return values.astype(str).where(values.notna(), default)
     
-    return structured_data
+    records = pd.DataFrame({
+        "department": "Unknown",
+        "objective": column(0, "Unknown"),
+        "what_can_go_wrong": column(1, ""),
+        "risk_level": "Medium",  # Default value
+        "control_activities": column(2, ""),
+        "is_gap": df.iloc[:, 3].notna() if df.shape[1] > 3 else False,
+        "gap_details": column(3, ""),
+        "proposed_control": column(4, "")
+    }, index=df.index).to_dict('records')
+    
+    return [ControlObjective(record) for record in records]
 
 def process_pdf(file_path: str) -> Dict[str, Any]:
     """Process PDF files and extract RCM data using PDF extraction and LLM later"""
     logger.info(f"Processing PDF file: {file_path}")
     
     try:
-        # Extract text from PDF
-        extracted_text = ""
+        # Extract text from PDF, page ranges in parallel
+        pages = extract_pdf_pages(file_path)
         
-        # Try with pdfplumber first
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                extracted_text += page.extract_text() + "\n\n"
-        
-        # If pdfplumber failed or returned empty text, try PyPDF2
-        if not extracted_text.strip():
-            pdf_reader = PdfReader(file_path)
-            for page in pdf_reader.pages:
-                extracted_text += page.extract_text() + "\n\n"
+        # Join pages in order, remembering where each page starts in the text
+        page_offsets = []
+        parts = []
+        offset = 0
+        for page_number, page in enumerate(pages, start=1):
+            page_text = page["text"]
+            page_offsets.append({"page": page_number, "start": offset, "end": offset + len(page_text)})
+            parts.append(page_text + "\n\n")
+            offset += len(page_text) + 2
+        extracted_text = "".join(parts)
         
         # Initialize the structured data
         structured_data = {
             "metadata": {
                 "file_name": os.path.basename(file_path),
                 "file_type": "pdf",
-                "text_length": len(extracted_text)
+                "text_length": len(extracted_text),
+                "page_count": len(pages)
             },
             "extracted_text": extracted_text,
+            "page_offsets": page_offsets,
             "control_objectives": [],
             "risks": [],
             "controls": [],
@@ -641,6 +854,12 @@ def process_pdf(file_path: str) -> Dict[str, Any]:
             "raw_text": True  # Flag to indicate this requires LLM processing
         }
         
+        # Map RCM tables found on the pages straight into control objectives
+        tables = [table for page in pages for table in page["tables"]]
+        structured_data["metadata"]["tables_count"] = len(tables)
+        if apply_rcm_tables(structured_data, tables):
+            return structured_data
+        
         # We'll extract the structured data using LLM later
         # For now, create some placeholder data for sample visualization
         structured_data["total_controls"] = 0
@@ -665,23 +884,198 @@ def process_pdf(file_path: str) -> Dict[str, Any]:
         logger.error(f"Error processing PDF: {str(e)}")
         raise
 
+def extract_pdf_pages(file_path: str, workers: int = None) -> List[Dict[str, Any]]:
+    """
+    Extract the text and tables of every page of a PDF
+    
+    The document is opened once with pdfplumber to count its pages. Short
+    documents are extracted from that same handle; longer ones are split into
+    page ranges extracted in parallel on a process pool shared by every upload
+    (see _get_pdf_pool), each worker parsing only its own pages. Pages where
+    pdfplumber fails or finds no text fall back to PyPDF2 individually.
+    
+    Args:
+        file_path: Path to the PDF file
+        workers: Number of worker processes (defaults to PDF_EXTRACT_WORKERS)
+        
+    Returns:
+        List of {"text": page text, "tables": page tables} in document order
+    """
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+        workers = min(workers or PDF_EXTRACT_WORKERS or os.cpu_count() or 1, -(-page_count // PDF_PAGES_PER_TASK))
+        if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+            return _extract_pages(file_path, pdf.pages, 0)
+    
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    try:
+        results = list(_get_pdf_pool(workers).map(_extract_page_range, itertools.repeat(file_path), *zip(*ranges)))
+        logger.info(f"Extracted {page_count} PDF pages with {workers} workers")
+        return [page for range_pages in results for page in range_pages]
+    except BrokenProcessPool as e:
+        with _pdf_pool_lock:
+            _pdf_pools.pop(workers, None)
+        logger.warning(f"PDF extraction pool failed: {str(e)}. Extracting serially.")
+    except Exception as e:
+        logger.warning(f"Parallel PDF extraction failed: {str(e)}. Extracting serially.")
+    
+    return [page for start, end in ranges for page in _extract_page_range(file_path, start, end)]
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the process-wide PDF extraction pool with the given number of workers"""
+    with _pdf_pool_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pdf_pools[workers] = pool
+        return pool
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Extract pages [start, end) of a PDF in a worker process"""
+    with pdfplumber.open(file_path, pages=list(range(start + 1, end + 1))) as pdf:
+        return _extract_pages(file_path, pdf.pages, start)
+
+def _extract_pages(file_path: str, pdf_pages, start: int) -> List[Dict[str, Any]]:
+    """Extract pdfplumber pages numbered from start, falling back to PyPDF2 per page"""
+    pages = []
+    fallback_reader = None
+    
+    for page_index, page in enumerate(pdf_pages, start=start):
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            logger.warning(f"pdfplumber failed on page {page_index + 1}: {str(e)}")
+            text = ""
+        
+        # If pdfplumber failed or returned empty text, try PyPDF2 for this page
+        if not text.strip():
+            try:
+                if fallback_reader is None:
+                    fallback_reader = PdfReader(file_path)
+                text = fallback_reader.pages[page_index].extract_text() or ""
+            except Exception as e:
+                logger.warning(f"PyPDF2 failed on page {page_index + 1}: {str(e)}")
+        
+        # Tables are found with pdfplumber's table finder
+        try:
+            tables = page.extract_tables()
+        except Exception as e:
+            logger.warning(f"Table extraction failed on page {page_index + 1}: {str(e)}")
+            tables = []
+        
+        pages.append({"text": text, "tables": tables})
+    
+    return pages
+
+def page_at_offset(page_offsets: List[Dict[str, int]], offset: int) -> int:
+    """
+    Find the page a character offset of the extracted text belongs to
+    
+    Args:
+        page_offsets: Page offsets produced by process_pdf
+        offset: Character offset into extracted_text
+        
+    Returns:
+        1-based page number, or 0 if there are no page offsets
+    """
+    if not page_offsets:
+        return 0
+    
+    index = bisect.bisect_right([page["start"] for page in page_offsets], offset) - 1
+    return page_offsets[max(index, 0)]["page"]
+
+def objectives_from_tables(tables: List[List[List[Any]]]) -> tuple:
+    """
+    Map RCM tables from PDF or DOCX documents into control objectives and gaps
+    
+    A table is treated as an RCM when its first row maps to at least three known
+    RCM columns. Following tables with the same number of columns and no header
+    of their own are read as continuations (e.g. a table split across pages).
+    
+    Args:
+        tables: Tables as lists of rows of cell values
+        
+    Returns:
+        Tuple of (control objectives, gaps)
+    """
+    objectives = []
+    gaps = []
+    columns = None
+    column_mapping = {}
+    
+    for table in tables:
+        rows = [tuple(_clean_cell(cell) for cell in row) for row in table if row]
+        if not rows:
+            continue
+        
+        width = max(len(row) for row in rows)
+        header_mapping = map_rcm_columns(_table_column_names(rows[0], width))
+        
+        if len(header_mapping) >= 3:
+            columns = _table_column_names(rows[0], width)
+            column_mapping = header_mapping
+            rows = rows[1:]
+        elif columns is None or width != len(columns):
+            # Not an RCM table and not a continuation of one
+            columns = None
+            continue
+        
+        padding = (None,) * width
+        frame = pd.DataFrame([row + padding[len(row):] for row in rows], columns=columns, dtype=object)
+        table_objectives, table_gaps = objectives_from_frame(frame.dropna(how='all'), column_mapping)
+        objectives.extend(table_objectives)
+        gaps.extend(table_gaps)
+    
+    return objectives, gaps
+
+def _clean_cell(value: Any) -> Any:
+    """Normalize whitespace in a table cell, mapping empty cells to None"""
+    if value is None:
+        return None
+    text = " ".join(str(value).split())
+    return text or None
+
+def apply_rcm_tables(structured_data: Dict[str, Any], tables: List[List[List[Any]]]) -> bool:
+    """
+    Fill structured data from RCM tables so the document can skip raw-text analysis
+    
+    Args:
+        structured_data: Structured data of a PDF or DOCX document
+        tables: Tables extracted from the document
+        
+    Returns:
+        True if control objectives were found in the tables
+    """
+    objectives, gaps = objectives_from_tables(tables)
+    if not objectives:
+        return False
+    
+    aggregator = RiskAggregator()
+    aggregator.add(objectives)
+    
+    structured_data["control_objectives"] = objectives
+    structured_data["gaps"] = gaps
+    structured_data["departments"] = aggregator.departments
+    structured_data["total_controls"] = aggregator.total_controls
+    structured_data["control_gaps"] = len(gaps)
+    structured_data["risk_distribution"] = aggregator.risk_distribution
+    structured_data["department_risks"] = aggregator.department_risks()
+    
+    # The tables already follow the RCM schema, no LLM extraction needed
+    structured_data["raw_text"] = False
+    
+    logger.info(f"Extracted {len(objectives)} control objectives and {len(aggregator.departments)} departments from document tables")
+    
+    return True
+
 def process_docx(file_path: str) -> Dict[str, Any]:
     """Process DOCX files and extract RCM data"""
     logger.info(f"Processing DOCX file: {file_path}")
     
     try:
-        # Extract text from DOCX
-        doc = docx.Document(file_path)
-        extracted_text = "\n\n".join([paragraph.text for paragraph in doc.paragraphs])
-        
-        # Extract tables if any
-        tables_data = []
-        for table in doc.tables:
-            table_data = []
-            for row in table.rows:
-                row_data = [cell.text for cell in row.cells]
-                table_data.append(row_data)
-            tables_data.append(table_data)
+        # Extract text and tables (if any) from DOCX
+        paragraphs, tables_data = read_docx_content(file_path)
+        extracted_text = "\n\n".join(paragraphs)
         
         # Initialize the structured data
         structured_data = {
@@ -701,6 +1095,10 @@ def process_docx(file_path: str) -> Dict[str, Any]:
             "raw_text": True  # Flag to indicate this requires LLM processing
         }
         
+        # Map RCM tables straight into control objectives
+        if apply_rcm_tables(structured_data, tables_data):
+            return structured_data
+        
         # We'll extract the structured data using LLM later
         # For now, create some placeholder data for sample visualization
         structured_data["total_controls"] = 0
@@ -723,4 +1121,126 @@ def process_docx(file_path: str) -> Dict[str, Any]:
         
     except Exception as e:
         logger.error(f"Error processing DOCX: {str(e)}")
-        raise 
\ No newline at end of file
+        raise 
+
+def read_docx_content(file_path: str) -> tuple:
+    """
+    Read the body paragraphs and tables of a DOCX file
+    
+    Uses the streaming XML reader and falls back to python-docx if the document
+    cannot be read that way.
+    
+    Args:
+        file_path: Path to the DOCX file
+        
+    Returns:
+        Tuple of (paragraph texts, tables as lists of rows of cell texts)
+    """
+    try:
+        return read_docx_xml(file_path)
+    except Exception as e:
+        logger.warning(f"Streaming DOCX reader failed: {str(e)}. Falling back to python-docx.")
+    
+    doc = docx.Document(file_path)
+    paragraphs = [paragraph.text for paragraph in doc.paragraphs]
+    
+    tables_data = []
+    for table in doc.tables:
+        table_data = []
+        for row in table.rows:
+            row_data = [cell.text for cell in row.cells]
+            table_data.append(row_data)
+        tables_data.append(table_data)
+    
+    return paragraphs, tables_data
+
+def read_docx_xml(file_path: str) -> tuple:
+    """
+    Stream word/document.xml and collect body paragraphs and table rows
+    
+    Each element is cleared and detached from its parent as soon as it has
+    been read, so only the open elements are held and memory does not grow
+    with the size of the document. The output matches python-docx: body-level
+    paragraphs, top-level tables, cell text as its paragraphs joined by newlines,
+    horizontally merged cells repeated and vertically merged cells copied from above.
+    
+    Args:
+        file_path: Path to the DOCX file
+        
+    Returns:
+        Tuple of (paragraph texts, tables as lists of rows of cell texts)
+    """
+    paragraphs = []
+    tables = []
+    
+    stack = []            # Currently open elements
+    paragraph_stack = []  # Text buffers of the currently open paragraphs
+    table_depth = 0
+    rows = row = cell = None
+    previous_row = []
+    
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml_file:
+        for event, elem in ElementTree.iterparse(xml_file, events=("start", "end")):
+            tag = elem.tag
+            
+            if event == "start":
+                stack.append(elem)
+                if tag == W_P:
+                    paragraph_stack.append([])
+                elif tag == W_TBL:
+                    table_depth += 1
+                    if table_depth == 1:
+                        rows = []
+                        previous_row = []
+                elif table_depth == 1:
+                    if tag == W_TR:
+                        row = []
+                    elif tag == W_TC:
+                        cell = {"paragraphs": [], "span": 1, "continue": False}
+                    elif tag == W_GRID_SPAN and cell is not None:
+                        cell["span"] = int(elem.get(W_VAL, "1"))
+                    elif tag == W_V_MERGE and cell is not None:
+                        cell["continue"] = elem.get(W_VAL, "continue") == "continue"
+                continue
+            
+            stack.pop()
+            parent = stack[-1].tag if stack else None
+            
+            if tag == W_T and paragraph_stack:
+                paragraph_stack[-1].append(elem.text or "")
+            elif tag in (W_TAB, W_BR, W_CR) and parent == W_R and paragraph_stack:
+                paragraph_stack[-1].append("\t" if tag == W_TAB else "\n")
+            elif tag == W_P:
+                text = "".join(paragraph_stack.pop())
+                # Paragraphs nested in text boxes are not part of the paragraph flow
+                if not paragraph_stack:
+                    if table_depth == 0:
+                        paragraphs.append(text)
+                    elif table_depth == 1 and cell is not None:
+                        cell["paragraphs"].append(text)
+            elif tag == W_TBL:
+                table_depth -= 1
+                if table_depth == 0:
+                    tables.append(rows)
+            elif table_depth == 1 and tag == W_TC:
+                row.append(cell)
+                cell = None
+            elif table_depth == 1 and tag == W_TR:
+                # Lay the cells out on the table grid
+                row_texts = []
+                for cell_data in row:
+                    for _ in range(cell_data["span"]):
+                        grid_index = len(row_texts)
+                        if cell_data["continue"] and grid_index < len(previous_row):
+                            row_texts.append(previous_row[grid_index])
+                        else:
+                            row_texts.append("\n".join(cell_data["paragraphs"]))
+                rows.append(row_texts)
+                previous_row = row_texts
+            
+            # Drop everything that has been read
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+    
+    return paragraphs, tables
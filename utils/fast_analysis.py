@@ -0,0 +1,253 @@
+import copy
+import threading
+from typing import Dict, List, Any
+import logging
+from utils.aggregation import RiskAggregator, department_risk_level, normalize_risk_level, risk_level_value
+from utils.classifier import risk_type_display_classifier
+from utils.gemini import analyze_risk_with_gemini, calculate_risk_score, generate_department_risk_matrix
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Number of key risks listed per department by the rules
+FAST_KEY_RISKS = 3
+
+# Value of analysis_source / department "source" for results built by the rules
+RULES_SOURCE = "rules"
+
+def generate_proposed_solution(obj):
+    """Generate a proposed solution for an objective if one doesn't exist"""
+    proposed_solution = obj.get("proposed_control", "")
+
+    # Generate a fallback proposed solution if none exists
+    if not proposed_solution:
+        # Generate detailed proposed solution based on the risk
+        what_can_go_wrong = obj.get("what_can_go_wrong", "").lower()
+        if "unauthorized access" in what_can_go_wrong:
+            proposed_solution = "Implement a comprehensive Identity and Access Management (IAM) solution with regular certification reviews. Establish segregation of duties matrix and enforce through automated controls. Implement privileged access management with just-in-time access."
+        elif "database" in what_can_go_wrong:
+            proposed_solution = "Implement database activity monitoring tools to track all changes. Establish formal change management procedures for schema and data modifications. Implement data loss prevention controls with automated alerting."
+        elif "accounting" in what_can_go_wrong or "financial" in what_can_go_wrong:
+            proposed_solution = "Implement automated validation rules for accounting entries with threshold-based approval workflows. Establish regular account reconciliation practices with management sign-off. Implement continuous monitoring dashboards for financial data integrity."
+        else:
+            proposed_solution = "Implement comprehensive documentation of control procedures with clear ownership. Establish regular control testing schedule with measurable effectiveness criteria. Enhance monitoring through automated dashboard reporting of control metrics."
+
+    return proposed_solution
+
+def _is_high_risk(obj: Dict[str, Any]) -> bool:
+    return normalize_risk_level(obj.get("risk_level", "")) == "High"
+
+def rule_based_department_analysis(dept: str, objectives: List[Dict[str, Any]], risk_categories: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Build a department analysis from the risk matrix and keyword rules
+
+    Args:
+        dept: Department name
+        objectives: Control objectives of the department
+        risk_categories: The department's row of the risk matrix
+
+    Returns:
+        Department analysis with the keys of a Gemini analysis and "source": RULES_SOURCE
+    """
+    level = department_risk_level(risk_categories)
+
+    # Key risks are the risk descriptions of the highest rated objectives
+    key_risks = []
+    for obj in sorted(objectives, key=lambda obj: risk_level_value(obj.get("risk_level", "")), reverse=True):
+        risk = (obj.get("what_can_go_wrong") or "").strip()
+        if risk and risk not in key_risks:
+            key_risks.append(risk)
+            if len(key_risks) == FAST_KEY_RISKS:
+                break
+
+    # Label each objective with all matching risk types, like the dashboard's keyword fallback
+    risk_types = {risk_type: [] for risk_type in risk_type_display_classifier.labels}
+    for obj in objectives:
+        text = f"{obj.get('objective', '')}\n{obj.get('what_can_go_wrong', '')}"
+        for risk_type in risk_type_display_classifier.classify(text):
+            risk_types[risk_type].append(obj.get("what_can_go_wrong") or obj.get("objective", ""))
+
+    high_count = sum(1 for obj in objectives if _is_high_risk(obj))
+    gap_count = sum(1 for obj in objectives if obj.get("is_gap"))
+
+    return {
+        "overall_risk_level": level,
+        "risk_categories": risk_categories,
+        "key_risks": key_risks,
+        "risk_types": risk_types,
+        "summary": f"Rule-based assessment of {len(objectives)} control objectives: {high_count} rated high risk and "
+                   f"{gap_count} with control gaps, giving a {level.lower()} overall risk level from the department risk matrix.",
+        "source": RULES_SOURCE
+    }
+
+def rule_based_recommendations(departments: List[str], department_risks: Dict[str, Dict[str, Any]],
+                               objectives_by_dept: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """
+    Recommend one action per department with control gaps or high risk objectives
+
+    Args:
+        departments: Departments in document order
+        department_risks: Department analyses
+        objectives_by_dept: Control objectives by department
+
+    Returns:
+        List of recommendations, high priority first
+    """
+    recommendations = []
+    for dept in departments:
+        objectives = objectives_by_dept.get(dept, [])
+        gaps = [obj for obj in objectives if obj.get("is_gap")]
+        high_risks = [obj for obj in objectives if _is_high_risk(obj)]
+        targets = gaps or high_risks
+        if not targets:
+            continue
+
+        if gaps:
+            title = f"Close {len(gaps)} control gap{'s' if len(gaps) != 1 else ''} in {dept}"
+        else:
+            title = f"Strengthen {len(high_risks)} high risk control{'s' if len(high_risks) != 1 else ''} in {dept}"
+
+        first = targets[0]
+        level = (department_risks.get(dept) or {}).get("overall_risk_level", "Medium")
+        recommendations.append({
+            "department": dept,
+            "title": title,
+            "description": generate_proposed_solution(first),
+            "impact": f"Reduced exposure to: {first.get('what_can_go_wrong') or first.get('objective', '')}",
+            "priority": "High" if level == "High" or high_risks else "Medium"
+        })
+
+    recommendations.sort(key=lambda rec: rec["priority"] != "High")
+    return recommendations
+
+def rule_based_analysis(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Assemble a complete analysis of processed data without calling the LLM
+
+    Department analyses, risk score, risk distribution and recommendations are
+    derived from the department risk matrix, the objectives' risk levels and
+    keyword rules, so the dashboard can render in milliseconds while the LLM
+    analysis runs (see BackgroundEnrichment).
+
+    Args:
+        data: Structured data from process_document
+
+    Returns:
+        Analyzed data shaped like the result of analyze_risk_with_gemini, with
+        "analysis_source": RULES_SOURCE. The input and its objectives are not modified.
+    """
+    enhanced_data = data.copy()
+    objectives = data.get("control_objectives", [])
+
+    objectives_by_dept = {}
+    for obj in objectives:
+        objectives_by_dept.setdefault(obj.get("department"), []).append(obj)
+
+    department_risks = data.get("department_risks") or generate_department_risk_matrix(data)
+    enhanced_dept_risks = {}
+    for dept, risk_data in department_risks.items():
+        if isinstance(risk_data, dict) and "key_risks" in risk_data:
+            # Already a full analysis
+            enhanced_dept_risks[dept] = risk_data
+        else:
+            risk_categories = risk_data if isinstance(risk_data, dict) else {}
+            enhanced_dept_risks[dept] = rule_based_department_analysis(dept, objectives_by_dept.get(dept, []), risk_categories)
+    enhanced_data["department_risks"] = enhanced_dept_risks
+
+    if "risk_distribution" not in enhanced_data:
+        aggregator = RiskAggregator(list(enhanced_dept_risks))
+        aggregator.add(objectives)
+        enhanced_data["risk_distribution"] = aggregator.risk_distribution
+
+    if "risk_score" not in enhanced_data:
+        enhanced_data["risk_score"] = calculate_risk_score(enhanced_data)
+
+    if "recommendations" not in enhanced_data:
+        departments = data.get("departments") or list(enhanced_dept_risks)
+        enhanced_data["recommendations"] = rule_based_recommendations(departments, enhanced_dept_risks, objectives_by_dept)
+
+    enhanced_data["analysis_source"] = RULES_SOURCE
+    return enhanced_data
+
+class BackgroundEnrichment:
+    """
+    LLM analysis of a document running behind its rule-based analysis
+
+    The rule-based analysis is built when the enrichment is created. The LLM
+    analysis then runs on a background thread, on a copy of the data, and
+    snapshot() returns the rule-based analysis with every department analysis
+    that has arrived so far, or the complete LLM analysis once it finishes.
+    If the LLM analysis fails, the rule-based sections remain.
+    """
+
+    def __init__(self, model, data: Dict[str, Any], collection=None, concurrency: int = None):
+        """
+        Args:
+            model: Gemini model instance
+            data: Structured data from process_document
+            collection: ChromaDB collection of the document's text chunks (optional)
+            concurrency: Maximum number of concurrent Gemini requests (optional)
+        """
+        self.fast = rule_based_analysis(data)
+        self.result = None
+        self.error = None
+        self._departments = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, args=(model, data, collection, concurrency),
+                                        name="llm-enrichment", daemon=True)
+
+    def start(self) -> "BackgroundEnrichment":
+        """Start the LLM analysis"""
+        self._thread.start()
+        return self
+
+    @property
+    def done(self) -> bool:
+        """Whether the LLM analysis has finished or failed"""
+        return self.result is not None or self.error is not None
+
+    def _run(self, model, data: Dict[str, Any], collection, concurrency: int):
+        try:
+            # The analysis updates objectives in place, while the rule-based analysis is still displayed
+            result = analyze_risk_with_gemini(model, copy.deepcopy(data), concurrency, collection,
+                                              on_department=self._on_department)
+            with self._lock:
+                self.result = result
+        except Exception as e:
+            logger.error(f"Background LLM analysis failed, keeping the rule-based analysis: {str(e)}")
+            with self._lock:
+                self.error = str(e) or type(e).__name__
+
+    def _on_department(self, dept: str, dept_risk: Dict[str, Any]):
+        if isinstance(dept_risk, dict):
+            with self._lock:
+                self._departments[dept] = dept_risk
+
+    def progress(self) -> tuple:
+        """
+        Returns:
+            Tuple of (departments analyzed by the LLM so far, departments of the rule-based analysis)
+        """
+        with self._lock:
+            return len(self._departments), len(self.fast["department_risks"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current best analysis
+
+        Returns:
+            The LLM analysis when finished, otherwise the rule-based analysis with
+            the department analyses received so far
+        """
+        with self._lock:
+            if self.result is not None:
+                return self.result
+            departments = dict(self._departments)
+
+        if not departments:
+            return self.fast
+
+        snapshot = self.fast.copy()
+        snapshot["department_risks"] = {**self.fast["department_risks"], **departments}
+        return snapshot
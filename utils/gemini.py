@@ -3,18 +3,99 @@ import google.generativeai as genai
 from typing import Dict, List, Any, Union
 import logging
 import json
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.aggregation import RiskAggregator, department_risk_level
+from utils.records import ControlObjective, ControlGap
+from utils.response_cache import response_cache
+from utils.db import retrieve_chunks, iter_text_chunks
+from utils.json_stream import JsonArrayStreamParser
+from utils.retry import CircuitBreaker, call_with_retry
+from utils.checkpoint import AnalysisCheckpoint
+from utils.revisions import RevisionStore
+from utils.telemetry import telemetry, OUTCOME_PARTIAL, OUTCOME_PARSE_ERROR, OUTCOME_CALL_ERROR
+from utils.llm_backends import LLMResponse, GeminiBackend, MockBackend, RecordReplayBackend
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def initialize_gemini():
+# Shared by every Gemini call so a failing API is not hammered by all worker threads
+gemini_breaker = CircuitBreaker()
+
+# Maximum number of Gemini requests in flight during department analysis
+ANALYSIS_CONCURRENCY = 8
+
+# Version of the analysis prompts and of the department analyses kept for
+# later document versions; bump it when either changes so stored analyses
+# of unchanged departments are not reused
+ANALYSIS_VERSION = "1"
+
+# Maximum estimated tokens of a department analysis prompt, and the most
+# objectives answered in one response (each solution takes ~80 output tokens)
+DEPARTMENT_PROMPT_TOKEN_BUDGET = 6000
+DEPARTMENT_MAX_OBJECTIVES = 40
+
+# Most departments packed into one analysis or recommendations prompt; small
+# departments share a call instead of paying a round trip each (1 disables packing)
+DEPARTMENT_PACK_MAX_DEPARTMENTS = 8
+
+# Maximum estimated tokens of raw workbook data sent in a single RAG prompt
+RAG_TOKEN_BUDGET = 16000
+
+# Maximum characters of document text per extraction prompt, and the overlap
+# between consecutive windows when the full text is analyzed
+RAW_TEXT_CHAR_BUDGET = 30000
+RAW_TEXT_WINDOW_OVERLAP = 1000
+
+# Control themes used to retrieve the relevant chunks of long documents
+RAW_DOCUMENT_THEMES = [
+    "control objective and control activity",
+    "what can go wrong, risk description and risk level",
+    "control gaps, deficiencies and missing controls",
+    "proposed controls and remediation",
+    "approval, authorization and segregation of duties",
+    "reconciliation, review and monitoring",
+    "user access and system controls",
+    "financial reporting, payments and accounting",
+    "fraud, override and misappropriation",
+    "compliance with policies, laws and regulations",
+    "department, area and process owner"
+]
+RETRIEVAL_TOP_K = 8
+
+def initialize_gemini(backend: str = None):
     """
     Initialize Gemini API client with the API key
     
+    The LLM_BACKEND environment variable (or the backend argument) selects the
+    backend: "gemini" (default), "mock" for an offline mock with LLM_MOCK_LATENCY
+    seconds of latency and an LLM_MOCK_FAILURE_RATE failure rate, "replay" to
+    serve responses recorded in LLM_REPLAY_DIR, or "record" to call Gemini and
+    record its responses there.
+    
+    Args:
+        backend: Backend name, overriding LLM_BACKEND
+    
     Returns:
-        Gemini API model instance
+        Gemini API model instance (an LLM backend)
     """
+    backend = backend or os.environ.get("LLM_BACKEND", "gemini")
+    if backend == "mock":
+        logger.info("Using the offline mock LLM backend")
+        return MockBackend(
+            latency=float(os.environ.get("LLM_MOCK_LATENCY", "0.5")),
+            failure_rate=float(os.environ.get("LLM_MOCK_FAILURE_RATE", "0"))
+        )
+    if backend == "replay":
+        logger.info("Replaying recorded LLM responses")
+        return RecordReplayBackend(os.environ.get("LLM_REPLAY_DIR"))
+    if backend not in ("gemini", "record"):
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    
     try:
         # Get API key from environment variable
         api_key = os.environ.get("GEMINI_API_KEY")
@@ -48,38 +129,240 @@ def initialize_gemini():
             "max_output_tokens": 8192,
         }
         
-        return model
+        if backend == "record":
+            logger.info("Recording Gemini responses")
+            return RecordReplayBackend(os.environ.get("LLM_REPLAY_DIR"), GeminiBackend(model), mode="record")
+        return GeminiBackend(model)
     
     except Exception as e:
         logger.error(f"Error initializing Gemini: {str(e)}")
         raise
 
-def analyze_risk_with_gemini(model, data: Dict[str, Any]) -> Dict[str, Any]:
+def generate_content(model, prompt: str, use_cache: bool = True, operation: str = "generate_content"):
+    """
+    Send a prompt to Gemini, reusing the cached response of an identical request
+    
+    The call's size, tokens, latency and cache use are recorded on the current
+    telemetry call; calls made outside one are recorded as a call of their own,
+    named by the operation argument.
+    A new response is only cached when that telemetry call ends with
+    OUTCOME_OK, so responses the caller could not parse, or parsed only in
+    part, are requested again next time.
+    
+    Args:
+        model: Gemini model instance
+        prompt: Prompt text
+        use_cache: Whether to consult and fill the response cache (response_cache.enabled
+            switches the cache off globally)
+        operation: Telemetry operation name used when no telemetry call is open
+        
+    Returns:
+        Response object with a .text attribute
+    """
+    call = telemetry.current_call()
+    if call is None:
+        with telemetry.call(operation):
+            return generate_content(model, prompt, use_cache)
+    
+    start = time.perf_counter()
+    model_name = getattr(model, "model_name", type(model).__name__)
+    key = None
+    if use_cache and response_cache.enabled:
+        key = response_cache.key(prompt, model_name, getattr(model, "generation_config", None))
+        cached_text = response_cache.get(key)
+        if cached_text is not None:
+            response = LLMResponse(cached_text)
+            call.record_response(model_name, prompt, cached_text, response_token_usage(prompt, response),
+                                 time.perf_counter() - start, cached=True)
+            return response
+    
+    response = call_with_retry(model.generate_content, prompt, breaker=gemini_breaker)
+    latency = time.perf_counter() - start
+    try:
+        response_text = response.text
+    except Exception:
+        # Blocked or empty responses are not cached
+        call.record_response(model_name, prompt, "", {"prompt_tokens": estimate_tokens(prompt)}, latency)
+        return response
+    call.record_response(model_name, prompt, response_text, response_token_usage(prompt, response), latency)
+    if key is not None:
+        call.on_success(lambda: response_cache.put(key, response_text))
+    return response
+
+def generate_content_stream(model, prompt: str, use_cache: bool = True, operation: str = "generate_content_stream"):
+    """
+    Stream a Gemini response, reusing the cached response of an identical request
+    
+    Like generate_content, the response is only cached once the telemetry call
+    ends with OUTCOME_OK.
+    
+    Args:
+        model: Gemini model instance
+        prompt: Prompt text
+        use_cache: Whether to consult and fill the response cache
+        operation: Telemetry operation name used when no telemetry call is open
+        
+    Yields:
+        Pieces of the response text as they arrive
+    """
+    call = telemetry.current_call()
+    if call is None:
+        with telemetry.call(operation) as call:
+            yield from _stream_content(model, prompt, use_cache, call)
+    else:
+        yield from _stream_content(model, prompt, use_cache, call)
+
+def _stream_content(model, prompt: str, use_cache: bool, call):
+    """Stream a response, recording it on a telemetry call"""
+    start = time.perf_counter()
+    model_name = getattr(model, "model_name", type(model).__name__)
+    key = None
+    if use_cache and response_cache.enabled:
+        key = response_cache.key(prompt, model_name, getattr(model, "generation_config", None))
+        cached_text = response_cache.get(key)
+        if cached_text is not None:
+            call.record_response(model_name, prompt, cached_text, response_token_usage(prompt, LLMResponse(cached_text)),
+                                 time.perf_counter() - start, cached=True)
+            yield cached_text
+            return
+    
+    response = call_with_retry(model.generate_content, prompt, stream=True, breaker=gemini_breaker)
+    
+    pieces = []
+    first_chunk_latency = None
+    for chunk in response:
+        try:
+            text = chunk.text
+        except Exception:
+            # Chunks without text (e.g. safety metadata only)
+            continue
+        if first_chunk_latency is None:
+            first_chunk_latency = time.perf_counter() - start
+        pieces.append(text)
+        yield text
+    
+    # Gemini reports the usage of a streamed response once it is complete
+    streamed = LLMResponse("".join(pieces))
+    streamed.usage_metadata = getattr(response, "usage_metadata", None)
+    call.record_response(model_name, prompt, streamed.text, response_token_usage(prompt, streamed),
+                         time.perf_counter() - start, first_chunk_latency=first_chunk_latency)
+    if key is not None and pieces:
+        call.on_success(lambda: response_cache.put(key, streamed.text))
+
+class ProgressRelay:
+    """
+    Delivers progress callbacks on the thread that created the relay
+    
+    Calls made from worker threads are queued and replayed by flush(), which
+    map_concurrently runs on the calling thread while it waits. This lets UI
+    callbacks (e.g. Streamlit) run where the UI framework expects them.
+    """
+    
+    def __init__(self, callback):
+        self.callback = callback
+        self._owner = threading.get_ident()
+        self._queue = queue.Queue()
+    
+    def __call__(self, *args):
+        if threading.get_ident() == self._owner:
+            self.callback(*args)
+        else:
+            self._queue.put(args)
+    
+    def flush(self):
+        """Run the callbacks queued by worker threads"""
+        while True:
+            try:
+                args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self.callback(*args)
+
+def map_concurrently(func, items: List[Any], concurrency: int = None, relay: ProgressRelay = None) -> List[Any]:
+    """
+    Apply a function to every item on a thread pool
+    
+    Args:
+        func: Function called with each item; typically wraps a Gemini request
+        items: Items to process
+        concurrency: Maximum number of calls running at once (defaults to ANALYSIS_CONCURRENCY)
+        relay: Progress relay flushed on the calling thread while the calls run
+        
+    Returns:
+        Results in the same order as the items, regardless of completion order
+    """
+    items = list(items)
+    concurrency = concurrency or ANALYSIS_CONCURRENCY
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        # Each call runs in a copy of the caller's context, carrying the telemetry run
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if relay is not None:
+                relay.flush()
+        return [future.result() for future in futures]
+
+def analyze_risk_with_gemini(model, data: Dict[str, Any], concurrency: int = None, collection=None, on_department=None) -> Dict[str, Any]:
     """
     Analyze RCM data with Gemini, focusing on departmental risks
     
     Args:
         model: Gemini model instance
         data: Structured data from document processing
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        collection: ChromaDB collection holding the document's text chunks, used to
+            retrieve the relevant parts of long PDF/DOCX documents
+        on_department: Optional callback(department, department_risk) called, on the
+            calling thread, as soon as each department's analysis is available.
+            Responses are then streamed so departments arrive before the full answer.
         
     Returns:
         Enhanced data with Gemini's analysis
+    
+    Every Gemini call is retried with backoff. Completed units are checkpointed
+    per document, so after a failure re-running the analysis of the same file
+    only repeats the units that failed. Department analyses are also kept by
+    content fingerprint, so analyzing a revised version of a document only
+    sends the departments that changed.
+    
+    Every call is recorded by utils.telemetry, and a summary table of the
+    run's calls is logged when the analysis ends.
     """
+    with telemetry.run(data.get("metadata", {}).get("file_name", "analysis")) as run:
+        try:
+            return _analyze_risk_with_gemini(model, data, concurrency, collection, on_department)
+        finally:
+            if run.calls:
+                logger.info("\n" + run.format_summary())
+
+def _analyze_risk_with_gemini(model, data: Dict[str, Any], concurrency: int = None, collection=None, on_department=None) -> Dict[str, Any]:
+    """Run the analysis of analyze_risk_with_gemini"""
     try:
         logger.info("Starting Risk Control Matrix analysis with Gemini")
         enhanced_data = data.copy()
+        relay = ProgressRelay(on_department) if on_department else None
+        checkpoint = AnalysisCheckpoint.for_data(data, model)
+        # Failed departments are only known through the checkpoint
+        revisions = RevisionStore.for_model(model, ANALYSIS_VERSION) if checkpoint is not None else None
         
         # First, check if we have raw data to use for RAG
         if "raw_data" in data and data["raw_data"]:
             logger.info(f"Using RAG approach with {len(data['raw_data'])} sheets of raw data")
-            return analyze_with_rag(model, data)
+            enhanced_data = analyze_with_rag(model, data, concurrency=concurrency, on_department=relay, checkpoint=checkpoint,
+                                             revisions=revisions)
         # If this is raw text (from PDF or DOCX), we need to perform structured extraction
         elif "raw_text" in data and data["raw_text"]:
             logger.info("Processing raw text document")
-            return analyze_raw_document(model, data)
+            enhanced_data = analyze_raw_document(model, data, collection, concurrency, on_department=relay, checkpoint=checkpoint,
+                                                 revisions=revisions)
         # For structured data without raw_data, enhance it with departmental risk analysis
         else:
             logger.info("Using standard analysis for structured data")
+            revision = revisions.revision(data) if revisions is not None else None
             # Check if we need to generate department_risks structures
             if not data.get("department_risks"):
                 logger.info("No department_risks found in processed data, generating...")
@@ -89,32 +372,38 @@ def analyze_risk_with_gemini(model, data: Dict[str, Any]) -> Dict[str, Any]:
             department_risks = enhanced_data.get("department_risks", {})
             enhanced_dept_risks = {}
             
+            # Group objectives by department once instead of filtering per department
+            objectives_by_dept = {}
+            for obj in data.get("control_objectives", []):
+                objectives_by_dept.setdefault(obj.get("department"), []).append(obj)
+            
+            pending = []
             for dept, risk_data in department_risks.items():
                 # Check if it's just risk categories or already a full analysis
                 if isinstance(risk_data, dict) and all(key in risk_data for key in ["overall_risk_level", "risk_categories", "key_risks", "summary"]):
                     # Already a full analysis
                     enhanced_dept_risks[dept] = risk_data
+                elif revision is not None and dept in revision.reused:
+                    # Unchanged since an earlier version of the document
+                    revision.restore_objectives(dept, objectives_by_dept.get(dept, []))
+                    enhanced_dept_risks[dept] = revision.reused[dept]["department_risk"]
+                    if relay is not None:
+                        relay(dept, enhanced_dept_risks[dept])
                 else:
                     # Just risk categories, generate full analysis
                     risk_categories = risk_data if isinstance(risk_data, dict) else {}
                     if risk_categories:
-                        # Calculate overall risk level based on category values
-                        category_values = list(risk_categories.values())
-                        avg_risk = sum(category_values) / len(category_values) if category_values else 0
-                        
-                        if avg_risk >= 3.5:
-                            overall_risk = "High"
-                        elif avg_risk >= 2.5:
-                            overall_risk = "Medium"
-                        else:
-                            overall_risk = "Low"
-                        
-                        # Get department-specific objectives
-                        dept_objectives = [obj for obj in data.get("control_objectives", []) if obj.get("department") == dept]
-                        
-                        # Use Gemini to analyze this department
-                        dept_analysis = analyze_department(model, dept, dept_objectives, risk_categories)
-                        enhanced_dept_risks[dept] = dept_analysis
+                        # Reserve the slot so departments keep their original order
+                        enhanced_dept_risks[dept] = None
+                        pending.append((dept, objectives_by_dept.get(dept, []), risk_categories))
+            
+            # Use Gemini to analyze the departments concurrently; each call only
+            # touches its own department's objectives
+            if pending:
+                logger.info(f"Analyzing {len(pending)} departments with up to {concurrency or ANALYSIS_CONCURRENCY} concurrent requests")
+                analyses = analyze_departments(model, pending, checkpoint, concurrency, relay)
+                for dept, dept_analysis in analyses.items():
+                    enhanced_dept_risks[dept] = dept_analysis
             
             enhanced_data["department_risks"] = enhanced_dept_risks
             
@@ -124,102 +413,131 @@ def analyze_risk_with_gemini(model, data: Dict[str, Any]) -> Dict[str, Any]:
             
             # Generate recommendations if not present
             if "recommendations" not in enhanced_data:
-                enhanced_data["recommendations"] = generate_department_recommendations(model, enhanced_data)
+                enhanced_data["recommendations"] = generate_department_recommendations(
+                    model, enhanced_data, concurrency, checkpoint, reused=revision.recommendations() if revision is not None else None
+                )
             
-            return enhanced_data
+            if revision is not None:
+                revision.record(enhanced_data, checkpoint.failed_departments)
+        
+        if checkpoint is not None:
+            if checkpoint.failed_units:
+                logger.warning(f"{len(checkpoint.failed_units)} analysis units used fallback results; "
+                               f"re-analyzing this file retries only those units")
+            else:
+                checkpoint.clear()
+        
+        return enhanced_data
     
     except Exception as e:
         logger.error(f"Error analyzing data with Gemini: {str(e)}")
         raise
 
-def analyze_with_rag(model, data: Dict[str, Any]) -> Dict[str, Any]:
+def analyze_with_rag(model, data: Dict[str, Any], token_budget: int = None, concurrency: int = None, on_department=None,
+                     checkpoint: AnalysisCheckpoint = None, revisions: RevisionStore = None) -> Dict[str, Any]:
     """
     True RAG approach - send raw data directly to Gemini for comprehensive analysis
-    """
-    enhanced_data = data.copy()
-    
-    # Format raw data into a structured format for the LLM
-    raw_data_text = format_raw_data(data["raw_data"])
-    
-    # Get list of departments to analyze
-    departments = data.get("departments", [])
-    departments_str = ", ".join(departments) if departments else "All departments identified in the Area column"
     
-    # Prepare the prompt for the LLM to analyze the raw data
-    prompt = f"""
-    You are a Risk Control Matrix (RCM) analysis expert. I will provide you with data from an uploaded RCM file.
+    Workbooks whose raw data exceeds the token budget are split by department
+    (or sheet) into several prompts that are analyzed concurrently, and the
+    partial results are merged.
     
-    Your task is to analyze all departments in the file, especially focusing on these specific departments:
-    {departments_str}
+    With a revision store, departments whose rows are unchanged since an
+    earlier version of the workbook keep their stored analysis and only the
+    rows of changed departments are sent.
     
-    For each department, you must:
-    1. Analyze the control objectives and risks
-    2. Classify risks into these categories: Operational, Financial, Fraud, Financial Fraud, Operational Fraud
-    3. Identify control gaps
-    4. Provide recommendations
-
-    In the RCM file, departments are shown in the "Area" column, which includes values like "Employee Master Maintenance", "Attendance & Payroll Processing", etc.
+    Args:
+        model: Gemini model instance
+        data: Structured data with raw_data from process_excel
+        token_budget: Maximum estimated tokens of raw data per prompt (defaults to RAG_TOKEN_BUDGET)
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        on_department: Optional callback(department, department_risk); when given, responses
+            are streamed and each department is reported as soon as it is complete
+        checkpoint: Checkpoint of completed partitions (optional)
+        revisions: Department analyses of earlier document versions (optional)
+        
+    Returns:
+        Enhanced data with Gemini's analysis
+    """
+    if on_department is not None and not isinstance(on_department, ProgressRelay):
+        on_department = ProgressRelay(on_department)
+    if revisions is None:
+        return _analyze_raw_data(model, data, token_budget, concurrency, on_department, checkpoint)
     
-    Here is the raw data from the RCM document:
+    raw_rows, shared_rows = raw_rows_by_department(data["raw_data"])
+    revision = revisions.revision(data, raw_rows, shared_rows)
+    if revision.reused and not all(dept in raw_rows for dept in revision.changed):
+        # The changed departments' rows cannot be told apart, so send everything
+        logger.info("Changed departments not found in the raw data, analyzing the whole workbook")
+        revision.reused = {}
+        revision.changed = list(revision.fingerprints)
     
-    {raw_data_text}
+    if not revision.reused:
+        enhanced_data = _analyze_raw_data(model, data, token_budget, concurrency, on_department, checkpoint)
+    else:
+        for dept, entry in revision.reused.items():
+            if on_department is not None:
+                on_department(dept, entry["department_risk"])
+        
+        if revision.changed:
+            changed_data = dict(data, raw_data=filter_raw_data(data["raw_data"], revision.changed), departments=revision.changed)
+            enhanced_data = _analyze_raw_data(model, changed_data, token_budget, concurrency, on_department, checkpoint)
+            enhanced_data.update(raw_data=data["raw_data"], departments=data.get("departments", []))
+        else:
+            enhanced_data = dict(data, department_risks={}, recommendations=[])
+        
+        # Add the unchanged departments in document order
+        order = {dept: i for i, dept in enumerate(revision.fingerprints)}
+        department_risks = {dept: entry["department_risk"] for dept, entry in revision.reused.items()}
+        department_risks.update(enhanced_data.get("department_risks") or {})
+        enhanced_data["department_risks"] = {
+            dept: department_risks[dept] for dept in sorted(department_risks, key=lambda dept: order.get(dept, len(order)))
+        }
+        
+        gaps = list(enhanced_data.get("gaps", []))
+        recommendations = list(enhanced_data.get("recommendations") or [])
+        titles = {str(rec.get("title", "")).strip().lower() for rec in recommendations}
+        for entry in revision.reused.values():
+            gaps.extend(entry["gaps"])
+            for rec in entry["recommendations"] + entry["overall_recommendations"]:
+                title = str(rec.get("title", "")).strip().lower()
+                if title and title in titles:
+                    continue
+                titles.add(title)
+                recommendations.append(rec)
+        enhanced_data["gaps"] = gaps
+        enhanced_data["recommendations"] = recommendations
     
-    Analyze ALL departments found in the data. For each department, provide a comprehensive analysis in this JSON format:
+    revision.record(enhanced_data, checkpoint.failed_departments if checkpoint is not None else ())
+    return enhanced_data
+
+def _analyze_raw_data(model, data: Dict[str, Any], token_budget: int = None, concurrency: int = None, on_department=None,
+                      checkpoint: AnalysisCheckpoint = None) -> Dict[str, Any]:
+    """Run the RAG analysis over all of data["raw_data"]"""
+    enhanced_data = data.copy()
     
-    {{
-        "departments": [
-            {{
-                "name": "Department Name",
-                "overall_risk_level": "High/Medium/Low",
-                "key_risks": ["Risk 1", "Risk 2", ...],
-                "risk_analysis": {{
-                    "Operational": ["Specific operational risks"],
-                    "Financial": ["Specific financial risks"],
-                    "Fraud": ["Specific fraud risks"],
-                    "Financial Fraud": ["Specific financial fraud risks"],
-                    "Operational Fraud": ["Specific operational fraud risks"]
-                }},
-                "control_gaps": [
-                    {{
-                        "gap_title": "Gap description",
-                        "impact": "Impact description",
-                        "recommendation": "Recommendation to address gap"
-                    }}
-                ],
-                "summary": "Brief summary of department's risk profile"
-            }}
-        ],
-        "overall_recommendations": [
-            {{
-                "title": "Recommendation title",
-                "priority": "High/Medium/Low",
-                "description": "Detailed recommendation",
-                "impact": "Expected impact of implementation"
-            }}
-        ]
-    }}
+    # Get list of departments to analyze
+    departments = data.get("departments", [])
     
-    IMPORTANT: You MUST analyze ALL departments found in the RCM data, especially those in the Area column like "Employee Master Maintenance", "Attendance & Payroll Processing", "Payroll and Personnel", "Leave Management", and "Separation". Do not focus on only one department.
+    # Split the raw data into prompts that fit the token budget
+    partitions = partition_raw_data(data["raw_data"], token_budget or RAG_TOKEN_BUDGET)
+    if len(partitions) > 1:
+        logger.info(f"Raw data exceeds the token budget, analyzing it in {len(partitions)} partitions")
     
-    Be comprehensive, but focus on practical, actionable insights. Identify specific risks rather than general statements.
-    """
+    analyses = map_concurrently(
+        lambda partition: _rag_analysis(model, partition, departments, whole=len(partitions) == 1, on_department=on_department, checkpoint=checkpoint),
+        partitions,
+        concurrency,
+        on_department
+    )
+    analyses = [analysis for analysis in analyses if analysis is not None]
     
-    # Get response from Gemini
-    logger.info("Sending RAG prompt to Gemini")
-    response = model.generate_content(prompt)
+    if not analyses:
+        # Fall back to standard analysis
+        return analyze_structured_data(model, data, checkpoint)
     
-    # Extract JSON from the response
     try:
-        response_text = response.text
-        # Check if response has JSON code blocks and extract them
-        if "```json" in response_text:
-            json_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            json_text = response_text.split("```")[1].strip()
-        else:
-            json_text = response_text.strip()
-        
-        rag_analysis = json.loads(json_text)
+        rag_analysis = merge_rag_analyses(analyses)
         logger.info(f"Successfully parsed RAG analysis results: {len(rag_analysis.get('departments', []))} departments")
         
         # Transform the RAG analysis into our structured format
@@ -231,29 +549,17 @@ def analyze_with_rag(model, data: Dict[str, Any]) -> Dict[str, Any]:
             dept_name = dept_data.get("name", "Unknown")
             
             # Create department risk entry
-            enhanced_data["department_risks"][dept_name] = {
-                "overall_risk_level": dept_data.get("overall_risk_level", "Medium"),
-                "key_risks": dept_data.get("key_risks", []),
-                "risk_types": dept_data.get("risk_analysis", {}),
-                "summary": dept_data.get("summary", ""),
-                "risk_categories": {
-                    "Financial": 4 if dept_data.get("risk_analysis", {}).get("Financial", []) else 2,
-                    "Operational": 4 if dept_data.get("risk_analysis", {}).get("Operational", []) else 2,
-                    "Compliance": 3,  # Default
-                    "Strategic": 3,   # Default
-                    "Technological": 3  # Default
-                }
-            }
+            enhanced_data["department_risks"][dept_name] = rag_department_risk(dept_data)
             
             # Add gaps
             for gap in dept_data.get("control_gaps", []):
-                enhanced_data["gaps"].append({
+                enhanced_data["gaps"].append(ControlGap({
                     "department": dept_name,
                     "gap_title": gap.get("gap_title", ""),
                     "description": gap.get("gap_title", ""),
                     "risk_impact": gap.get("impact", ""),
                     "proposed_solution": gap.get("recommendation", "")
-                })
+                }))
         
         # Add overall recommendations
         for rec in rag_analysis.get("overall_recommendations", []):
@@ -270,6 +576,8 @@ def analyze_with_rag(model, data: Dict[str, Any]) -> Dict[str, Any]:
             missing_depts = [d for d in departments if d not in enhanced_data["department_risks"]]
             for dept in missing_depts:
                 logger.warning(f"Department {dept} was missing from analysis, adding default")
+                if checkpoint is not None:
+                    checkpoint.mark_failed(department=dept)
                 enhanced_data["department_risks"][dept] = {
                     "overall_risk_level": "Medium",
                     "key_risks": [f"Need to analyze {dept} department risks"],
@@ -292,267 +600,894 @@ def analyze_with_rag(model, data: Dict[str, Any]) -> Dict[str, Any]:
         
         return enhanced_data
         
-    except Exception as json_error:
-        logger.error(f"Error extracting JSON from Gemini RAG response: {str(json_error)}")
-        logger.debug(f"Raw response: {response.text}")
+    except Exception as e:
+        logger.error(f"Error processing Gemini RAG analysis: {str(e)}")
         # Fall back to standard analysis
-        return analyze_structured_data(model, data)
+        return analyze_structured_data(model, data, checkpoint)
 
-def format_raw_data(raw_data):
-    """Format raw data from Excel sheets into a structured text representation"""
-    formatted_text = ""
-    
-    for sheet_data in raw_data:
-        sheet_name = sheet_data.get("sheet_name", "Unknown Sheet")
-        rows = sheet_data.get("rows", [])
-        
-        formatted_text += f"\n=== SHEET: {sheet_name} ===\n\n"
-        
-        # If there are rows, format them
-        if rows:
-            # Get columns from first row
-            if rows:
-                columns = list(rows[0].keys())
-                formatted_text += "| " + " | ".join(columns) + " |\n"
-                formatted_text += "| " + " | ".join(["-" * len(col) for col in columns]) + " |\n"
-                
-                # Add rows
-                for row in rows:
-                    formatted_text += "| " + " | ".join([str(row.get(col, "")) for col in columns]) + " |\n"
-        
-        formatted_text += "\n"
-    
-    return formatted_text
+def rag_department_risk(dept_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a department of the RAG analysis into a department_risks entry"""
+    return {
+        "overall_risk_level": dept_data.get("overall_risk_level", "Medium"),
+        "key_risks": dept_data.get("key_risks", []),
+        "risk_types": dept_data.get("risk_analysis", {}),
+        "summary": dept_data.get("summary", ""),
+        "risk_categories": {
+            "Financial": 4 if dept_data.get("risk_analysis", {}).get("Financial", []) else 2,
+            "Operational": 4 if dept_data.get("risk_analysis", {}).get("Operational", []) else 2,
+            "Compliance": 3,  # Default
+            "Strategic": 3,   # Default
+            "Technological": 3  # Default
+        }
+    }
 
-def analyze_structured_data(model, data: Dict[str, Any]) -> Dict[str, Any]:
-    """Analyze already structured data (fallback if RAG fails)"""
-    enhanced_data = data.copy()
-    
-    # Generate department risk matrix if not present
-    if not data.get("department_risks"):
-        department_risks = generate_department_risk_matrix(data)
-        enhanced_data["department_risks"] = department_risks
+def _rag_analysis(model, raw_data: List[Dict[str, Any]], departments: List[str], whole: bool = True, on_department=None,
+                  checkpoint: AnalysisCheckpoint = None) -> Union[Dict[str, Any], None]:
+    """
+    Run the RAG prompt over (part of) the raw data
     
-    # Generate recommendations
-    enhanced_data["recommendations"] = generate_department_recommendations(model, data)
+    Args:
+        model: Gemini model instance
+        raw_data: Sheets, or a partition of them, to analyze
+        departments: Departments of the whole document
+        whole: Whether raw_data is the complete document; partitions only list their own departments
+        on_department: Optional callback(department, department_risk); streams the response
+            and reports each department as soon as it is complete
+        checkpoint: Checkpoint of completed partitions (optional)
+        
+    Returns:
+        Parsed analysis with departments and overall_recommendations, or None if the response could not be parsed
+    """
+    # Format raw data into a structured format for the LLM
+    raw_data_text = format_raw_data(raw_data)
     
-    # Calculate risk score
-    enhanced_data["risk_score"] = calculate_risk_score(data)
+    if not whole:
+        departments = [dept for dept in departments if dept in raw_data_text]
+    departments_str = ", ".join(departments) if departments else "All departments identified in the Area column"
     
-    return enhanced_data
-
-def analyze_raw_document(model, data: Dict[str, Any]) -> Dict[str, Any]:
-    """Process raw text documents using Gemini"""
-    enhanced_data = data.copy()
+    # Prepare the prompt for the LLM to analyze the raw data
+    prompt = f"""
+    You are a Risk Control Matrix (RCM) analysis expert. I will provide you with data from an uploaded RCM file.
     
-    # Prepare the prompt for Gemini
-    if "extracted_text" in data:
-        extracted_text = data["extracted_text"]
-        
-        # Truncate if too long and warn
-        if len(extracted_text) > 30000:
-            logger.warning(f"Extracted text is very long ({len(extracted_text)} chars). Truncating for Gemini analysis.")
-            extracted_text = extracted_text[:30000] + "..."
-        
-        prompt = f"""
-        You are a Risk Assessment and Control expert. I will provide you with text from a Risk Control Matrix (RCM) document.
-        
-        Please analyze this text and extract the following structured information, with special focus on departmental risks:
-        
-        1. Departments: Identify all departments mentioned in the document.
-        2. Control Objectives: For each department, identify the main control objectives.
-        3. What Can Go Wrong: For each control objective, identify what could go wrong if the control is not implemented.
-        4. Risk Levels: Identify the risk level (High, Medium, Low) for each control objective.
-        5. Control Activities: Identify the control activities in place to address each risk.
-        6. Gaps: Identify any control or design gaps mentioned in the document.
-        7. Proposed Controls: Identify any proposed controls to address the gaps.
-        8. Departmental Risk Analysis: Provide a risk assessment for each department, including risk categories and overall risk level.
-        
-        Please be comprehensive and detailed in your analysis. Here is the text:
-        
-        {extracted_text}
-        
-        Respond with ONLY a JSON object containing the extracted structured information. The format should be:
-        {{
-            "departments": ["string"],
-            "control_objectives": [
-                {{
-                    "department": "string",
-                    "objective": "string",
-                    "what_can_go_wrong": "string",
-                    "risk_level": "string",
-                    "control_activities": "string",
-                    "is_gap": boolean,
-                    "gap_details": "string",
-                    "proposed_control": "string"
-                }}
-            ],
-            "gaps": [
-                {{
-                    "department": "string",
-                    "control_objective": "string",
-                    "gap_title": "string",
-                    "description": "string",
-                    "risk_impact": "string",
-                    "proposed_solution": "string"
-                }}
-            ],
-            "department_risks": {{
-                "Department1": {{
-                    "overall_risk_level": "string",
-                    "risk_categories": {{
-                        "Financial": number,
-                        "Operational": number,
-                        "Compliance": number,
-                        "Strategic": number,
-                        "Technological": number
-                    }},
-                    "key_risks": ["string"],
-                    "summary": "string"
-                }}
-            }},
-            "risk_distribution": {{"Low": number, "Medium": number, "High": number}},
-            "total_controls": number,
-            "control_gaps": number
-        }}
-        """
-        
-        # Get response from Gemini
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from the response
-        try:
-            response_text = response.text
-            # Check if response has JSON code blocks and extract them
-            if "```json" in response_text:
-                json_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                json_text = response_text.split("```")[1].strip()
-            else:
-                json_text = response_text.strip()
-            
-            extracted_data = json.loads(json_text)
-            
-            # Update the enhanced data with extracted information
-            enhanced_data.update(extracted_data)
-            enhanced_data["raw_text"] = False  # Mark as processed
-            
-            # Additional post-processing
-            enhanced_data["risk_score"] = calculate_risk_score(extracted_data)
-            enhanced_data["recommendations"] = generate_department_recommendations(model, extracted_data)
-            
-        except Exception as json_error:
-            logger.error(f"Error extracting JSON from Gemini response: {str(json_error)}")
-            logger.debug(f"Raw response: {response.text}")
-            raise
+    Your task is to analyze all departments in the file, especially focusing on these specific departments:
+    {departments_str}
     
-    return enhanced_data
+    For each department, you must:
+    1. Analyze the control objectives and risks
+    2. Classify risks into these categories: Operational, Financial, Fraud, Financial Fraud, Operational Fraud
+    3. Identify control gaps
+    4. Provide recommendations
 
-def generate_department_risk_matrix(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
-    """Generate a basic department risk matrix from structured data"""
-    departments = data.get("departments", [])
-    if not departments:
-        return {}
+    In the RCM file, departments are shown in the "Area" column, which includes values like "Employee Master Maintenance", "Attendance & Payroll Processing", etc.
     
-    risk_categories = ["Financial", "Operational", "Compliance", "Strategic", "Technological"]
-    department_risks = {dept: {cat: 0 for cat in risk_categories} for dept in departments}
+    Here is the raw data from the RCM document:
     
-    # Populate risk values based on control objectives
-    for obj in data.get("control_objectives", []):
-        dept = obj.get("department", "")
-        if not dept or dept not in departments:
-            continue
-            
-        # Set risk level value
-        risk_text = obj.get("risk_level", "").lower()
-        if risk_text in ['high', 'h', 'critical', 'severe']:
-            risk_level_value = 4
-        elif risk_text in ['medium', 'm', 'mod', 'moderate']:
-            risk_level_value = 3
-        else:
-            risk_level_value = 2
-            
-        # Assign to categories based on keywords
-        objective_text = obj.get("objective", "").lower()
-        what_can_go_wrong = obj.get("what_can_go_wrong", "").lower()
-        combined_text = f"{objective_text} {what_can_go_wrong}"
-        
-        # Financial risks
-        if any(term in combined_text for term in ['financ', 'account', 'budget', 'cost', 'expense', 'revenue', 'payment', 'tax', 'audit']):
-            department_risks[dept]["Financial"] = max(department_risks[dept]["Financial"], risk_level_value)
-            
-        # Operational risks
-        if any(term in combined_text for term in ['operat', 'process', 'procedur', 'workflow', 'efficien', 'product', 'service', 'delivery']):
-            department_risks[dept]["Operational"] = max(department_risks[dept]["Operational"], risk_level_value)
-            
-        # Compliance risks
-        if any(term in combined_text for term in ['comply', 'compliance', 'regulat', 'legal', 'law', 'policy', 'requirement', 'standard']):
-            department_risks[dept]["Compliance"] = max(department_risks[dept]["Compliance"], risk_level_value)
-            
-        # Strategic risks
-        if any(term in combined_text for term in ['strateg', 'goal', 'objective', 'mission', 'vision', 'plan', 'market', 'competi']):
-            department_risks[dept]["Strategic"] = max(department_risks[dept]["Strategic"], risk_level_value)
-            
-        # Technological risks
-        if any(term in combined_text for term in ['tech', 'system', 'data', 'secur', 'access', 'software', 'hardware', 'it ', 'cyber']):
-            department_risks[dept]["Technological"] = max(department_risks[dept]["Technological"], risk_level_value)
+    {raw_data_text}
     
-    # Ensure all departments have at least some risk level for each category
-    for dept in departments:
-        for cat in risk_categories:
-            if department_risks[dept][cat] == 0:
-                department_risks[dept][cat] = 1  # Set minimum risk level
+    Analyze ALL departments found in the data. For each department, provide a comprehensive analysis in this JSON format:
     
-    return department_risks
-
-def analyze_department(model, dept: str, objectives: List[Dict[str, Any]], risk_categories: Dict[str, int]) -> Dict[str, Any]:
-    """Use Gemini to analyze a specific department"""
+    {{
+        "departments": [
+            {{
+                "name": "Department Name",
+                "overall_risk_level": "High/Medium/Low",
+                "key_risks": ["Risk 1", "Risk 2", ...],
+                "risk_analysis": {{
+                    "Operational": ["Specific operational risks"],
+                    "Financial": ["Specific financial risks"],
+                    "Fraud": ["Specific fraud risks"],
+                    "Financial Fraud": ["Specific financial fraud risks"],
+                    "Operational Fraud": ["Specific operational fraud risks"]
+                }},
+                "control_gaps": [
+                    {{
+                        "gap_title": "Gap description",
+                        "impact": "Impact description",
+                        "recommendation": "Recommendation to address gap"
+                    }}
+                ],
+                "summary": "Brief summary of department's risk profile"
+            }}
+        ],
+        "overall_recommendations": [
+            {{
+                "title": "Recommendation title",
+                "priority": "High/Medium/Low",
+                "description": "Detailed recommendation",
+                "impact": "Expected impact of implementation"
+            }}
+        ]
+    }}
+    
+    IMPORTANT: You MUST analyze ALL departments found in the RCM data, especially those in the Area column like "Employee Master Maintenance", "Attendance & Payroll Processing", "Payroll and Personnel", "Leave Management", and "Separation". Do not focus on only one department.
+    
+    Be comprehensive, but focus on practical, actionable insights. Identify specific risks rather than general statements.
+    """
+    
+    unit = AnalysisCheckpoint.unit_key("rag", prompt)
+    if checkpoint is not None and checkpoint.get(unit) is not None:
+        rag_analysis = checkpoint.get(unit)
+        if on_department is not None:
+            for dept_data in rag_analysis.get("departments", []):
+                on_department(dept_data.get("name", "Unknown"), rag_department_risk(dept_data))
+        return rag_analysis
+    
+    # Get response from Gemini
+    logger.info("Sending RAG prompt to Gemini")
     try:
-        # Format objectives for the prompt
-        objectives_text = ""
-        for i, obj in enumerate(objectives[:5]):  # Limit to 5 for brevity
-            objectives_text += f"{i+1}. Objective: {obj.get('objective', '')}\n"
-            objectives_text += f"   What Can Go Wrong: {obj.get('what_can_go_wrong', '')}\n"
-            objectives_text += f"   Risk Level: {obj.get('risk_level', '')}\n"
-            objectives_text += f"   Control Activities: {obj.get('control_activities', '')}\n"
-            if obj.get("is_gap", False):
-                objectives_text += f"   Gap: {obj.get('gap_details', '')}\n"
-            objectives_text += "\n"
+        rag_analysis, complete = _request_rag_analysis(model, prompt, on_department, departments,
+                                                       use_cache=checkpoint is None or not checkpoint.failed_before(unit))
+    except Exception as e:
+        logger.error(f"Error getting Gemini RAG analysis: {str(e)}")
+        rag_analysis, complete = None, False
+    
+    if checkpoint is not None:
+        if complete:
+            checkpoint.save(unit, rag_analysis)
+        else:
+            checkpoint.mark_failed(unit)
+    return rag_analysis
+
+def _request_rag_analysis(model, prompt: str, on_department=None, departments: List[str] = None,
+                          use_cache: bool = True) -> tuple:
+    """
+    Send a RAG prompt to Gemini and parse the response
+    
+    Returns:
+        Tuple of (parsed analysis or None, whether the response was complete)
+    """
+    with telemetry.call("rag_analysis", ", ".join(departments or [])) as call:
+        if on_department is None:
+            response_text = generate_content(model, prompt, use_cache).text
+            streamed_departments = []
+        else:
+            # Report each department as soon as its JSON object is complete
+            parser = JsonArrayStreamParser("departments")
+            pieces, streamed_departments = [], []
+            for piece in generate_content_stream(model, prompt, use_cache):
+                pieces.append(piece)
+                for dept_data in parser.feed(piece):
+                    if isinstance(dept_data, dict):
+                        streamed_departments.append(dept_data)
+                        on_department(dept_data.get("name", "Unknown"), rag_department_risk(dept_data))
+            response_text = "".join(pieces)
+        
+        # Extract JSON from the response
+        try:
+            return json.loads(extract_json_text(response_text)), True
+        except Exception as json_error:
+            logger.error(f"Error extracting JSON from Gemini RAG response: {str(json_error)}")
+            logger.debug(f"Raw response: {response_text}")
+            call.error = f"{type(json_error).__name__}: {str(json_error)[:200]}"
+            if streamed_departments:
+                # Keep the departments completed before the response broke off
+                call.outcome = OUTCOME_PARTIAL
+                return {"departments": streamed_departments, "overall_recommendations": []}, False
+            call.outcome = OUTCOME_PARSE_ERROR
+            return None, False
+
+def extract_json_text(response_text: str) -> str:
+    """Strip Markdown code fences around a JSON response"""
+    # Check if response has JSON code blocks and extract them
+    if "```json" in response_text:
+        return response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        return response_text.split("```")[1].strip()
+    return response_text.strip()
+
+def merge_rag_analyses(analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge RAG analyses of several partitions into one
+    
+    A department analyzed in more than one partition keeps the highest risk
+    level and the union of its risks, risk types and control gaps.
+    
+    Args:
+        analyses: Parsed RAG analyses, in partition order
+        
+    Returns:
+        Combined analysis with departments and overall_recommendations
+    """
+    if len(analyses) == 1:
+        return analyses[0]
+    
+    risk_order = {"low": 1, "medium": 2, "high": 3}
+    merged_departments = {}
+    recommendations = []
+    recommendation_titles = set()
+    
+    for analysis in analyses:
+        for dept_data in analysis.get("departments", []):
+            name = dept_data.get("name", "Unknown")
+            merged = merged_departments.get(name)
+            if merged is None:
+                merged_departments[name] = {
+                    **dept_data,
+                    "key_risks": list(dept_data.get("key_risks", [])),
+                    "risk_analysis": {risk_type: list(risks) for risk_type, risks in dept_data.get("risk_analysis", {}).items()},
+                    "control_gaps": list(dept_data.get("control_gaps", []))
+                }
+                continue
             
-        # Add risk categories
-        categories_text = "\nRisk Categories:\n"
-        for cat, value in risk_categories.items():
-            categories_text += f"- {cat}: {value}/5\n"
-        
-        # Calculate overall risk level based on category values
-        category_values = list(risk_categories.values())
-        avg_risk = sum(category_values) / len(category_values) if category_values else 0
-        
-        if avg_risk >= 3.5:
-            suggested_risk = "High"
-        elif avg_risk >= 2.5:
-            suggested_risk = "Medium"
+            level = dept_data.get("overall_risk_level", "Medium")
+            if risk_order.get(str(level).lower(), 0) > risk_order.get(str(merged.get("overall_risk_level", "")).lower(), 0):
+                merged["overall_risk_level"] = level
+            merged["key_risks"] += [risk for risk in dept_data.get("key_risks", []) if risk not in merged["key_risks"]]
+            for risk_type, risks in dept_data.get("risk_analysis", {}).items():
+                existing = merged["risk_analysis"].setdefault(risk_type, [])
+                existing += [risk for risk in risks if risk not in existing]
+            merged["control_gaps"] += dept_data.get("control_gaps", [])
+            if dept_data.get("summary"):
+                merged["summary"] = " ".join(filter(None, [merged.get("summary", ""), dept_data["summary"]]))
+        
+        for rec in analysis.get("overall_recommendations", []):
+            title = str(rec.get("title", "")).strip().lower()
+            if title and title in recommendation_titles:
+                continue
+            recommendation_titles.add(title)
+            recommendations.append(rec)
+    
+    return {
+        "departments": list(merged_departments.values()),
+        "overall_recommendations": recommendations
+    }
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text (about 4 characters per token)"""
+    return (len(text) + 3) // 4
+
+def partition_raw_data(raw_data: List[Dict[str, Any]], token_budget: int) -> List[List[Dict[str, Any]]]:
+    """
+    Split raw sheet data into partitions whose formatted text fits a token budget
+    
+    Whole sheets are packed together while they fit. Larger sheets are split by
+    department (the Area column, forward-filled over merged cells), repeating the
+    sheet's header rows in every part; a department that alone exceeds the
+    budget is split into row ranges.
+    
+    Args:
+        raw_data: Sheets as produced by process_excel
+        token_budget: Maximum estimated tokens of formatted raw data per partition
+        
+    Returns:
+        List of partitions, each a raw_data list that format_raw_data accepts
+    """
+    # Units are (sheet index, sheet name, header rows, body rows, header tokens, body tokens)
+    # in document order
+    units = []
+    for sheet_idx, sheet_data in enumerate(raw_data):
+        sheet_name = sheet_data.get("sheet_name", "Unknown Sheet")
+        rows = sheet_data.get("rows", [])
+        if not rows:
+            units.append((sheet_idx, sheet_name, [], [], estimate_tokens(format_raw_data([sheet_data])), 0))
+            continue
+        
+        columns = list(rows[0].keys())
+        row_tokens = [estimate_tokens("| " + " | ".join([str(row.get(col, "")) for col in columns]) + " |\n") for row in rows]
+        header_tokens = estimate_tokens(format_raw_data([{"sheet_name": sheet_name, "rows": []}])) + 2 * estimate_tokens("| " + " | ".join(columns) + " |\n")
+        
+        if header_tokens + sum(row_tokens) <= token_budget:
+            units.append((sheet_idx, sheet_name, [], rows, header_tokens, sum(row_tokens)))
+            continue
+        
+        header_idx, groups = _department_row_groups(rows)
+        preamble = rows[:header_idx + 1]
+        preamble_tokens = header_tokens + sum(row_tokens[:header_idx + 1])
+        
+        for group in groups.values():
+            # Split departments that do not fit on their own into row ranges
+            part, part_tokens = [], 0
+            for row, tokens in ((rows[i], row_tokens[i]) for i in group):
+                if part and preamble_tokens + part_tokens + tokens > token_budget:
+                    units.append((sheet_idx, sheet_name, preamble, part, preamble_tokens, part_tokens))
+                    part, part_tokens = [], 0
+                part.append(row)
+                part_tokens += tokens
+            if part:
+                units.append((sheet_idx, sheet_name, preamble, part, preamble_tokens, part_tokens))
+    
+    # Pack units into partitions; parts of the same sheet share one header
+    partitions = []
+    current, current_tokens, current_sheet = [], 0, None
+    for sheet_idx, sheet_name, preamble, body, header_tokens, body_tokens in units:
+        same_sheet = current and sheet_idx == current_sheet
+        tokens = body_tokens if same_sheet else header_tokens + body_tokens
+        if current and current_tokens + tokens > token_budget:
+            partitions.append(current)
+            current, current_tokens, same_sheet = [], 0, False
+            tokens = header_tokens + body_tokens
+        if same_sheet:
+            current[-1]["rows"].extend(body)
         else:
-            suggested_risk = "Low"
-        
-        # Create a dedicated solutions prompt for each objective
-        solutions_prompts = []
-        for i, obj in enumerate(objectives):
-            what_can_go_wrong = obj.get("what_can_go_wrong", "")
-            objective = obj.get("objective", "")
-            risk_level = obj.get("risk_level", "Medium")
+            current.append({"sheet_name": sheet_name, "rows": preamble + body})
+        current_tokens += tokens
+        current_sheet = sheet_idx
+    if current:
+        partitions.append(current)
+    
+    return partitions
+
+def _department_row_groups(rows: List[Dict[str, Any]]) -> tuple:
+    """
+    Group the body rows of a sheet by department, in order of first appearance
+    
+    The department (Area) column is forward-filled over merged cells; rows
+    before the first department are grouped under "".
+    
+    Args:
+        rows: Raw rows of a sheet
+        
+    Returns:
+        Tuple of (index of the header row or -1, department -> row indexes)
+    """
+    dept_col, header_idx = _department_column(rows)
+    groups = {}
+    current = ""
+    for i in range(header_idx + 1, len(rows)):
+        if dept_col is not None:
+            value = rows[i].get(dept_col, "")
+            if isinstance(value, str) and value.strip():
+                current = value.strip()
+        groups.setdefault(current, []).append(i)
+    return header_idx, groups
+
+def raw_rows_by_department(raw_data: List[Dict[str, Any]]) -> tuple:
+    """
+    Collect the raw rows of every department across sheets
+    
+    Args:
+        raw_data: Sheets as produced by process_excel
+        
+    Returns:
+        Tuple of (department -> rows, rows belonging to no department such as headers)
+    """
+    by_dept, shared = {}, []
+    for sheet_data in raw_data or []:
+        rows = sheet_data.get("rows", [])
+        if not rows:
+            continue
+        header_idx, groups = _department_row_groups(rows)
+        shared.append({"sheet_name": sheet_data.get("sheet_name"), "rows": rows[:header_idx + 1] + [rows[i] for i in groups.get("", [])]})
+        for dept, indexes in groups.items():
+            if dept:
+                by_dept.setdefault(dept, []).extend(rows[i] for i in indexes)
+    return by_dept, shared
+
+def filter_raw_data(raw_data: List[Dict[str, Any]], departments: List[str]) -> List[Dict[str, Any]]:
+    """
+    Keep only the rows of some departments, with each sheet's header rows
+    
+    Args:
+        raw_data: Sheets as produced by process_excel
+        departments: Departments to keep
+        
+    Returns:
+        raw_data without the other departments' rows; sheets left without rows are dropped
+    """
+    keep = set(departments)
+    filtered = []
+    for sheet_data in raw_data or []:
+        rows = sheet_data.get("rows", [])
+        if not rows:
+            continue
+        header_idx, groups = _department_row_groups(rows)
+        indexes = sorted(i for dept, group in groups.items() if dept in keep for i in group)
+        if indexes:
+            filtered.append({**sheet_data, "rows": rows[:header_idx + 1] + [rows[i] for i in indexes]})
+    return filtered
+
+def _department_column(rows: List[Dict[str, Any]]) -> tuple:
+    """
+    Find the column holding the department (Area) of each row
+    
+    Args:
+        rows: Raw rows of a sheet
+        
+    Returns:
+        Tuple of (column name or None, index of the header row or -1 if the column names are the header)
+    """
+    def is_department_label(label: Any) -> bool:
+        label = str(label).strip().lower()
+        return label in ("area", "department", "function") or (
+            any(keyword in label for keyword in ("area", "department")) and "sub" not in label and "process" not in label
+        )
+    
+    for col in rows[0].keys():
+        if is_department_label(col):
+            return col, -1
+    
+    # RCM sheets often carry their header a few rows down
+    for i, row in enumerate(rows[:10]):
+        for col, value in row.items():
+            if isinstance(value, str) and is_department_label(value):
+                return col, i
+    
+    return None, -1
+
+def format_raw_data(raw_data):
+    """Format raw data from Excel sheets into a structured text representation"""
+    formatted_text = ""
+    
+    for sheet_data in raw_data:
+        sheet_name = sheet_data.get("sheet_name", "Unknown Sheet")
+        rows = sheet_data.get("rows", [])
+        
+        formatted_text += f"\n=== SHEET: {sheet_name} ===\n\n"
+        
+        # If there are rows, format them
+        if rows:
+            # Get columns from first row
+            if rows:
+                columns = list(rows[0].keys())
+                formatted_text += "| " + " | ".join(columns) + " |\n"
+                formatted_text += "| " + " | ".join(["-" * len(col) for col in columns]) + " |\n"
+                
+                # Add rows
+                for row in rows:
+                    formatted_text += "| " + " | ".join([str(row.get(col, "")) for col in columns]) + " |\n"
+        
+        formatted_text += "\n"
+    
+    return formatted_text
+
+def analyze_structured_data(model, data: Dict[str, Any], checkpoint: AnalysisCheckpoint = None) -> Dict[str, Any]:
+    """Analyze already structured data (fallback if RAG fails)"""
+    enhanced_data = data.copy()
+    
+    # Generate department risk matrix if not present
+    if not data.get("department_risks"):
+        department_risks = generate_department_risk_matrix(data)
+        enhanced_data["department_risks"] = department_risks
+    
+    # Generate recommendations
+    enhanced_data["recommendations"] = generate_department_recommendations(model, data, checkpoint=checkpoint)
+    
+    # Calculate risk score
+    enhanced_data["risk_score"] = calculate_risk_score(data)
+    
+    return enhanced_data
+
+def analyze_raw_document(model, data: Dict[str, Any], collection=None, concurrency: int = None, on_department=None,
+                         checkpoint: AnalysisCheckpoint = None, revisions: RevisionStore = None) -> Dict[str, Any]:
+    """
+    Process raw text documents using Gemini
+    
+    Documents longer than RAW_TEXT_CHAR_BUDGET are not truncated. When the
+    document's chunks are stored in ChromaDB, the chunks most relevant to each
+    control theme are retrieved and analyzed; otherwise the whole text is
+    analyzed in windows. Windows are sent concurrently and their extractions
+    merged.
+    
+    Args:
+        model: Gemini model instance
+        data: Structured data with extracted_text from process_pdf/process_docx
+        collection: ChromaDB collection holding the document's text chunks (optional)
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        on_department: Optional callback(department, department_risk) called for each
+            department once the document has been extracted
+        checkpoint: Checkpoint of completed windows and recommendations (optional)
+        revisions: Department analyses of earlier document versions; recommendations of
+            departments extracted unchanged are reused (optional)
+        
+    Returns:
+        Enhanced data with the extracted structure and Gemini's analysis
+    """
+    enhanced_data = data.copy()
+    
+    # Prepare the prompt for Gemini
+    if "extracted_text" in data:
+        windows = raw_document_windows(data, collection)
+        
+        extractions = map_concurrently(lambda text: _extract_raw_document(model, text, checkpoint), windows, concurrency)
+        extractions = [extraction for extraction in extractions if extraction is not None]
+        if not extractions:
+            raise ValueError("Could not extract structured data from the Gemini response")
+        extracted_data = merge_extracted_data(extractions)
+        
+        if on_department is not None:
+            for dept, dept_risk in (extracted_data.get("department_risks") or {}).items():
+                on_department(dept, dept_risk)
+        
+        # Update the enhanced data with extracted information
+        enhanced_data.update(extracted_data)
+        enhanced_data["raw_text"] = False  # Mark as processed
+        
+        # Additional post-processing
+        enhanced_data["risk_score"] = calculate_risk_score(extracted_data)
+        revision = revisions.revision(extracted_data) if revisions is not None else None
+        enhanced_data["recommendations"] = generate_department_recommendations(
+            model, extracted_data, concurrency, checkpoint, reused=revision.recommendations() if revision is not None else None
+        )
+        if revision is not None:
+            revision.record(enhanced_data, checkpoint.failed_departments if checkpoint is not None else ())
+    
+    return enhanced_data
+
+def raw_document_windows(data: Dict[str, Any], collection=None) -> List[str]:
+    """
+    Select the text of a raw document to analyze, split into prompt-sized windows
+    
+    Args:
+        data: Structured data with extracted_text
+        collection: ChromaDB collection holding the document's text chunks (optional)
+        
+    Returns:
+        Texts of at most RAW_TEXT_CHAR_BUDGET characters each
+    """
+    extracted_text = data["extracted_text"]
+    if len(extracted_text) <= RAW_TEXT_CHAR_BUDGET:
+        return [extracted_text]
+    
+    if collection is not None:
+        metadata = data.get("metadata", {})
+        if metadata.get("file_hash"):
+            filter_dict = {"file_hash": metadata["file_hash"]}
+        else:
+            filter_dict = {"source": metadata.get("file_name", "")}
+        
+        try:
+            chunks = retrieve_chunks(collection, RAW_DOCUMENT_THEMES, RETRIEVAL_TOP_K, filter_dict)
+        except Exception as e:
+            logger.warning(f"Retrieval from ChromaDB failed, analyzing the full text instead: {str(e)}")
+            chunks = []
+        
+        if chunks:
+            # Pack the retrieved chunks, in document order, into windows
+            windows, current = [], ""
+            for chunk in chunks:
+                if current and len(current) + len(chunk) + 5 > RAW_TEXT_CHAR_BUDGET:
+                    windows.append(current)
+                    current = ""
+                current = f"{current}\n...\n{chunk}" if current else chunk
+            windows.append(current)
+            logger.info(f"Analyzing {len(chunks)} retrieved chunks of {len(extracted_text)} chars of text in {len(windows)} prompts")
+            return windows
+    
+    windows = [window for _, window in iter_text_chunks(extracted_text, chunk_size=RAW_TEXT_CHAR_BUDGET, overlap=RAW_TEXT_WINDOW_OVERLAP)]
+    logger.info(f"Analyzing {len(extracted_text)} chars of text in {len(windows)} windows")
+    return windows
+
+def _extract_raw_document(model, text: str, checkpoint: AnalysisCheckpoint = None) -> Union[Dict[str, Any], None]:
+    """
+    Extract structured RCM information from a window of document text
+    
+    Args:
+        model: Gemini model instance
+        text: Document text
+        checkpoint: Checkpoint of completed windows (optional)
+        
+    Returns:
+        Extracted data, or None if the response could not be parsed
+    """
+    prompt = f"""
+    You are a Risk Assessment and Control expert. I will provide you with text from a Risk Control Matrix (RCM) document.
+    
+    Please analyze this text and extract the following structured information, with special focus on departmental risks:
+    
+    1. Departments: Identify all departments mentioned in the document.
+    2. Control Objectives: For each department, identify the main control objectives.
+    3. What Can Go Wrong: For each control objective, identify what could go wrong if the control is not implemented.
+    4. Risk Levels: Identify the risk level (High, Medium, Low) for each control objective.
+    5. Control Activities: Identify the control activities in place to address each risk.
+    6. Gaps: Identify any control or design gaps mentioned in the document.
+    7. Proposed Controls: Identify any proposed controls to address the gaps.
+    8. Departmental Risk Analysis: Provide a risk assessment for each department, including risk categories and overall risk level.
+    
+    Please be comprehensive and detailed in your analysis. Here is the text:
+    
+    {text}
+    
+    Respond with ONLY a JSON object containing the extracted structured information. The format should be:
+    {{
+        "departments": ["string"],
+        "control_objectives": [
+            {{
+                "department": "string",
+                "objective": "string",
+                "what_can_go_wrong": "string",
+                "risk_level": "string",
+                "control_activities": "string",
+                "is_gap": boolean,
+                "gap_details": "string",
+                "proposed_control": "string"
+            }}
+        ],
+        "gaps": [
+            {{
+                "department": "string",
+                "control_objective": "string",
+                "gap_title": "string",
+                "description": "string",
+                "risk_impact": "string",
+                "proposed_solution": "string"
+            }}
+        ],
+        "department_risks": {{
+            "Department1": {{
+                "overall_risk_level": "string",
+                "risk_categories": {{
+                    "Financial": number,
+                    "Operational": number,
+                    "Compliance": number,
+                    "Strategic": number,
+                    "Technological": number
+                }},
+                "key_risks": ["string"],
+                "summary": "string"
+            }}
+        }},
+        "risk_distribution": {{"Low": number, "Medium": number, "High": number}},
+        "total_controls": number,
+        "control_gaps": number
+    }}
+    """
+    
+    unit = AnalysisCheckpoint.unit_key("extract", prompt)
+    if checkpoint is not None and checkpoint.get(unit) is not None:
+        return checkpoint.get(unit)
+    
+    # Extract JSON from the response
+    response = None
+    try:
+        with telemetry.call("extract_raw_document"):
+            # Get response from Gemini; a unit that failed before is not served from the cache
+            response = generate_content(model, prompt, use_cache=checkpoint is None or not checkpoint.failed_before(unit))
+            extracted_data = json.loads(extract_json_text(response.text))
             
-            solutions_prompts.append(f"""
-            Objective {i+1}: {objective}
-            What Can Go Wrong: {what_can_go_wrong}
-            Risk Level: {risk_level}
+            # Store the extracted rows as compact records
+            extracted_data["control_objectives"] = [ControlObjective.from_dict(obj) for obj in extracted_data.get("control_objectives", []) if isinstance(obj, dict)]
+            extracted_data["gaps"] = [ControlGap.from_dict(gap) for gap in extracted_data.get("gaps", []) if isinstance(gap, dict)]
+        
+        if checkpoint is not None:
+            checkpoint.save(unit, extracted_data)
+        return extracted_data
+    
+    except Exception as json_error:
+        logger.error(f"Error extracting JSON from Gemini response: {str(json_error)}")
+        logger.debug(f"Raw response: {getattr(response, 'text', '')}")
+        if checkpoint is not None:
+            checkpoint.mark_failed(unit)
+        return None
+
+def merge_extracted_data(extractions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge structured extractions of several windows of one document
+    
+    Objectives and gaps found in overlapping windows are kept once, department
+    risks keep the highest value per category, and the risk distribution and
+    counts are recomputed from the merged objectives.
+    
+    Args:
+        extractions: Extracted data per window, in document order
+        
+    Returns:
+        Combined extracted data
+    """
+    if len(extractions) == 1:
+        return extractions[0]
+    
+    risk_order = {"low": 1, "medium": 2, "high": 3}
+    departments = []
+    objectives, objective_keys = [], set()
+    gaps, gap_keys = [], set()
+    department_risks = {}
+    
+    for extraction in extractions:
+        for dept in extraction.get("departments", []):
+            if dept not in departments:
+                departments.append(dept)
+        
+        for obj in extraction.get("control_objectives", []):
+            key = (obj.get("department", ""), obj.get("objective", ""), obj.get("what_can_go_wrong", ""))
+            if key not in objective_keys:
+                objective_keys.add(key)
+                objectives.append(obj)
+        
+        for gap in extraction.get("gaps", []):
+            key = (gap.get("department", ""), gap.get("control_objective", ""), gap.get("gap_title", ""))
+            if key not in gap_keys:
+                gap_keys.add(key)
+                gaps.append(gap)
+        
+        for dept, risk in (extraction.get("department_risks") or {}).items():
+            if not isinstance(risk, dict):
+                continue
+            merged = department_risks.get(dept)
+            if merged is None:
+                department_risks[dept] = {
+                    **risk,
+                    "risk_categories": dict(risk.get("risk_categories") or {}),
+                    "key_risks": list(risk.get("key_risks") or [])
+                }
+                continue
             
-            For this specific control objective, provide a detailed, tailored solution that directly addresses the risk.
-            """)
+            level = risk.get("overall_risk_level", "")
+            if risk_order.get(str(level).lower(), 0) > risk_order.get(str(merged.get("overall_risk_level", "")).lower(), 0):
+                merged["overall_risk_level"] = level
+            for cat, value in (risk.get("risk_categories") or {}).items():
+                if isinstance(value, (int, float)):
+                    merged["risk_categories"][cat] = max(merged["risk_categories"].get(cat, 0), value)
+            merged["key_risks"] += [key_risk for key_risk in risk.get("key_risks") or [] if key_risk not in merged["key_risks"]]
+            if not merged.get("summary"):
+                merged["summary"] = risk.get("summary", "")
+    
+    # Departments only mentioned by objectives still need to be listed
+    for obj in objectives:
+        if obj.get("department") and obj["department"] not in departments:
+            departments.append(obj["department"])
+    
+    aggregator = RiskAggregator(departments)
+    aggregator.add(objectives)
+    
+    return {
+        "departments": departments,
+        "control_objectives": objectives,
+        "gaps": gaps,
+        "department_risks": department_risks,
+        "risk_distribution": aggregator.risk_distribution,
+        "total_controls": len(objectives),
+        "control_gaps": len(gaps)
+    }
+
+def generate_department_risk_matrix(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Generate a basic department risk matrix from structured data"""
+    departments = data.get("departments", [])
+    if not departments:
+        return {}
+    
+    # Populate risk values based on control objectives
+    aggregator = RiskAggregator(departments)
+    aggregator.add(data.get("control_objectives", []))
+    
+    return aggregator.department_risks()
+
+def analyze_department(model, dept: str, objectives: List[Dict[str, Any]], risk_categories: Dict[str, int],
+                       checkpoint: AnalysisCheckpoint = None, concurrency: int = None) -> Dict[str, Any]:
+    """
+    Use Gemini to analyze a specific department
+    
+    Args:
+        model: Gemini model instance
+        dept: Department name
+        objectives: The department's control objectives; their gap_details and
+            proposed_control are updated from the analysis
+        risk_categories: Department risk matrix row
+        checkpoint: Checkpoint of completed batches (optional)
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        
+    Returns:
+        Department analysis, including the tokens sent and received in "token_usage"
+    """
+    return analyze_departments(model, [(dept, objectives, risk_categories)], checkpoint, concurrency)[dept]
+
+def analyze_departments(model, departments: List[tuple], checkpoint: AnalysisCheckpoint = None, concurrency: int = None,
+                        relay: ProgressRelay = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Analyze several departments, batching each one's objectives to the prompt token budget
+    
+    Batches of small departments are packed into shared prompts, and all
+    prompts share one pool of concurrent requests.
+    
+    Args:
+        model: Gemini model instance
+        departments: (department, objectives, risk_categories) tuples
+        checkpoint: Checkpoint of completed batches (optional)
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        relay: Progress relay called with (department, analysis) when a department completes
         
-        combined_solutions_prompt = "\n\n".join(solutions_prompts)
+    Returns:
+        Department -> analysis, in the order given
+    """
+    batches = []
+    for dept, objectives, risk_categories in departments:
+        batches.extend(plan_department_batches(dept, objectives, risk_categories))
+    packs = pack_department_batches(batches)
+    if len(packs) < len(batches):
+        logger.info(f"Packed {len(batches)} department prompts into {len(packs)} requests")
+    
+    remaining = {}
+    for batch in batches:
+        remaining[batch["department"]] = remaining.get(batch["department"], 0) + 1
+    completed = {dept: [] for dept, _, _ in departments}
+    analyses = {}
+    lock = threading.Lock()
+    
+    def run_pack(pack):
+        for batch, result in analyze_department_pack(model, pack, checkpoint):
+            dept = batch["department"]
+            with lock:
+                completed[dept].append((batch, result))
+                remaining[dept] -= 1
+                last = remaining[dept] == 0
+            if last:
+                # Every batch of the department is done; merge and report it
+                analyses[dept] = merge_department_batches(dept, *departments_by_name[dept], completed[dept])
+                if relay is not None:
+                    relay(dept, analyses[dept])
+    
+    departments_by_name = {dept: (objectives, risk_categories) for dept, objectives, risk_categories in departments}
+    map_concurrently(run_pack, packs, concurrency, relay)
+    
+    return {dept: analyses[dept] for dept, _, _ in departments}
+
+def plan_department_batches(dept: str, objectives: List[Dict[str, Any]], risk_categories: Dict[str, int],
+                            token_budget: int = None, max_objectives: int = None) -> List[Dict[str, Any]]:
+    """
+    Build the department analysis prompts for a department's objectives
+    
+    Objectives with the same text, risk and controls are sent once. Each prompt
+    holds as many objectives as fit the token budget (and max_objectives, which
+    bounds the response length). A department always gets at least one batch.
+    
+    Args:
+        dept: Department name
+        objectives: The department's control objectives
+        risk_categories: Department risk matrix row
+        token_budget: Maximum estimated prompt tokens (defaults to DEPARTMENT_PROMPT_TOKEN_BUDGET)
+        max_objectives: Maximum objectives per prompt (defaults to DEPARTMENT_MAX_OBJECTIVES)
         
-        prompt = f"""
+    Returns:
+        Batches with the department, prompt, prompt texts, objective groups by prompt id
+        and tokens per prompt section
+    """
+    token_budget = token_budget or DEPARTMENT_PROMPT_TOKEN_BUDGET
+    max_objectives = max_objectives or DEPARTMENT_MAX_OBJECTIVES
+    
+    # Group identical objectives so their text is sent only once
+    groups = {}
+    for obj in objectives:
+        key = tuple(" ".join(str(obj.get(field, "") or "").split()).lower()
+                    for field in ("objective", "what_can_go_wrong", "risk_level", "control_activities", "gap_details"))
+        groups.setdefault(key, []).append(obj)
+    
+    # Add risk categories
+    categories_text = "\nRisk Categories:\n"
+    for cat, value in risk_categories.items():
+        categories_text += f"- {cat}: {value}/5\n"
+    instructions_tokens = estimate_tokens(_department_prompt(dept, categories_text, "", risk_categories))
+    
+    batches = []
+    entries, entries_tokens = [], 0
+    
+    def close_batch():
+        objectives_text = "".join(entry for entry, _ in entries)
+        batches.append({
+            "department": dept,
+            "prompt": _department_prompt(dept, categories_text, objectives_text, risk_categories),
+            "risk_categories": risk_categories,
+            "categories_text": categories_text,
+            "objectives_text": objectives_text,
+            "groups": {obj_id: group for _, (obj_id, group) in entries},
+            "sections": {"instructions": instructions_tokens, "objectives": entries_tokens}
+        })
+    
+    for obj_id, group in enumerate(groups.values(), start=1):
+        entry = _format_objective(obj_id, group[0])
+        tokens = estimate_tokens(entry)
+        if entries and (len(entries) >= max_objectives or instructions_tokens + entries_tokens + tokens > token_budget):
+            close_batch()
+            entries, entries_tokens = [], 0
+        entries.append((entry, (obj_id, group)))
+        entries_tokens += tokens
+    
+    close_batch()
+    return batches
+
+def _format_objective(obj_id: int, obj: Dict[str, Any]) -> str:
+    """Format a control objective for the department prompt, leaving out repeated text"""
+    objective = obj.get("objective", "")
+    text = f"{obj_id}. Objective: {objective}\n"
+    text += f"   What Can Go Wrong: {obj.get('what_can_go_wrong', '')}\n"
+    text += f"   Risk Level: {obj.get('risk_level', '')}\n"
+    if obj.get("control_activities") and obj.get("control_activities") != objective:
+        text += f"   Control Activities: {obj.get('control_activities', '')}\n"
+    if obj.get("is_gap", False) and obj.get("gap_details") and obj.get("gap_details") != obj.get("what_can_go_wrong"):
+        text += f"   Gap: {obj.get('gap_details', '')}\n"
+    return text
+
+def _department_prompt(dept: str, categories_text: str, objectives_text: str, risk_categories: Dict[str, int]) -> str:
+    """Assemble the department analysis prompt"""
+    return f"""
         You are a Risk Management and Internal Controls Expert with extensive experience in designing control frameworks and providing solutions to address control gaps. I need your help to analyze control objectives for the {dept} department and provide specific, actionable solutions.
 
         DEPARTMENT: {dept}
@@ -564,7 +1499,7 @@ def analyze_department(model, dept: str, objectives: List[Dict[str, Any]], risk_
         {objectives_text}
         
         TASK:
-        For EACH control objective above, you must provide:
+        For EACH numbered control objective above, you must provide:
         1. A determination of whether there is a control design gap (Yes/No)
         2. A UNIQUE, DETAILED proposed solution (approximately 50 words, 2-3 sentences) that specifically addresses the risk described in "What Can Go Wrong"
         
@@ -576,9 +1511,6 @@ def analyze_department(model, dept: str, objectives: List[Dict[str, Any]], risk_
         - AVOID reusing the same or similar solutions for multiple objectives
         - Each solution should be approximately 50 words (2-3 detailed sentences)
         
-        I NEED SPECIFIC SOLUTIONS FOR EACH OF THESE CONTROL OBJECTIVES:
-        {combined_solutions_prompt}
-        
         Respond with ONLY a JSON object in the following format:
         {{
             "overall_risk_level": "High/Medium/Low",
@@ -594,65 +1526,377 @@ def analyze_department(model, dept: str, objectives: List[Dict[str, Any]], risk_
             "summary": "brief department risk summary",
             "control_gaps": [
                 {{
-                    "objective": "exact text of the control objective",
+                    "id": "number of the control objective",
                     "has_gap": "Yes/No",
                     "proposed_solution": "unique, tailored solution of approximately 50 words"
                 }}
             ]
         }}
         """
+
+def analyze_department_batch(model, batch: Dict[str, Any], checkpoint: AnalysisCheckpoint = None) -> tuple:
+    """
+    Send one department analysis prompt
+    
+    Args:
+        model: Gemini model instance
+        batch: Batch from plan_department_batches
+        checkpoint: Checkpoint of completed batches (optional)
         
-        # Get response from Gemini
-        response = model.generate_content(prompt)
+    Returns:
+        Tuple of (parsed analysis or None on failure, token usage of the call)
+    """
+    prompt = batch["prompt"]
+    usage = {"calls": 0, "prompt_tokens": 0, "response_tokens": 0}
+    
+    unit = AnalysisCheckpoint.unit_key("department", prompt)
+    if checkpoint is not None and checkpoint.get(unit) is not None:
+        return checkpoint.get(unit), usage
+    
+    try:
+        with telemetry.call("analyze_department", batch["department"]):
+            # Get response from Gemini; a unit that failed before is not served from the cache
+            response = generate_content(model, prompt, use_cache=checkpoint is None or not checkpoint.failed_before(unit))
+            usage = response_token_usage(prompt, response)
+            dept_analysis = json.loads(extract_json_text(response.text))
+            if not isinstance(dept_analysis, dict):
+                raise ValueError("Department analysis is not a JSON object")
+    except Exception as e:
+        logger.error(f"Error analyzing department {batch['department']}: {str(e)}")
+        if checkpoint is not None:
+            checkpoint.mark_failed(unit, batch["department"])
+        if not usage["calls"]:
+            usage = {"calls": 1, "prompt_tokens": estimate_tokens(prompt), "response_tokens": 0}
+        return None, usage
+    
+    if checkpoint is not None:
+        checkpoint.save(unit, dept_analysis)
+    return dept_analysis, usage
+
+def pack_department_batches(batches: List[Dict[str, Any]], token_budget: int = None, max_objectives: int = None,
+                            max_departments: int = None) -> List[Dict[str, Any]]:
+    """
+    Group the department batches of small departments into shared prompts
+    
+    Batches are packed in order while the combined prompt fits the token budget
+    and the objective limit; a pack holds at most one batch per department.
+    
+    Args:
+        batches: Batches from plan_department_batches
+        token_budget: Maximum estimated prompt tokens (defaults to DEPARTMENT_PROMPT_TOKEN_BUDGET)
+        max_objectives: Maximum objectives per prompt (defaults to DEPARTMENT_MAX_OBJECTIVES)
+        max_departments: Maximum departments per prompt (defaults to DEPARTMENT_PACK_MAX_DEPARTMENTS)
         
-        # Extract JSON
-        response_text = response.text
-        if "```json" in response_text:
-            json_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            json_text = response_text.split("```")[1].strip()
-        else:
-            json_text = response_text.strip()
+    Returns:
+        Packs with the prompt and the batches it answers
+    """
+    token_budget = token_budget or DEPARTMENT_PROMPT_TOKEN_BUDGET
+    max_objectives = max_objectives or DEPARTMENT_MAX_OBJECTIVES
+    max_departments = max_departments or DEPARTMENT_PACK_MAX_DEPARTMENTS
+    
+    instructions_tokens = estimate_tokens(_packed_department_prompt([]))
+    packs = []
+    current, current_tokens, current_objectives = [], instructions_tokens, 0
+    
+    def close_pack():
+        packs.append(_department_pack(current))
+    
+    for batch in batches:
+        tokens = estimate_tokens(_packed_department_section(batch))
+        objectives = len(batch["groups"])
+        fits = (len(current) < max_departments
+                and current_tokens + tokens <= token_budget
+                and current_objectives + objectives <= max_objectives
+                and all(other["department"] != batch["department"] for other in current))
+        if current and not fits:
+            close_pack()
+            current, current_tokens, current_objectives = [], instructions_tokens, 0
+        current.append(batch)
+        current_tokens += tokens
+        current_objectives += objectives
+    
+    if current:
+        close_pack()
+    return packs
+
+def _department_pack(batches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the pack answering the given batches with one prompt"""
+    prompt = batches[0]["prompt"] if len(batches) == 1 else _packed_department_prompt(batches)
+    return {"prompt": prompt, "batches": batches}
+
+def _packed_department_section(batch: Dict[str, Any]) -> str:
+    """Format one department of a packed department analysis prompt"""
+    return f"""
+        === DEPARTMENT: {batch['department']} ===
+        RISK CATEGORIES:
+        {batch['categories_text']}
+        CONTROL OBJECTIVES:
+        {batch['objectives_text']}
+        """
+
+def _packed_department_prompt(batches: List[Dict[str, Any]]) -> str:
+    """Assemble a department analysis prompt covering several departments"""
+    departments = ", ".join(batch["department"] for batch in batches)
+    sections = "".join(_packed_department_section(batch) for batch in batches)
+    return f"""
+        You are a Risk Management and Internal Controls Expert with extensive experience in designing control frameworks and providing solutions to address control gaps. I need your help to analyze control objectives for several departments and provide specific, actionable solutions.
+
+        DEPARTMENTS: {departments}
+        {sections}
+        TASK:
+        For EACH department, and EACH numbered control objective of that department, you must provide:
+        1. A determination of whether there is a control design gap (Yes/No)
+        2. A UNIQUE, DETAILED proposed solution (approximately 50 words, 2-3 sentences) that specifically addresses the risk described in "What Can Go Wrong"
         
-        dept_analysis = json.loads(json_text)
+        REQUIREMENTS FOR PROPOSED SOLUTIONS:
+        - Each solution must be tailored to the specific control objective and risk
+        - Solutions must be practical, actionable, and implementable
+        - Solutions must include specific technologies, processes, or controls to implement
+        - AVOID generic solutions that could apply to any risk
+        - AVOID reusing the same or similar solutions for multiple objectives
+        - Each solution should be approximately 50 words (2-3 detailed sentences)
         
-        # Process control gaps and update objectives with gap information
-        if "control_gaps" in dept_analysis:
-            for gap_info in dept_analysis["control_gaps"]:
-                obj_text = gap_info.get("objective", "")
-                has_gap = gap_info.get("has_gap", "No")
-                proposed_solution = gap_info.get("proposed_solution", "")
-                
-                # Find matching objective and update it
-                for obj in objectives:
-                    if obj.get("objective", "") == obj_text or obj_text in obj.get("objective", ""):
-                        obj["gap_details"] = "Yes" if has_gap.lower() == "yes" else "No"
-                        # Always add the proposed solution regardless of gap status
-                        if proposed_solution:
-                            obj["proposed_control"] = proposed_solution
+        Respond with ONLY a JSON object with one entry per department, keyed by the exact department name, in the following format:
+        {{
+            "<department name>": {{
+                "overall_risk_level": "High/Medium/Low",
+                "key_risks": ["3-5 key risks identified"],
+                "risk_types": {{
+                    "Operational": ["specific operational risks"],
+                    "Financial": ["specific financial risks"],
+                    "Fraud": ["specific fraud risks"],
+                    "Financial_Fraud": ["specific financial fraud risks"],
+                    "Operational_Fraud": ["specific operational fraud risks"]
+                }},
+                "summary": "brief department risk summary",
+                "control_gaps": [
+                    {{
+                        "id": "number of the control objective within its department",
+                        "has_gap": "Yes/No",
+                        "proposed_solution": "unique, tailored solution of approximately 50 words"
+                    }}
+                ]
+            }}
+        }}
+        """
+
+def analyze_department_pack(model, pack: Dict[str, Any], checkpoint: AnalysisCheckpoint = None) -> List[tuple]:
+    """
+    Send one department analysis prompt and split its answer by department
+    
+    The departments that parsed are checkpointed even when others are missing
+    from the answer; re-running the analysis then sends only the missing
+    departments, in a pack of their own.
+    
+    Args:
+        model: Gemini model instance
+        pack: Pack from pack_department_batches
+        checkpoint: Checkpoint of completed prompts (optional)
+        
+    Returns:
+        (batch, (analysis or None on failure, token usage)) for every batch of the pack
+    """
+    batches = pack["batches"]
+    if len(batches) == 1:
+        return [(batches[0], analyze_department_batch(model, batches[0], checkpoint))]
+    
+    prompt = pack["prompt"]
+    departments = [batch["department"] for batch in batches]
+    usage = {"calls": 0, "prompt_tokens": 0, "response_tokens": 0}
+    
+    unit = AnalysisCheckpoint.unit_key("department", prompt)
+    analyses = checkpoint.get(unit) if checkpoint is not None else None
+    retried = {}
+    if analyses is None:
+        with telemetry.call("analyze_department_pack", ", ".join(departments)) as call:
+            try:
+                # A unit that failed before is not served from the cache
+                response = generate_content(model, prompt, use_cache=checkpoint is None or not checkpoint.failed_before(unit))
+                usage = response_token_usage(prompt, response)
+                analyses = json.loads(extract_json_text(response.text))
+                if not isinstance(analyses, dict):
+                    raise ValueError("Packed department analysis is not a JSON object")
+            except Exception as e:
+                logger.error(f"Error analyzing departments {', '.join(departments)}: {str(e)}")
+                call.outcome = OUTCOME_PARSE_ERROR if call.model is not None else OUTCOME_CALL_ERROR
+                call.error = f"{type(e).__name__}: {str(e)[:200]}"
+                analyses = {}
+                if not usage["calls"]:
+                    usage = {"calls": 1, "prompt_tokens": estimate_tokens(prompt), "response_tokens": 0}
+            
+            missing = [dept for dept in departments if not isinstance(analyses.get(dept), dict)]
+            if missing and call.outcome is None:
+                call.outcome = OUTCOME_PARTIAL
+                call.error = f"Missing departments: {', '.join(missing)}"
+        if checkpoint is not None:
+            parsed = {dept: analyses[dept] for dept in departments if dept not in missing}
+            if parsed:
+                checkpoint.save(unit, parsed)
+            for dept in missing:
+                checkpoint.mark_failed(unit, dept)
+    else:
+        # Departments missing from the checkpointed answer are sent again
+        missing_batches = [batch for batch in batches if not isinstance(analyses.get(batch["department"]), dict)]
+        if missing_batches:
+            retried = {batch["department"]: (batch, result)
+                       for batch, result in analyze_department_pack(model, _department_pack(missing_batches), checkpoint)}
+    
+    # Attribute the call's tokens to the departments by their share of the prompt
+    weights = [estimate_tokens(_packed_department_section(batch)) for batch in batches]
+    total_weight = sum(weights) or 1
+    instructions_share = estimate_tokens(_packed_department_prompt([])) // len(batches)
+    results = []
+    for batch, weight in zip(batches, weights):
+        if batch["department"] in retried:
+            results.append(retried[batch["department"]])
+            continue
+        analysis = analyses.get(batch["department"])
+        if not isinstance(analysis, dict):
+            analysis = None
+        sections = {"instructions": instructions_share + weight - batch["sections"]["objectives"],
+                    "objectives": batch["sections"]["objectives"]}
+        results.append(({**batch, "sections": sections}, (analysis, {
+            "calls": usage["calls"],
+            "prompt_tokens": usage["prompt_tokens"] * weight // total_weight,
+            "response_tokens": usage["response_tokens"] * weight // total_weight
+        })))
+    return results
+
+def response_token_usage(prompt: str, response) -> Dict[str, int]:
+    """
+    Tokens sent and received by a call
+    
+    Uses the usage metadata Gemini returns, or estimates from the text for
+    cached and offline responses.
+    
+    Args:
+        prompt: Prompt text
+        response: Response object
+        
+    Returns:
+        Dict with calls, prompt_tokens and response_tokens
+    """
+    usage_metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+    response_tokens = getattr(usage_metadata, "candidates_token_count", None)
+    return {
+        "calls": 1,
+        "prompt_tokens": prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+        "response_tokens": response_tokens if response_tokens is not None else estimate_tokens(response.text)
+    }
+
+def merge_department_batches(dept: str, objectives: List[Dict[str, Any]], risk_categories: Dict[str, int],
+                             results: List[tuple]) -> Dict[str, Any]:
+    """
+    Combine the batch analyses of a department and apply them to its objectives
+    
+    Args:
+        dept: Department name
+        objectives: The department's control objectives
+        risk_categories: Department risk matrix row
+        results: (batch, (analysis, usage)) pairs of the department's batches
         
+    Returns:
+        Department analysis with "token_usage"
+    """
+    token_usage = {"calls": 0, "prompt_tokens": 0, "response_tokens": 0, "sections": {}}
+    for batch, (_, usage) in results:
+        token_usage["calls"] += usage["calls"]
+        token_usage["prompt_tokens"] += usage["prompt_tokens"]
+        token_usage["response_tokens"] += usage["response_tokens"]
+        for section, tokens in batch["sections"].items():
+            token_usage["sections"][section] = token_usage["sections"].get(section, 0) + tokens
+    logger.info(f"{dept}: {token_usage['calls']} calls, {token_usage['prompt_tokens']} tokens sent, "
+                f"{token_usage['response_tokens']} tokens received")
+    
+    # Keep the batch order of the plan
+    results = sorted(results, key=lambda result: min(result[0]["groups"], default=0))
+    analyses = [(batch, analysis) for batch, (analysis, _) in results if analysis is not None]
+    
+    if not analyses:
+        dept_analysis = _fallback_department_analysis(dept, risk_categories)
+        dept_analysis["token_usage"] = token_usage
         return dept_analysis
+    
+    risk_order = {"low": 1, "medium": 2, "high": 3}
+    dept_analysis = dict(analyses[0][1])
+    dept_analysis.setdefault("risk_categories", risk_categories)
+    dept_analysis["key_risks"] = []
+    dept_analysis["risk_types"] = {}
+    dept_analysis["control_gaps"] = []
+    
+    for batch, analysis in analyses:
+        level = analysis.get("overall_risk_level", "")
+        if risk_order.get(str(level).lower(), 0) > risk_order.get(str(dept_analysis.get("overall_risk_level", "")).lower(), 0):
+            dept_analysis["overall_risk_level"] = level
+        dept_analysis["key_risks"] += [risk for risk in analysis.get("key_risks", []) if risk not in dept_analysis["key_risks"]]
+        for risk_type, risks in (analysis.get("risk_types") or {}).items():
+            existing = dept_analysis["risk_types"].setdefault(risk_type, [])
+            existing += [risk for risk in risks or [] if risk not in existing]
+        if not dept_analysis.get("summary"):
+            dept_analysis["summary"] = analysis.get("summary", "")
         
-    except Exception as e:
-        logger.error(f"Error analyzing department {dept}: {str(e)}")
-        # Create fallback analysis
-        return {
-            "overall_risk_level": suggested_risk,
-            "risk_categories": risk_categories,
-            "key_risks": [
-                f"{dept} lacks adequate controls",
-                f"{dept} processes may have gaps",
-                f"{dept} risk assessment requires attention"
-            ],
-            "risk_types": {
-                "Operational": [f"{dept} operational processes need review"],
-                "Financial": [f"{dept} financial controls should be evaluated"],
-                "Fraud": [f"{dept} fraud prevention needs assessment"],
-                "Financial_Fraud": [f"{dept} financial reporting controls need review"],
-                "Operational_Fraud": [f"{dept} operational override controls need assessment"]
-            },
-            "summary": f"The {dept} department shows a {suggested_risk.lower()} overall risk level based on analysis of control objectives and risk categories."
-        }
+        # Process control gaps and update objectives with gap information
+        for gap_info in analysis.get("control_gaps", []) or []:
+            if not isinstance(gap_info, dict):
+                continue
+            group = _objectives_for_gap(gap_info, batch["groups"])
+            has_gap = str(gap_info.get("has_gap", "No"))
+            proposed_solution = gap_info.get("proposed_solution", "")
+            if group and not gap_info.get("objective"):
+                gap_info = {"objective": group[0].get("objective", ""), **gap_info}
+            dept_analysis["control_gaps"].append(gap_info)
+            
+            for obj in group:
+                obj["gap_details"] = "Yes" if has_gap.lower() == "yes" else "No"
+                # Always add the proposed solution regardless of gap status
+                if proposed_solution:
+                    obj["proposed_control"] = proposed_solution
+    
+    dept_analysis["token_usage"] = token_usage
+    return dept_analysis
+
+def _objectives_for_gap(gap_info: Dict[str, Any], groups: Dict[int, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Find the objectives a control gap of the response refers to"""
+    try:
+        obj_id = int(str(gap_info.get("id", "")).strip().rstrip("."))
+        if obj_id in groups:
+            return groups[obj_id]
+    except ValueError:
+        pass
+    
+    # Fall back to matching the objective text
+    obj_text = gap_info.get("objective", "")
+    if obj_text:
+        for group in groups.values():
+            objective = group[0].get("objective", "")
+            if objective == obj_text or obj_text in objective:
+                return group
+    return []
+
+def _fallback_department_analysis(dept: str, risk_categories: Dict[str, int]) -> Dict[str, Any]:
+    """Placeholder analysis used when Gemini could not analyze a department"""
+    # Calculate overall risk level based on category values
+    suggested_risk = department_risk_level(risk_categories)
+    
+    # Create fallback analysis
+    return {
+        "overall_risk_level": suggested_risk,
+        "risk_categories": risk_categories,
+        "key_risks": [
+            f"{dept} lacks adequate controls",
+            f"{dept} processes may have gaps",
+            f"{dept} risk assessment requires attention"
+        ],
+        "risk_types": {
+            "Operational": [f"{dept} operational processes need review"],
+            "Financial": [f"{dept} financial controls should be evaluated"],
+            "Fraud": [f"{dept} fraud prevention needs assessment"],
+            "Financial_Fraud": [f"{dept} financial reporting controls need review"],
+            "Operational_Fraud": [f"{dept} operational override controls need assessment"]
+        },
+        "summary": f"The {dept} department shows a {suggested_risk.lower()} overall risk level based on analysis of control objectives and risk categories."
+    }
 
 def calculate_risk_score(data: Dict[str, Any]) -> str:
     """Calculate risk score based on risk distribution"""
@@ -730,34 +1974,57 @@ def generate_recommendations(model, data: Dict[str, Any]) -> List[Dict[str, str]
         ]
         """
         
-        # Get response from Gemini
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from the response
-        try:
-            response_text = response.text
-            # Check if response has JSON code blocks and extract them
-            if "```json" in response_text:
-                json_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                json_text = response_text.split("```")[1].strip()
-            else:
-                json_text = response_text.strip()
+        with telemetry.call("generate_recommendations") as call:
+            # Get response from Gemini
+            response = generate_content(model, prompt)
             
-            recommendations = json.loads(json_text)
-            return recommendations
-        
-        except Exception as json_error:
-            logger.error(f"Error extracting recommendations JSON from Gemini response: {str(json_error)}")
-            logger.debug(f"Raw response: {response.text}")
-            return []
+            # Extract JSON from the response
+            try:
+                response_text = response.text
+                # Check if response has JSON code blocks and extract them
+                if "```json" in response_text:
+                    json_text = response_text.split("```json")[1].split("```")[0].strip()
+                elif "```" in response_text:
+                    json_text = response_text.split("```")[1].strip()
+                else:
+                    json_text = response_text.strip()
+            
+                recommendations = json.loads(json_text)
+                return recommendations
+            
+            except Exception as json_error:
+                logger.error(f"Error extracting recommendations JSON from Gemini response: {str(json_error)}")
+                logger.debug(f"Raw response: {response.text}")
+                call.outcome = OUTCOME_PARSE_ERROR
+                call.error = f"{type(json_error).__name__}: {str(json_error)[:200]}"
+                return []
     
     except Exception as e:
         logger.error(f"Error generating recommendations: {str(e)}")
         return []
 
-def generate_department_recommendations(model, data: Dict[str, Any]) -> List[Dict[str, str]]:
-    """Generate recommendations focused on each department"""
+def generate_department_recommendations(model, data: Dict[str, Any], concurrency: int = None,
+                                        checkpoint: AnalysisCheckpoint = None,
+                                        reused: Dict[str, List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+    """
+    Generate recommendations focused on each department
+    
+    Small departments are packed into shared prompts, prompts are sent to
+    Gemini concurrently and the recommendations are merged in the order of
+    data["departments"].
+    
+    Args:
+        model: Gemini model instance
+        data: Analyzed data with departments, department_risks and control_objectives
+        concurrency: Maximum number of concurrent Gemini requests (defaults to ANALYSIS_CONCURRENCY)
+        checkpoint: Checkpoint of completed departments (optional)
+        reused: Recommendations kept from an earlier version of the document, by
+            department; these departments are not sent again (optional)
+        
+    Returns:
+        List of recommendations
+    """
+    reused = reused or {}
     try:
         # Get list of departments
         departments = data.get("departments", [])
@@ -767,107 +2034,27 @@ def generate_department_recommendations(model, data: Dict[str, Any]) -> List[Dic
         # Get department risks
         dept_risks = data.get("department_risks", {})
         
-        all_recommendations = []
+        # Get objectives for each department
+        objectives_by_dept = {}
+        for obj in data.get("control_objectives", []):
+            objectives_by_dept.setdefault(obj.get("department"), []).append(obj)
+        
+        # Skip departments without an analysis
+        pending = [
+            (dept, _department_info(dept, dept_risks[dept], objectives_by_dept.get(dept, [])))
+            for dept in departments if dept not in reused and dept_risks.get(dept)
+        ]
+        packs = pack_department_recommendations(pending)
+        if len(packs) < len(pending):
+            logger.info(f"Packed {len(pending)} department recommendation prompts into {len(packs)} requests")
+        
+        dept_results = dict(reused)
+        for pack_results in map_concurrently(lambda pack: _department_recommendations(model, pack, dept_risks, checkpoint), packs, concurrency):
+            dept_results.update(pack_results)
         
+        all_recommendations = []
         for dept in departments:
-            # Collect department-specific data
-            dept_data = dept_risks.get(dept, {})
-            
-            # Skip if empty
-            if not dept_data:
-                continue
-                
-            risk_level = dept_data.get("overall_risk_level", "Medium")
-            key_risks = dept_data.get("key_risks", [])
-            
-            # Create a summary of risk data for this department
-            dept_info = f"Department: {dept}\n"
-            dept_info += f"Overall Risk Level: {risk_level}\n"
-            
-            if key_risks:
-                dept_info += "Key Risks:\n"
-                for risk in key_risks:
-                    dept_info += f"- {risk}\n"
-                    
-            # Get objectives for this department
-            dept_objectives = [obj for obj in data.get("control_objectives", []) if obj.get("department") == dept]
-            
-            if dept_objectives:
-                # Find high risk objectives
-                high_risk_objs = [obj for obj in dept_objectives if obj.get("risk_level", "").lower() in ["high", "h", "critical"]]
-                med_risk_objs = [obj for obj in dept_objectives if obj.get("risk_level", "").lower() in ["medium", "m", "moderate"]]
-                
-                if high_risk_objs or med_risk_objs:
-                    # Prioritize high risk objectives, then medium
-                    priority_objs = high_risk_objs[:2] + med_risk_objs[:1] if high_risk_objs else med_risk_objs[:2]
-                    
-                    for obj in priority_objs:
-                        dept_info += f"\nControl Objective: {obj.get('objective', '')}\n"
-                        dept_info += f"Risk: {obj.get('what_can_go_wrong', '')}\n"
-                        dept_info += f"Risk Level: {obj.get('risk_level', '')}\n"
-                        
-            # Generate recommendations using Gemini
-            prompt = f"""
-            As a Risk Control Matrix expert, create detailed, specific recommendations for the {dept} department based on the risk analysis below:
-            
-            {dept_info}
-            
-            Create 2-3 specific, actionable recommendations that:
-            1. Address the highest-priority risks identified
-            2. Provide detailed, practical solutions (not general advice)
-            3. Include specific actions, tools, or controls to implement
-            4. Explain the expected impact of implementing the recommendation
-            
-            For each recommendation, include:
-            - A clear title summarizing the recommendation
-            - A detailed description with specific steps for implementation (at least 3-4 sentences)
-            - The expected impact/benefit
-            - The priority level (High/Medium/Low)
-            
-            Format your response as a JSON array:
-            [
-                {{
-                    "department": "{dept}",
-                    "title": "Recommendation Title",
-                    "description": "Detailed, specific recommendation with actionable steps",
-                    "impact": "Expected impact of implementation",
-                    "priority": "High/Medium/Low"
-                }}
-            ]
-            """
-            
-            try:
-                # Get response from Gemini
-                response = model.generate_content(prompt)
-                response_text = response.text
-                
-                # Extract JSON
-                if "```json" in response_text:
-                    json_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    json_text = response_text.split("```")[1].strip()
-                else:
-                    json_text = response_text.strip()
-                
-                # Parse recommendations
-                dept_recommendations = json.loads(json_text)
-                
-                # Ensure it's a list
-                if isinstance(dept_recommendations, dict):
-                    dept_recommendations = [dept_recommendations]
-                    
-                all_recommendations.extend(dept_recommendations)
-                    
-            except Exception as e:
-                logger.error(f"Error generating recommendations for {dept}: {str(e)}")
-                # Add a fallback recommendation
-                all_recommendations.append({
-                    "department": dept,
-                    "title": f"Review Control Framework for {dept}",
-                    "description": f"Conduct a comprehensive review of the control framework in the {dept} department, focusing on high-risk areas. Implement additional preventive controls to address potential gaps and automate manual processes where possible to reduce human error.",
-                    "impact": "Strengthened control environment and reduced risk exposure",
-                    "priority": risk_level
-                })
+            all_recommendations.extend(dept_results.get(dept, []))
         
         return all_recommendations
                 
@@ -879,4 +2066,205 @@ def generate_department_recommendations(model, data: Dict[str, Any]) -> List[Dic
             "description": "Conduct a comprehensive review of the control framework across all departments, focusing on high-risk areas. Implement additional preventive controls and automate manual processes where possible.",
             "impact": "Strengthened control environment and reduced risk exposure",
             "priority": "High"
-        }] 
\ No newline at end of file
+        }] 
+
+def pack_department_recommendations(departments: List[tuple], token_budget: int = None,
+                                    max_departments: int = None) -> List[List[tuple]]:
+    """
+    Group departments into recommendation prompts
+    
+    Args:
+        departments: (department, risk summary) pairs, in order
+        token_budget: Maximum estimated prompt tokens (defaults to DEPARTMENT_PROMPT_TOKEN_BUDGET)
+        max_departments: Maximum departments per prompt (defaults to DEPARTMENT_PACK_MAX_DEPARTMENTS)
+        
+    Returns:
+        Packs of (department, risk summary) pairs
+    """
+    token_budget = token_budget or DEPARTMENT_PROMPT_TOKEN_BUDGET
+    max_departments = max_departments or DEPARTMENT_PACK_MAX_DEPARTMENTS
+    instructions_tokens = estimate_tokens(_packed_recommendations_prompt([]))
+    
+    packs = []
+    current, current_tokens = [], instructions_tokens
+    for dept, dept_info in departments:
+        tokens = estimate_tokens(_packed_recommendations_section(dept, dept_info))
+        if current and (len(current) >= max_departments or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current, current_tokens = [], instructions_tokens
+        current.append((dept, dept_info))
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def _department_info(dept: str, dept_data: Dict[str, Any], dept_objectives: List[Dict[str, Any]]) -> str:
+    """Summarize a department's risk analysis for its recommendations prompt"""
+    risk_level = dept_data.get("overall_risk_level", "Medium")
+    key_risks = dept_data.get("key_risks", [])
+    
+    # Create a summary of risk data for this department
+    dept_info = f"Department: {dept}\n"
+    dept_info += f"Overall Risk Level: {risk_level}\n"
+    
+    if key_risks:
+        dept_info += "Key Risks:\n"
+        for risk in key_risks:
+            dept_info += f"- {risk}\n"
+            
+    if dept_objectives:
+        # Find high risk objectives
+        high_risk_objs = [obj for obj in dept_objectives if obj.get("risk_level", "").lower() in ["high", "h", "critical"]]
+        med_risk_objs = [obj for obj in dept_objectives if obj.get("risk_level", "").lower() in ["medium", "m", "moderate"]]
+        
+        if high_risk_objs or med_risk_objs:
+            # Prioritize high risk objectives, then medium
+            priority_objs = high_risk_objs[:2] + med_risk_objs[:1] if high_risk_objs else med_risk_objs[:2]
+            
+            for obj in priority_objs:
+                dept_info += f"\nControl Objective: {obj.get('objective', '')}\n"
+                dept_info += f"Risk: {obj.get('what_can_go_wrong', '')}\n"
+                dept_info += f"Risk Level: {obj.get('risk_level', '')}\n"
+    
+    return dept_info
+
+def _recommendations_prompt(dept: str, dept_info: str) -> str:
+    """Assemble the recommendations prompt of a single department"""
+    return f"""
+    As a Risk Control Matrix expert, create detailed, specific recommendations for the {dept} department based on the risk analysis below:
+    
+    {dept_info}
+    
+    Create 2-3 specific, actionable recommendations that:
+    1. Address the highest-priority risks identified
+    2. Provide detailed, practical solutions (not general advice)
+    3. Include specific actions, tools, or controls to implement
+    4. Explain the expected impact of implementing the recommendation
+    
+    For each recommendation, include:
+    - A clear title summarizing the recommendation
+    - A detailed description with specific steps for implementation (at least 3-4 sentences)
+    - The expected impact/benefit
+    - The priority level (High/Medium/Low)
+    
+    Format your response as a JSON array:
+    [
+        {{
+            "department": "{dept}",
+            "title": "Recommendation Title",
+            "description": "Detailed, specific recommendation with actionable steps",
+            "impact": "Expected impact of implementation",
+            "priority": "High/Medium/Low"
+        }}
+    ]
+    """
+
+def _packed_recommendations_section(dept: str, dept_info: str) -> str:
+    """Format one department of a packed recommendations prompt"""
+    return f"""
+    === DEPARTMENT: {dept} ===
+    {dept_info}
+    """
+
+def _packed_recommendations_prompt(departments: List[tuple]) -> str:
+    """Assemble a recommendations prompt covering several departments"""
+    sections = "".join(_packed_recommendations_section(dept, dept_info) for dept, dept_info in departments)
+    return f"""
+    As a Risk Control Matrix expert, create detailed, specific recommendations for each of the following departments based on the risk analyses below:
+    {sections}
+    For EACH department, create 2-3 specific, actionable recommendations that:
+    1. Address the highest-priority risks identified
+    2. Provide detailed, practical solutions (not general advice)
+    3. Include specific actions, tools, or controls to implement
+    4. Explain the expected impact of implementing the recommendation
+    
+    For each recommendation, include:
+    - A clear title summarizing the recommendation
+    - A detailed description with specific steps for implementation (at least 3-4 sentences)
+    - The expected impact/benefit
+    - The priority level (High/Medium/Low)
+    
+    Format your response as a JSON object with one entry per department, keyed by the exact department name:
+    {{
+        "<department name>": [
+            {{
+                "title": "Recommendation Title",
+                "description": "Detailed, specific recommendation with actionable steps",
+                "impact": "Expected impact of implementation",
+                "priority": "High/Medium/Low"
+            }}
+        ]
+    }}
+    """
+
+def _department_recommendations(model, pack: List[tuple], dept_risks: Dict[str, Dict[str, Any]],
+                                checkpoint: AnalysisCheckpoint = None) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Generate the recommendations of a pack of departments
+    
+    Departments that parsed are checkpointed even when others are missing from
+    the answer; re-running the analysis then sends only the missing departments.
+    """
+    departments = [dept for dept, _ in pack]
+    if len(pack) == 1:
+        prompt = _recommendations_prompt(*pack[0])
+    else:
+        prompt = _packed_recommendations_prompt(pack)
+    
+    unit = AnalysisCheckpoint.unit_key("recommendations", prompt)
+    if checkpoint is not None and checkpoint.get(unit) is not None:
+        # Every recommendations unit holds the parsed recommendations by department
+        saved = dict(checkpoint.get(unit))
+        missing = [item for item in pack if item[0] not in saved]
+        if missing:
+            saved.update(_department_recommendations(model, missing, dept_risks, checkpoint))
+        return saved
+    
+    results = {}
+    try:
+        with telemetry.call("department_recommendations", ", ".join(departments)) as call:
+            # Get response from Gemini; a unit that failed before is not served from the cache
+            response = generate_content(model, prompt, use_cache=checkpoint is None or not checkpoint.failed_before(unit))
+            parsed = json.loads(extract_json_text(response.text))
+            
+            if len(pack) == 1:
+                parsed = {departments[0]: parsed}
+            elif not isinstance(parsed, dict):
+                raise ValueError("Packed recommendations are not a JSON object")
+            
+            for dept in departments:
+                dept_recommendations = parsed.get(dept)
+                # Ensure it's a list
+                if isinstance(dept_recommendations, dict):
+                    dept_recommendations = [dept_recommendations]
+                if not isinstance(dept_recommendations, list):
+                    continue
+                for rec in dept_recommendations:
+                    if isinstance(rec, dict):
+                        rec.setdefault("department", dept)
+                results[dept] = dept_recommendations
+            
+            if len(results) < len(departments):
+                call.outcome = OUTCOME_PARTIAL
+                call.error = f"Missing departments: {', '.join(dept for dept in departments if dept not in results)}"
+    except Exception as e:
+        logger.error(f"Error generating recommendations for {', '.join(departments)}: {str(e)}")
+    
+    if checkpoint is not None:
+        if results:
+            checkpoint.save(unit, dict(results))
+        for dept in departments:
+            if dept not in results:
+                checkpoint.mark_failed(unit, dept)
+    
+    for dept in departments:
+        if dept not in results:
+            # Add a fallback recommendation
+            results[dept] = [{
+                "department": dept,
+                "title": f"Review Control Framework for {dept}",
+                "description": f"Conduct a comprehensive review of the control framework in the {dept} department, focusing on high-risk areas. Implement additional preventive controls to address potential gaps and automate manual processes where possible to reduce human error.",
+                "impact": "Strengthened control environment and reduced risk exposure",
+                "priority": dept_risks.get(dept, {}).get("overall_risk_level", "Medium")
+            }]
+    return results
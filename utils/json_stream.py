@@ -0,0 +1,103 @@
+import re
+import json
+from typing import List, Any
+
+class JsonArrayStreamParser:
+    """
+    Incremental parser for the elements of one array inside a streamed JSON document
+
+    Text is fed as it arrives from a streaming LLM response. As soon as an
+    element of the array stored under `key` is complete it is decoded and
+    returned, long before the surrounding document is finished. Markdown code
+    fences and any text before the key are ignored.
+    """
+
+    def __init__(self, key: str):
+        """
+        Args:
+            key: Name of the property holding the array, e.g. "departments"
+        """
+        self._start_pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self.done = False
+
+        # Scanner state inside the array
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume the next piece of the response
+
+        Args:
+            text: Newly received text
+
+        Returns:
+            Array elements completed by this piece, in order
+        """
+        if self.done or not text:
+            return []
+
+        self._buffer += text
+        if not self._in_array:
+            match = self._start_pattern.search(self._buffer, self._pos)
+            if not match:
+                # Keep enough text to find a key split across pieces
+                self._pos = max(self._pos, len(self._buffer) - 256)
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        items = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        items.append(self._decode(buffer[self._item_start:i + 1]))
+                        self._item_start = None
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 0:
+                    self._item_start = i
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the array
+                    self.done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    items.append(self._decode(buffer[self._item_start:i + 1]))
+                    self._item_start = None
+            i += 1
+
+        # Drop the consumed text, keeping a partial element
+        keep = self._item_start if self._item_start is not None else i
+        self._buffer = buffer[keep:]
+        if self._item_start is not None:
+            self._item_start = 0
+        self._pos = i - keep
+
+        return [item for item in items if item is not None]
+
+    @staticmethod
+    def _decode(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
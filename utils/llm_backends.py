@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+try:
+    from google.api_core.exceptions import ServiceUnavailable as MockServiceError
+except ImportError:
+    MockServiceError = ConnectionError
+
+# Default directory of recorded responses
+REPLAY_DIR = os.path.join(os.getcwd(), "llm_recordings")
+
+class LLMResponse:
+    """Response of an LLM backend, shaped like a Gemini response (only .text is used)"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+class LLMBackend(ABC):
+    """
+    Interface of the language model used by utils.gemini
+
+    Backends expose model_name and generation_config (used for cache keys) and
+    generate_content(prompt, stream=False), which returns an object with a
+    .text attribute or, when streaming, an iterable of such chunks. A Gemini
+    GenerativeModel satisfies the same interface. Subclasses implement
+    generate_text and may override generate_content to stream natively.
+    """
+
+    model_name = "backend"
+    generation_config = None
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        """
+        Generate a response
+
+        Args:
+            prompt: Prompt text
+            stream: Return the response as an iterable of chunks
+
+        Returns:
+            Response with .text, or an iterable of chunks with .text when streaming
+        """
+        text = self.generate_text(prompt)
+        return _chunked(text) if stream else LLMResponse(text)
+
+    @abstractmethod
+    def generate_text(self, prompt: str) -> str:
+        """Generate the response text for a prompt"""
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through a google.generativeai GenerativeModel"""
+
+    def __init__(self, model):
+        """
+        Args:
+            model: Configured genai.GenerativeModel
+        """
+        self.model = model
+
+    @property
+    def model_name(self) -> str:
+        return self.model.model_name
+
+    @property
+    def generation_config(self) -> Any:
+        return getattr(self.model, "generation_config", None)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        return self.model.generate_content(prompt, stream=stream)
+
+    def generate_text(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text
+
+class ReplayMissError(LookupError):
+    """Raised when a replay backend has no recording for a prompt"""
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Serves responses recorded on disk, optionally recording them from another backend
+
+    Recordings are stored one JSON file per prompt, named by the prompt's hash.
+    In "replay" mode a prompt without a recording raises ReplayMissError; in
+    "record" mode it is sent to the wrapped backend and the answer saved.
+    """
+
+    def __init__(self, directory: str = None, backend: LLMBackend = None, mode: str = "replay"):
+        """
+        Args:
+            directory: Directory of the recordings (defaults to REPLAY_DIR)
+            backend: Backend answering prompts that have no recording (required to record)
+            mode: "replay" or "record"
+        """
+        if mode not in ("replay", "record"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        if mode == "record" and backend is None:
+            raise ValueError("Recording requires a backend to record from")
+
+        self.directory = directory or REPLAY_DIR
+        self.backend = backend
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.backend, "model_name", "replay")
+
+    @property
+    def generation_config(self) -> Any:
+        return getattr(self.backend, "generation_config", None)
+
+    def _path(self, prompt: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}.json")
+
+    def generate_text(self, prompt: str) -> str:
+        path = self._path(prompt)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            with self._lock:
+                self.hits += 1
+            return text
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+
+        if self.mode == "replay":
+            raise ReplayMissError(f"No recorded response for prompt {os.path.basename(path)[:12]}")
+
+        text = self.backend.generate_content(prompt).text
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "prompt": prompt, "text": text}, f)
+        os.replace(tmp_path, path)
+        return text
+
+class MockBackend(LLMBackend):
+    """
+    Offline backend with configurable latency and failure rate
+
+    Answers every prompt of the analysis pipeline with well-formed JSON of the
+    expected shape (see mock_response), after sleeping for the configured
+    latency. A fraction of calls fail with a transient service error so retry
+    and fallback paths can be exercised.
+    """
+
+    model_name = "mock"
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, failure_rate: float = 0.0,
+                 seed: int = None, responder: Callable[[str], str] = None):
+        """
+        Args:
+            latency: Seconds each call takes
+            jitter: Maximum random extra latency in seconds
+            failure_rate: Probability (0-1) that a call raises a transient error
+            seed: Seed for reproducible jitter and failures
+            responder: Function building the response text for a prompt (defaults to mock_response)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.responder = responder or mock_response
+        self.generation_config = {"latency": latency, "jitter": jitter, "failure_rate": failure_rate}
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        return delay, failed
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        delay, failed = self._draw()
+        if not stream:
+            time.sleep(delay)
+            if failed:
+                raise MockServiceError("Mock backend failure")
+            return LLMResponse(self.responder(prompt))
+
+        if failed:
+            time.sleep(delay)
+            raise MockServiceError("Mock backend failure")
+        return _chunked(self.responder(prompt), delay)
+
+    def generate_text(self, prompt: str) -> str:
+        return self.generate_content(prompt).text
+
+def _chunked(text: str, duration: float = 0.0, chunks: int = 8):
+    """Yield a response in chunks spread over the given duration"""
+    size = max(1, -(-len(text) // chunks))
+    for start in range(0, max(len(text), 1), size):
+        if duration:
+            time.sleep(duration / chunks)
+        yield LLMResponse(text[start:start + size])
+
+def mock_response(prompt: str) -> str:
+    """
+    Build a plausible response for the prompts sent by utils.gemini
+
+    Args:
+        prompt: Prompt text
+
+    Returns:
+        JSON response in a Markdown code block, shaped like the prompt asks
+    """
+    sections = re.split(r"^\s*=== DEPARTMENT: (.*) ===$", prompt, flags=re.MULTILINE)
+    if len(sections) > 1 and "recommendations for each of the following departments" in prompt:
+        result = {dept.strip(): _mock_recommendations(dept.strip()) for dept in sections[1::2]}
+    elif len(sections) > 1:
+        result = {dept.strip(): _mock_department(dept.strip(), text) for dept, text in zip(sections[1::2], sections[2::2])}
+    elif "DEPARTMENT: " in prompt:
+        dept = prompt.split("DEPARTMENT: ", 1)[1].split("\n", 1)[0].strip()
+        result = _mock_department(dept, prompt)
+    elif "recommendations for the " in prompt:
+        dept = prompt.split("recommendations for the ", 1)[1].split(" department", 1)[0]
+        result = _mock_recommendations(dept)
+    elif '"overall_recommendations"' in prompt:
+        focus = prompt.split("especially focusing on these specific departments:", 1)[-1].split("\n", 2)[1].strip()
+        names = [] if focus.startswith("All departments") else [name.strip() for name in focus.split(",") if name.strip()]
+        result = {
+            "departments": [
+                {"name": name, "overall_risk_level": "Medium", "key_risks": [f"{name} risk"],
+                 "risk_analysis": {"Operational": [f"{name} process risk"], "Financial": []},
+                 "control_gaps": [{"gap_title": f"{name} gap", "impact": "Medium", "recommendation": "Add review"}],
+                 "summary": f"Mock analysis of {name}"}
+                for name in names or ["General"]
+            ],
+            "overall_recommendations": [
+                {"title": "Automate key controls", "priority": "High", "description": "Mock recommendation", "impact": "Fewer errors"}
+            ]
+        }
+    elif '"control_objectives": [' in prompt:
+        result = {
+            "departments": ["General"],
+            "control_objectives": [
+                {"department": "General", "objective": "Mock objective", "what_can_go_wrong": "Mock risk",
+                 "risk_level": "Medium", "control_activities": "Mock control", "is_gap": False,
+                 "gap_details": "", "proposed_control": ""}
+            ],
+            "gaps": [],
+            "department_risks": {"General": {"overall_risk_level": "Medium", "risk_categories": {"Operational": 3},
+                                             "key_risks": ["Mock risk"], "summary": "Mock analysis"}},
+            "risk_distribution": {"Low": 0, "Medium": 1, "High": 0},
+            "total_controls": 1,
+            "control_gaps": 0
+        }
+    elif "recommendations" in prompt:
+        result = [{"title": "Mock recommendation", "priority": "Medium", "description": "Mock recommendation",
+                   "impact": "Reduced risk", "complexity": "Low"}]
+    else:
+        result = {}
+
+    return f"```json\n{json.dumps(result, indent=2)}\n```"
+
+def _mock_department(dept: str, text: str) -> dict:
+    """Mock analysis of a department from the objectives listed in its prompt text"""
+    objectives = re.findall(r"^\s*(\d+)\. Objective: (.*)$", text, re.MULTILINE)
+    return {
+        "overall_risk_level": "Medium",
+        "key_risks": [f"{dept} control weakness {i + 1}" for i in range(3)],
+        "risk_types": {risk_type: [f"{risk_type} risk in {dept}"] for risk_type in
+                       ["Operational", "Financial", "Fraud", "Financial_Fraud", "Operational_Fraud"]},
+        "summary": f"Mock analysis of the {dept} department",
+        "control_gaps": [
+            {"id": obj_id, "has_gap": "Yes" if i % 2 == 0 else "No",
+             "proposed_solution": f"Automate and review control for: {objective.strip()[:60]}"}
+            for i, (obj_id, objective) in enumerate(objectives)
+        ]
+    }
+
+def _mock_recommendations(dept: str) -> list:
+    """Mock recommendations of a department"""
+    return [
+        {"department": dept, "title": f"Strengthen {dept} control {i + 1}", "description": "Mock recommendation",
+         "impact": "Reduced risk exposure", "priority": "High" if i == 0 else "Medium"}
+        for i in range(2)
+    ]
@@ -0,0 +1,121 @@
+import sys
+from collections.abc import MutableMapping
+from typing import Dict, Any, Iterator
+
+class Record(MutableMapping):
+    """
+    Compact, dict-compatible record with a fixed set of slotted fields
+
+    Records behave like the plain dicts used throughout the pipeline (get, [],
+    in, keys, items, update, ==) but store known fields in __slots__ instead
+    of a per-instance hash table. Low-cardinality string fields such as the
+    department and risk level are interned so every record shares one copy.
+    Keys outside the known fields are kept in a small overflow dict.
+
+    Records are not dict instances: isinstance(record, dict) is False and
+    json.dumps cannot serialize them. Convert them with to_dict() before
+    handing them to code that needs a real dict.
+    """
+
+    __slots__ = ("_extra",)
+
+    # Field names stored in slots, in the order they are listed
+    _fields = ()
+
+    # Fields whose string values are interned
+    _interned = ()
+
+    def __init__(self, values: Dict[str, Any] = None, **kwargs):
+        self._extra = None
+        if values:
+            kwargs = {**values, **kwargs}
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, values: Any):
+        """Build a record from a dict, returning existing records unchanged"""
+        return values if isinstance(values, cls) else cls(values)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._fields:
+            if key in self._interned and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self._fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._fields:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self._fields:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self._extra = None
+        for key, value in state.items():
+            self[key] = value
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a plain dict"""
+        return dict(self.items())
+
+    def copy(self):
+        """Shallow copy of the record"""
+        return type(self)(self.to_dict())
+
+class ControlObjective(Record):
+    """A control objective row of a Risk Control Matrix"""
+
+    __slots__ = _fields = (
+        "department", "objective", "what_can_go_wrong", "risk_level", "control_activities",
+        "is_gap", "gap_details", "proposed_control", "area_subprocess", "risk_types"
+    )
+    _interned = ("department", "risk_level", "area_subprocess")
+
+class ControlGap(Record):
+    """A control gap identified for a control objective"""
+
+    __slots__ = _fields = (
+        "department", "control_objective", "gap_title", "description",
+        "risk_impact", "proposed_solution", "area_subprocess"
+    )
+    _interned = ("department", "area_subprocess")
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location, lifetime and size limit of the LLM response cache
+RESPONSE_CACHE_PATH = os.path.join(os.getcwd(), "llm_cache", "responses.sqlite3")
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM response texts
+
+    Responses are keyed by a hash of the prompt, model name and generation
+    config. Entries older than ttl seconds are treated as misses, and when the
+    stored text exceeds max_bytes the least recently used entries are removed.
+    Setting enabled to False bypasses the cache entirely.
+    """
+
+    def __init__(self, db_path: str = RESPONSE_CACHE_PATH, ttl: float = RESPONSE_CACHE_TTL,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES, enabled: bool = True):
+        """
+        Args:
+            db_path: SQLite database file
+            ttl: Lifetime of an entry in seconds (None keeps entries until evicted)
+            max_bytes: Total response size the cache is trimmed to after each write
+            enabled: Whether lookups and writes go to the cache
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @staticmethod
+    def key(prompt: str, model_name: str, generation_config: Any = None) -> str:
+        """Build the cache key for a prompt sent to a model with a generation config"""
+        config = json.dumps(generation_config, sort_keys=True, default=str)
+        digest = hashlib.sha256()
+        for part in (model_name or "", config, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A short-lived connection per operation keeps the cache safe to use from
+        # the department analysis thread pool
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            with self._lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        response TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached response text, or None on a miss, when expired or when the cache is disabled
+        """
+        if not self.enabled:
+            return None
+
+        text = None
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row and self.ttl is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                elif row:
+                    text = row[0]
+                    # Mark as recently used for LRU eviction
+                    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Could not read LLM response cache: {str(e)}")
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return text
+
+    def put(self, key: str, text: str):
+        """
+        Store a response and evict old entries if the cache is too large
+
+        Args:
+            key: Cache key
+            text: Response text
+        """
+        if not self.enabled:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, text, len(text.encode("utf-8")), now, now)
+                )
+                self._evict(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Could not write LLM response cache entry: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Remove expired entries, then least recently used ones until the cache fits in max_bytes"""
+        if self.ttl is not None:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        """Remove every cached response and reset the counters"""
+        if os.path.exists(self.db_path):
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM responses")
+                conn.commit()
+            finally:
+                conn.close()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache statistics
+
+        Returns:
+            Hit and miss counts, hit rate, number of entries and total size in bytes
+        """
+        entries, size = 0, 0
+        if os.path.exists(self.db_path):
+            conn = self._connect()
+            try:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            finally:
+                conn.close()
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+
+# Process-wide cache used by utils.gemini
+response_cache = ResponseCache()
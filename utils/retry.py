@@ -0,0 +1,163 @@
+import time
+import random
+import threading
+from typing import Callable, Any
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    TRANSIENT_API_ERRORS = (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.Aborted,
+        google_exceptions.Unknown
+    )
+except ImportError:
+    TRANSIENT_API_ERRORS = ()
+
+# Default retry schedule for LLM calls
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 20.0
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because its circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while after repeated transient errors
+
+    After failure_threshold consecutive failures the breaker opens and every
+    call is refused with CircuitOpenError. Once reset_timeout seconds have
+    passed a single trial call is let through (half-open); its success closes
+    the breaker again and its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds to wait before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state: closed, open or half-open"""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(f"Circuit open after {self.failures} consecutive failures")
+            self._trial_running = True
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Count a failed call, opening the breaker at the threshold"""
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_running:
+                    logger.warning(f"Opening circuit breaker after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check whether an error is worth retrying
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        True for rate limits, server errors, timeouts and connection problems
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if TRANSIENT_API_ERRORS and isinstance(error, TRANSIENT_API_ERRORS):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def call_with_retry(func: Callable, *args, max_attempts: int = None, base_delay: float = None,
+                    max_delay: float = None, breaker: CircuitBreaker = None,
+                    is_retryable: Callable[[Exception], bool] = is_transient_error, **kwargs) -> Any:
+    """
+    Call a function, retrying transient errors with exponential backoff and full jitter
+
+    Args:
+        func: Function to call
+        *args: Positional arguments for func
+        max_attempts: Total number of attempts (defaults to RETRY_MAX_ATTEMPTS)
+        base_delay: Upper bound of the first backoff delay in seconds; doubles on every retry
+            (defaults to RETRY_BASE_DELAY)
+        max_delay: Cap of the backoff delay in seconds (defaults to RETRY_MAX_DELAY)
+        breaker: Circuit breaker guarding the service (optional)
+        is_retryable: Decides whether an error is transient
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The function's return value
+
+    Raises:
+        CircuitOpenError: If the breaker refuses the call
+        Exception: The last error once attempts are exhausted, or any non-transient error
+    """
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+
+    for attempt in range(max_attempts):
+        if breaker is not None:
+            breaker.before_call()
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # The service answered; the request itself was bad
+                    breaker.record_success()
+            if not retryable or attempt == max_attempts - 1:
+                raise
+
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"Transient error ({type(e).__name__}: {str(e)}), retrying in {delay:.1f}s "
+                           f"(attempt {attempt + 2}/{max_attempts})")
+            time.sleep(delay)
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -0,0 +1,271 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any, List, Optional
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location and size limit of department analyses kept for later document versions
+REVISION_DIR = os.path.join(os.getcwd(), "analysis_revisions")
+REVISION_MAX_BYTES = 128 * 1024 * 1024
+
+# Fields of a control objective read from the document
+OBJECTIVE_FIELDS = ("department", "objective", "what_can_go_wrong", "risk_level", "control_activities",
+                    "is_gap", "gap_details", "proposed_control", "area_subprocess")
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def objective_fingerprint(obj: Dict[str, Any]) -> str:
+    """
+    Hash the document content of a control objective
+
+    Args:
+        obj: Control objective, before the analysis updates it
+
+    Returns:
+        Hex SHA-256 digest of the objective's fields
+    """
+    return _digest([obj.get(field, "") for field in OBJECTIVE_FIELDS])
+
+def department_fingerprints(data: Dict[str, Any], raw_rows: Dict[str, List[Dict[str, Any]]] = None,
+                            shared_rows: List[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Hash the content of each department of a document
+
+    A department's fingerprint covers its name, its risk categories, its control
+    objectives (in any order) and its raw rows. Rows that belong to no
+    department, such as sheet headers, are part of every fingerprint.
+
+    Args:
+        data: Structured data from process_document
+        raw_rows: Raw sheet rows by department (optional)
+        shared_rows: Raw rows not attributable to a department (optional)
+
+    Returns:
+        Department -> hex SHA-256 digest
+    """
+    objectives_by_dept = {}
+    for obj in data.get("control_objectives", []):
+        objectives_by_dept.setdefault(obj.get("department"), []).append(objective_fingerprint(obj))
+
+    department_risks = data.get("department_risks") or {}
+    raw_rows = raw_rows or {}
+    shared = _digest(shared_rows or [])
+
+    departments = list(data.get("departments") or [])
+    departments += [dept for dept in objectives_by_dept if dept not in departments]
+
+    return {
+        dept: _digest([
+            dept,
+            shared,
+            department_risks.get(dept, {}),
+            sorted(objectives_by_dept.get(dept, [])),
+            sorted(_digest(row) for row in raw_rows.get(dept, []))
+        ])
+        for dept in departments
+    }
+
+class RevisionStore:
+    """
+    Department analyses keyed by the department's content fingerprint
+
+    When a revised version of a document is analyzed, departments whose
+    content is unchanged are found here and their analysis, objective updates,
+    gaps and recommendations reused, so only changed departments are sent to
+    Gemini. Entries are stored one file per analysis version, model and
+    fingerprint. When the store grows beyond max_bytes the least recently
+    used entries are removed; a hit refreshes the entry's modification time.
+    """
+
+    def __init__(self, model_name: str, version: str, directory: str = None, max_bytes: int = None):
+        """
+        Args:
+            model_name: Name of the model whose analyses are stored
+            version: Version of the prompts and entry format; entries of other versions are not reused
+            directory: Directory holding the entries (defaults to REVISION_DIR)
+            max_bytes: Total size the store is trimmed to after each write (defaults to REVISION_MAX_BYTES)
+        """
+        self.model_name = model_name
+        self.version = version
+        self.directory = directory or REVISION_DIR
+        self.max_bytes = max_bytes or REVISION_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, model, version: str, directory: str = None) -> "RevisionStore":
+        """Open the store of a model's analyses"""
+        return cls(getattr(model, "model_name", type(model).__name__), version, directory)
+
+    def _path(self, fingerprint: str) -> str:
+        key = hashlib.sha256(f"{self.version}:{self.model_name}:{fingerprint}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return the stored analysis of a department fingerprint, or None"""
+        entry = None
+        path = self._path(fingerprint)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Discarding unreadable department revision: {str(e)}")
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, fingerprint: str, entry: Dict[str, Any]):
+        """
+        Store the analysis of a department fingerprint and evict old entries if the store is too large
+
+        Args:
+            fingerprint: Department fingerprint
+            entry: Department analysis, objective updates, gaps and recommendations
+        """
+        path = self._path(fingerprint)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Could not write department revision: {str(e)}")
+
+    def evict(self):
+        """Remove least recently used entries until the store fits in max_bytes"""
+        if not os.path.isdir(self.directory):
+            return
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+                except FileNotFoundError:
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def revision(self, data: Dict[str, Any], raw_rows: Dict[str, List[Dict[str, Any]]] = None,
+                 shared_rows: List[Dict[str, Any]] = None) -> "DocumentRevision":
+        """
+        Fingerprint a document and look up its unchanged departments
+
+        Args:
+            data: Structured data from process_document, before the analysis
+            raw_rows: Raw sheet rows by department (optional)
+            shared_rows: Raw rows not attributable to a department (optional)
+
+        Returns:
+            The document revision
+        """
+        return DocumentRevision(self, data, raw_rows, shared_rows)
+
+class DocumentRevision:
+    """
+    One version of a document being analyzed against a RevisionStore
+
+    Fingerprints are taken when the revision is created, before the analysis
+    updates the objectives. reused holds the stored entries of unchanged
+    departments; changed lists the departments that need a new analysis.
+    """
+
+    def __init__(self, store: RevisionStore, data: Dict[str, Any], raw_rows: Dict[str, List[Dict[str, Any]]] = None,
+                 shared_rows: List[Dict[str, Any]] = None):
+        self.store = store
+        self.fingerprints = department_fingerprints(data, raw_rows, shared_rows)
+        self._objective_fingerprints = {id(obj): objective_fingerprint(obj) for obj in data.get("control_objectives", [])}
+        self._gap_count = len(data.get("gaps", []))
+
+        self.reused = {}
+        for dept, fingerprint in self.fingerprints.items():
+            entry = store.get(fingerprint)
+            if entry is not None:
+                self.reused[dept] = entry
+        self.changed = [dept for dept in self.fingerprints if dept not in self.reused]
+
+        if self.reused:
+            logger.info(f"Reusing the analysis of {len(self.reused)} unchanged departments; "
+                        f"{len(self.changed)} departments changed")
+
+    def restore_objectives(self, dept: str, objectives: List[Dict[str, Any]]):
+        """Apply the stored gap details and proposed controls of an unchanged department to its objectives"""
+        updates = self.reused[dept].get("objectives", {})
+        for obj in objectives:
+            update = updates.get(self._objective_fingerprints.get(id(obj)) or objective_fingerprint(obj))
+            if update:
+                obj.update(update)
+
+    def recommendations(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Stored department recommendations of the unchanged departments"""
+        return {dept: entry.get("recommendations", []) for dept, entry in self.reused.items()}
+
+    def record(self, data: Dict[str, Any], failed_departments=()):
+        """
+        Store the analysis of the changed departments for later versions
+
+        Departments that failed, or whose analysis is incomplete, are not stored.
+
+        Args:
+            data: Analyzed data
+            failed_departments: Departments that used fallback results
+        """
+        department_risks = data.get("department_risks") or {}
+        new_gaps = data.get("gaps", [])[self._gap_count:]
+        recommendations = data.get("recommendations", [])
+        overall_recommendations = [rec for rec in recommendations if not rec.get("department")]
+
+        stored = 0
+        for dept in self.changed:
+            dept_risk = department_risks.get(dept)
+            if dept in failed_departments or not isinstance(dept_risk, dict) or "key_risks" not in dept_risk:
+                continue
+
+            objectives = {}
+            for obj in data.get("control_objectives", []):
+                fingerprint = self._objective_fingerprints.get(id(obj))
+                if fingerprint and obj.get("department") == dept:
+                    objectives[fingerprint] = {"gap_details": obj.get("gap_details", ""),
+                                               "proposed_control": obj.get("proposed_control", "")}
+
+            self.store.put(self.fingerprints[dept], {
+                "department": dept,
+                "department_risk": dept_risk,
+                "objectives": objectives,
+                "gaps": [gap for gap in new_gaps if gap.get("department") == dept],
+                "recommendations": [rec for rec in recommendations if rec.get("department") == dept],
+                "overall_recommendations": overall_recommendations
+            })
+            stored += 1
+
+        if stored:
+            logger.info(f"Stored the analysis of {stored} departments for later revisions")
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location of the per-call metrics
+TELEMETRY_PATH = os.path.join(os.getcwd(), "llm_telemetry", "calls.jsonl")
+
+# Call outcomes
+OUTCOME_OK = "ok"
+OUTCOME_PARTIAL = "partial"
+OUTCOME_PARSE_ERROR = "parse_error"
+OUTCOME_CALL_ERROR = "call_error"
+
+_current_run = contextvars.ContextVar("llm_telemetry_run", default=None)
+_current_call = contextvars.ContextVar("llm_telemetry_call", default=None)
+
+class LLMCall:
+    """
+    Metrics of one LLM call
+
+    The caller opens the call with Telemetry.call() and sets the parse outcome;
+    generate_content fills in sizes, tokens, latency and cache use.
+    """
+
+    def __init__(self, operation: str, department: str = None):
+        self.operation = operation
+        self.department = department
+        self.model = None
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.latency = 0.0
+        self.first_chunk_latency = None
+        self.cached = False
+        self.outcome = None
+        self.error = None
+        self._on_success = []
+
+    def on_success(self, callback: Callable[[], None]):
+        """
+        Run a callback if the call ends with OUTCOME_OK
+
+        Used to keep a response, e.g. in the response cache, only once the
+        caller has parsed it.
+
+        Args:
+            callback: Function called without arguments when the call block ends
+        """
+        self._on_success.append(callback)
+
+    def record_response(self, model_name: str, prompt: str, text: str, usage: Dict[str, int], latency: float,
+                        cached: bool = False, first_chunk_latency: float = None):
+        """
+        Record the request and response of the call
+
+        Args:
+            model_name: Name of the model called
+            prompt: Prompt text
+            text: Response text
+            usage: Dict with prompt_tokens and response_tokens
+            latency: Seconds until the full response arrived
+            cached: Whether the response came from the response cache
+            first_chunk_latency: Seconds until the first streamed piece arrived (optional)
+        """
+        self.model = model_name
+        self.prompt_chars = len(prompt)
+        self.response_chars = len(text or "")
+        self.prompt_tokens = usage.get("prompt_tokens", 0)
+        self.response_tokens = usage.get("response_tokens", 0)
+        self.latency = latency
+        self.first_chunk_latency = first_chunk_latency
+        self.cached = cached
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "department": self.department,
+            "model": self.model,
+            "prompt_chars": self.prompt_chars,
+            "response_chars": self.response_chars,
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "latency_s": round(self.latency, 4),
+            "first_chunk_s": round(self.first_chunk_latency, 4) if self.first_chunk_latency is not None else None,
+            "cached": self.cached,
+            "outcome": self.outcome,
+            "error": self.error
+        }
+
+class TelemetryRun:
+    """Calls made during one analysis run"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, call: LLMCall):
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate the run's calls by operation
+
+        Returns:
+            One row per operation with call, cache hit and failure counts, tokens and latency
+        """
+        rows = {}
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            row = rows.setdefault(call.operation, {
+                "operation": call.operation, "calls": 0, "cached": 0, "failed": 0,
+                "prompt_tokens": 0, "response_tokens": 0, "total_latency_s": 0.0, "max_latency_s": 0.0
+            })
+            row["calls"] += 1
+            row["cached"] += call.cached
+            row["failed"] += call.outcome != OUTCOME_OK
+            row["prompt_tokens"] += call.prompt_tokens
+            row["response_tokens"] += call.response_tokens
+            row["total_latency_s"] += call.latency
+            row["max_latency_s"] = max(row["max_latency_s"], call.latency)
+        return list(rows.values())
+
+    def format_summary(self) -> str:
+        """Format the summary as a text table"""
+        header = f"{'operation':<28} {'calls':>6} {'cached':>6} {'failed':>6} {'tokens in':>10} {'tokens out':>10} {'mean s':>7} {'max s':>7}"
+        lines = [f"LLM calls of {self.name} run {self.run_id} ({time.perf_counter() - self.started:.1f}s)", header, "-" * len(header)]
+        totals = {"calls": 0, "cached": 0, "failed": 0, "prompt_tokens": 0, "response_tokens": 0}
+        for row in self.summary():
+            lines.append(f"{row['operation']:<28} {row['calls']:>6} {row['cached']:>6} {row['failed']:>6} "
+                         f"{row['prompt_tokens']:>10,} {row['response_tokens']:>10,} "
+                         f"{row['total_latency_s'] / row['calls']:>7.2f} {row['max_latency_s']:>7.2f}")
+            for key in totals:
+                totals[key] += row[key]
+        lines.append(f"{'total':<28} {totals['calls']:>6} {totals['cached']:>6} {totals['failed']:>6} "
+                     f"{totals['prompt_tokens']:>10,} {totals['response_tokens']:>10,}")
+        return "\n".join(lines)
+
+class Telemetry:
+    """
+    Per-call LLM metrics written to an append-only JSONL file
+
+    Every call is one line with the run, operation and department, prompt and
+    response size, tokens, latency, cache use and parse outcome. Runs and calls
+    are tracked with context variables, so map_concurrently carries them into
+    worker threads.
+    """
+
+    def __init__(self, path: str = None, enabled: bool = True):
+        """
+        Args:
+            path: JSONL file the calls are appended to (defaults to TELEMETRY_PATH)
+            enabled: Whether calls are written to the file
+        """
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def run(self, name: str):
+        """
+        Collect the calls of an analysis run
+
+        Args:
+            name: Name of the run, e.g. the analyzed file
+
+        Yields:
+            The TelemetryRun
+        """
+        run = TelemetryRun(name)
+        token = _current_run.set(run)
+        try:
+            yield run
+        finally:
+            _current_run.reset(token)
+
+    @contextmanager
+    def call(self, operation: str, department: str = None):
+        """
+        Track one LLM call and the parsing of its response
+
+        An exception leaving the block marks the call as failed: a call error if
+        no response was recorded, a parse error otherwise. The caller may set
+        call.outcome (e.g. to OUTCOME_PARTIAL) before the block ends. Callbacks
+        registered with call.on_success() run only if the outcome is OUTCOME_OK.
+
+        Args:
+            operation: Name of the calling function
+            department: Department the call is about (optional)
+
+        Yields:
+            The LLMCall
+        """
+        call = LLMCall(operation, department)
+        token = _current_call.set(call)
+        try:
+            yield call
+        except Exception as e:
+            call.outcome = OUTCOME_PARSE_ERROR if call.model is not None else OUTCOME_CALL_ERROR
+            call.error = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            _current_call.reset(token)
+            if call.outcome is None:
+                call.outcome = OUTCOME_OK
+            if call.outcome == OUTCOME_OK:
+                for callback in call._on_success:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.warning(f"Success callback of LLM call {call.operation} failed: {str(e)}")
+            self._finish(call)
+
+    @staticmethod
+    def current_call() -> Optional[LLMCall]:
+        """The call being tracked on this thread, if any"""
+        return _current_call.get()
+
+    def _finish(self, call: LLMCall):
+        run = _current_run.get()
+        if run is not None:
+            run.add(call)
+        if not self.enabled:
+            return
+
+        record = {"ts": datetime.now(timezone.utc).isoformat(), "run_id": run.run_id if run is not None else None,
+                  "run": run.name if run is not None else None, **call.to_dict()}
+        path = self.path or TELEMETRY_PATH
+        try:
+            line = json.dumps(record, default=str) + "\n"
+            with self._lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except Exception as e:
+            logger.warning(f"Could not write LLM telemetry: {str(e)}")
+
+# Process-wide telemetry used by utils.gemini; LLM_TELEMETRY=0 stops writing the file
+telemetry = Telemetry(enabled=os.getenv("LLM_TELEMETRY", "1") != "0")